@@ -0,0 +1,201 @@
+"""
+Write-Behind Activity Buffer
+============================
+``GET /listings/{id}`` used to commit twice per view (``views_count += 1`` and a
+``UserActivity`` row).  On SQLite every commit is a WAL write that contends
+with all other writers, so a popular listing turned reads into a write storm.
+
+Views are now recorded in process memory and written behind:
+
+    view increments   aggregated per listing   → one executemany UPDATE
+    activity rows     appended to a list        → one executemany INSERT
+                      (and folded into user interest vectors, user_interest.py)
+
+A flush runs every ACTIVITY_FLUSH_INTERVAL_S seconds, as soon as
+ACTIVITY_FLUSH_SIZE events are pending, and on shutdown, each in a single
+transaction.  The buffer is bounded by ACTIVITY_BUFFER_MAX events; events
+beyond that are dropped and counted, as are events lost to a failed flush
+that no longer fit back into the buffer.  Worst case on a crash: one
+interval of views is lost.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, func, insert, update
+
+from . import models
+from .entity_cache import listing_details
+from .etags import VIEWS_GENERATION, bump_generations
+
+FLUSH_INTERVAL_S = float(os.getenv("ACTIVITY_FLUSH_INTERVAL_S", "2.0"))
+FLUSH_SIZE = int(os.getenv("ACTIVITY_FLUSH_SIZE", "500"))
+MAX_PENDING = int(os.getenv("ACTIVITY_BUFFER_MAX", "10000"))
+VIEW_WEIGHT = 1.0
+
+
+class ActivityBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views: Dict[int, int] = {}          # listing_id → pending increment
+        self._inflight: Dict[int, int] = {}       # increments taken by the running flush, not yet applied
+        self._activities: List[dict] = []
+        self._pending = 0                          # events currently buffered
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._flush_lock = threading.Lock()        # one flush at a time
+        self._start_lock = threading.Lock()
+        self._counters = {
+            "events_recorded": 0,
+            "events_dropped": 0,
+            "events_lost": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "views_flushed": 0,
+            "activities_flushed": 0,
+        }
+        self._last_flush_ms = 0.0
+
+    # ── Recording ───────────────────────────────────────────────────────────
+    def record_view(self, listing_id: int, user_id: Optional[int] = None, count_view: bool = True) -> bool:
+        """
+        Buffer one listing view: a ``views_count`` increment (``count_view``)
+        and, for signed-in users, a "view" activity.  Returns False when the
+        buffer is full and the event was dropped.
+        """
+        if not count_view and user_id is None:
+            return True
+        with self._lock:
+            if self._pending >= MAX_PENDING:
+                self._counters["events_dropped"] += 1
+                return False
+            if count_view:
+                self._views[listing_id] = self._views.get(listing_id, 0) + 1
+            if user_id is not None:
+                self._activities.append({
+                    "user_id": user_id,
+                    "listing_id": listing_id,
+                    "activity_type": "view",
+                    "weight": VIEW_WEIGHT,
+                    "created_at": datetime.utcnow(),
+                })
+            self._pending += 1
+            self._counters["events_recorded"] += 1
+            full = self._pending >= FLUSH_SIZE
+        self._ensure_started()
+        if full:
+            self._wakeup.set()
+        return True
+
+    def pending_views(self, listing_id: int) -> int:
+        """View increments for ``listing_id`` not yet written to the database (or the detail cache)."""
+        with self._lock:
+            return self._views.get(listing_id, 0) + self._inflight.get(listing_id, 0)
+
+    # ── Flushing ────────────────────────────────────────────────────────────
+    def flush(self) -> int:
+        """Write everything buffered in one transaction; returns the events written."""
+        with self._flush_lock:
+            with self._lock:
+                views, self._views = self._views, {}
+                self._inflight = views
+                activities, self._activities = self._activities, []
+                pending, self._pending = self._pending, 0
+            if not pending:
+                return 0
+
+            from .database import SessionLocal
+            from .user_interest import record_interests
+
+            started = time.perf_counter()
+            db = SessionLocal()
+            try:
+                if views:
+                    listings = models.Listing.__table__
+                    db.execute(
+                        update(listings)
+                        .where(listings.c.id == bindparam("lid"))
+                        .values(views_count=func.coalesce(listings.c.views_count, 0) + bindparam("n")),
+                        [{"lid": lid, "n": n} for lid, n in views.items()],
+                    )
+                    bump_generations(db, [VIEWS_GENERATION])
+                if activities:
+                    db.execute(insert(models.UserActivity), activities)
+                    record_interests(db, [
+                        (a["user_id"], a["listing_id"], a["weight"], a["created_at"]) for a in activities
+                    ])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"!!! Activity buffer flush failed ({pending} events): {e}", flush=True)
+                self._requeue(views, activities, pending)
+                return 0
+            finally:
+                db.close()
+
+            with self._lock:
+                # The cached base and pending_views move together, so no view is hidden or counted twice
+                listing_details.add_persisted_views(views)
+                self._inflight = {}
+                self._counters["flushes"] += 1
+                self._counters["views_flushed"] += sum(views.values())
+                self._counters["activities_flushed"] += len(activities)
+                self._last_flush_ms = round((time.perf_counter() - started) * 1000.0, 2)
+            return pending
+
+    def _requeue(self, views: Dict[int, int], activities: List[dict], pending: int) -> None:
+        with self._lock:
+            self._inflight = {}
+            self._counters["failed_flushes"] += 1
+            if self._pending + pending > MAX_PENDING:
+                self._counters["events_lost"] += pending
+                return
+            for lid, n in views.items():
+                self._views[lid] = self._views.get(lid, 0) + n
+            self._activities[:0] = activities
+            self._pending += pending
+
+    # ── Background flusher ──────────────────────────────────────────────────
+    def _ensure_started(self) -> None:
+        if self._thread is not None or self._stopped.is_set():
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="activity-buffer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(FLUSH_INTERVAL_S)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"!!! Activity buffer flusher error: {e}", flush=True)
+
+    def shutdown(self) -> None:
+        """Stop the flusher and write out whatever is still buffered."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                **self._counters,
+                "pending_events": self._pending,
+                "pending_view_listings": len(self._views),
+                "capacity": MAX_PENDING,
+                "last_flush_ms": self._last_flush_ms,
+            }
+
+
+activity_buffer = ActivityBuffer()
@@ -0,0 +1,185 @@
+"""
+Activity Rollup
+===============
+``user_activities`` gets one row per view, wishlist and purchase and is never
+trimmed.  This job folds raw rows older than ACTIVITY_ROLLUP_AFTER_DAYS into
+``user_listing_daily``:
+
+    (user_id, listing_id, activity_type, day)  →  events, Σ weight
+
+and deletes the raw rows it folded in.  Work is done in batches of
+ACTIVITY_ROLLUP_BATCH raw rows, walked by primary key; each batch upserts its
+aggregates and deletes its rows in one transaction, so an interrupted run
+never counts a row twice and can simply be started again.  Only whole days
+before the cutoff are compacted.
+
+Readers go through the helpers below, which combine both tables:
+
+    interaction_totals()       Σ weight per (user, listing)    ALS, co-occurrence
+    activity_events()          (user, listing, weight, time)   interest bootstrap, ALS evaluation
+    interacted_listing_ids()   listings a user has touched     recommendations
+
+An aggregate row stands in for its events as a single event at mid-day, so
+time-decayed readers (user_interest.py) decay it from that day — the same
+as decaying each raw row, to within a day.
+
+Usage
+-----
+python -m backend.activity_rollup
+python -m backend.activity_rollup --older-than-days 14 --batch-size 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+ROLLUP_AFTER_DAYS = int(os.getenv("ACTIVITY_ROLLUP_AFTER_DAYS", "30"))
+BATCH_SIZE = int(os.getenv("ACTIVITY_ROLLUP_BATCH", "5000"))
+DEFAULT_TYPE = "other"          # activity_type is part of the key, so it cannot be NULL
+_MIDDAY = dt_time(12, 0)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Readers: raw rows + daily aggregates
+# ─────────────────────────────────────────────────────────────────────────────
+def interaction_totals(db: Session) -> List[Tuple[int, int, float]]:
+    """(user_id, listing_id, Σ weight) over all activity, raw and compacted."""
+    raw, daily = models.UserActivity, models.UserListingDaily
+    combined = union_all(
+        select(raw.user_id, raw.listing_id, raw.weight)
+        .where(raw.user_id.isnot(None), raw.listing_id.isnot(None)),
+        select(daily.user_id, daily.listing_id, daily.weight),
+    ).subquery()
+    return db.execute(
+        select(combined.c.user_id, combined.c.listing_id, func.sum(combined.c.weight))
+        .group_by(combined.c.user_id, combined.c.listing_id)
+    ).all()
+
+
+def activity_events(db: Session, user_id: Optional[int] = None) -> List[Tuple[int, int, float, datetime]]:
+    """
+    (user_id, listing_id, weight, created_at) oldest first, for one user or
+    everyone.  Each daily aggregate is one event dated mid-day.
+    """
+    raw, daily = models.UserActivity, models.UserListingDaily
+    raw_q = select(raw.user_id, raw.listing_id, raw.weight, raw.created_at).where(
+        raw.user_id.isnot(None), raw.listing_id.isnot(None)
+    )
+    daily_q = select(daily.user_id, daily.listing_id, daily.weight, daily.day)
+    if user_id is not None:
+        raw_q = raw_q.where(raw.user_id == user_id)
+        daily_q = daily_q.where(daily.user_id == user_id)
+
+    events = [
+        (u, l, w or 0.0, datetime.combine(day, _MIDDAY)) for u, l, w, day in db.execute(daily_q)
+    ]
+    events.extend((u, l, w or 0.0, at) for u, l, w, at in db.execute(raw_q))
+    events.sort(key=lambda e: e[3] or datetime.min)
+    return events
+
+
+def interacted_listing_ids(db: Session, user_id: int) -> Set[int]:
+    raw, daily = models.UserActivity, models.UserListingDaily
+    ids = union_all(
+        select(raw.listing_id).where(raw.user_id == user_id, raw.listing_id.isnot(None)),
+        select(daily.listing_id).where(daily.user_id == user_id),
+    )
+    return {row[0] for row in db.execute(ids)}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Compaction
+# ─────────────────────────────────────────────────────────────────────────────
+def compact(db: Session, older_than_days: int = ROLLUP_AFTER_DAYS, batch_size: int = BATCH_SIZE,
+            now: Optional[datetime] = None) -> Dict[str, float]:
+    """Fold raw activity from before the cutoff day into ``user_listing_daily``."""
+    started = time.perf_counter()
+    cutoff = datetime.combine((now or datetime.utcnow()).date() - timedelta(days=older_than_days), dt_time.min)
+    raw = models.UserActivity
+    daily = models.UserListingDaily.__table__
+    eligible = (raw.created_at < cutoff, raw.user_id.isnot(None), raw.listing_id.isnot(None))
+
+    upsert = sqlite_insert(daily)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[daily.c.user_id, daily.c.listing_id, daily.c.activity_type, daily.c.day],
+        set_={
+            "events": daily.c.events + upsert.excluded.events,
+            "weight": daily.c.weight + upsert.excluded.weight,
+        },
+    )
+
+    stats: Dict[str, float] = {"cutoff": cutoff.isoformat(), "batches": 0, "rows_compacted": 0, "aggregates_written": 0}
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(raw.id, raw.user_id, raw.listing_id, raw.activity_type, raw.weight, raw.created_at)
+            .where(raw.id > last_id, *eligible)
+            .order_by(raw.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        buckets: Dict[Tuple[int, int, str, object], List[float]] = {}
+        for _, user_id, listing_id, activity_type, weight, created_at in rows:
+            key = (user_id, listing_id, activity_type or DEFAULT_TYPE, created_at.date())
+            bucket = buckets.setdefault(key, [0, 0.0])
+            bucket[0] += 1
+            bucket[1] += weight or 0.0
+
+        try:
+            db.execute(upsert, [
+                {"user_id": u, "listing_id": l, "activity_type": t, "day": d, "events": n, "weight": w}
+                for (u, l, t, d), (n, w) in buckets.items()
+            ])
+            db.execute(
+                delete(raw)
+                .where(raw.id > last_id, raw.id <= rows[-1].id, *eligible)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        last_id = rows[-1].id
+        stats["batches"] += 1
+        stats["rows_compacted"] += len(rows)
+        stats["aggregates_written"] += len(buckets)
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compact old user activity into daily aggregates.")
+    parser.add_argument("--older-than-days", type=int, default=ROLLUP_AFTER_DAYS,
+                        help="compact raw rows from before this many days ago")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="raw rows per transaction")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal, engine, Base
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        stats = compact(db, args.older_than_days, args.batch_size)
+        print(f"ACTIVITY ROLLUP: {stats}", flush=True)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
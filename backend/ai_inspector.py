@@ -11,6 +11,7 @@ from typing import Any
 from sqlalchemy.orm import Session
 from .database import SessionLocal
 from . import models
+from .entity_cache import listing_details
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -116,6 +117,7 @@ class AIInspector:
                 "timestamp": time.time()
             })
             db.commit()
+            listing_details.invalidate([image_record.listing_id])
             print(f"[AI-AUDIT] ✅ FINAL SCORE: {final_score}/10\n", flush=True)
 
         except Exception as e:
@@ -131,5 +133,6 @@ class AIInspector:
             record.quality_score = 7.0
             record.ai_feedback = json.dumps({"status": f"Pending: {msg}"})
             db.commit()
+            listing_details.invalidate([record.listing_id])
         except:
             pass
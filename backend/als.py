@@ -0,0 +1,337 @@
+"""
+Implicit-Feedback ALS (Collaborative Filtering)
+===============================================
+Matrix factorisation of ``user_activities`` after Hu, Koren & Volinsky,
+"Collaborative Filtering for Implicit Feedback Datasets":
+
+    p_ui = 1                          every (user, listing) pair with activity
+    c_ui = 1 + ALPHA · Σ weight       confidence from the activity weights
+
+    x_u = (YᵀY + Yᵀ(C_u − I)Y + λI)⁻¹ Yᵀ C_u p_u      (and symmetrically for y_i)
+
+Each half-step runs a few conjugate-gradient steps per row (Takács, Pilászy
+& Tikk, "Applications of the Conjugate Gradient Method for Implicit
+Feedback Collaborative Filtering"), vectorised across all rows: interactions
+are sorted by row and the sparse part of A·p is summed per row with
+``reduceat`` in chunks of _CHUNK interactions, so memory stays bounded and no
+f × f matrix per user is built.
+
+The trained factors are written to ALS_MODEL_PATH (.npz) and blended into
+``get_user_profile_recommendations()`` next to the content vector.
+
+Usage
+-----
+python -m backend.als train --factors 32 --iterations 10
+python -m backend.als bench --interactions 1000000
+python -m backend.als eval --k 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .activity_rollup import activity_events, interaction_totals
+
+MODEL_PATH = os.getenv("ALS_MODEL_PATH", "./als_model.npz")
+FACTORS = 32
+ITERATIONS = 10
+REGULARIZATION = 0.1
+CG_STEPS = 3
+ALPHA = float(os.getenv("ALS_ALPHA", "1.0"))
+BLEND = float(os.getenv("ALS_BLEND", "0.3"))   # share of the CF score in personalised ranking
+_CHUNK = 65536                                 # interactions per vectorised chunk
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Training
+# ─────────────────────────────────────────────────────────────────────────────
+def _accumulate(rows: np.ndarray, values: np.ndarray, out: np.ndarray, start: int, end: int) -> None:
+    """out[rows[k]] += values[k - start] for the sorted chunk rows[start:end]."""
+    uniq, first = np.unique(rows[start:end], return_index=True)
+    out[uniq] += np.add.reduceat(values, first, axis=0)
+
+
+def _solve_side(rows: np.ndarray, cols: np.ndarray, conf: np.ndarray, other: np.ndarray,
+                current: np.ndarray, reg: float, cg_steps: int) -> np.ndarray:
+    """
+    One ALS half-step: update every row factor given the fixed factors
+    ``other`` of the opposite side.  ``rows`` must be sorted.  The normal
+    equations are solved with ``cg_steps`` conjugate-gradient steps, warm
+    started from ``current`` and vectorised across all rows; A·p is applied
+    implicitly, so no f × f matrix per row is ever built.
+    """
+    f = other.shape[1]
+    gram = other.T @ other + reg * np.eye(f, dtype=other.dtype)
+
+    def apply_a(P: np.ndarray) -> np.ndarray:
+        # (YᵀY + λI)p + Σ_i (c_i − 1)(y_i · p) y_i
+        out = P @ gram
+        for start in range(0, len(rows), _CHUNK):
+            end = min(start + _CHUNK, len(rows))
+            y = other[cols[start:end]]
+            d = (conf[start:end] - 1.0) * np.einsum("ij,ij->i", y, P[rows[start:end]])
+            _accumulate(rows, d[:, None] * y, out, start, end)
+        return out
+
+    b = np.zeros_like(current)
+    for start in range(0, len(rows), _CHUNK):
+        end = min(start + _CHUNK, len(rows))
+        _accumulate(rows, conf[start:end, None] * other[cols[start:end]], b, start, end)
+
+    X = current.copy()
+    r = b - apply_a(X)
+    p = r.copy()
+    rs_old = np.einsum("ij,ij->i", r, r)
+    for _ in range(cg_steps):
+        Ap = apply_a(p)
+        denom = np.einsum("ij,ij->i", p, Ap)
+        step = np.divide(rs_old, denom, out=np.zeros_like(rs_old), where=denom > 1e-12)
+        X += step[:, None] * p
+        r -= step[:, None] * Ap
+        rs_new = np.einsum("ij,ij->i", r, r)
+        beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 1e-12)
+        p = r + beta[:, None] * p
+        rs_old = rs_new
+    return X
+
+
+def train(user_idx: np.ndarray, item_idx: np.ndarray, weights: np.ndarray, n_users: int, n_items: int,
+          factors: int = FACTORS, iterations: int = ITERATIONS, reg: float = REGULARIZATION,
+          alpha: float = ALPHA, cg_steps: int = CG_STEPS, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Factorise the (user, item, weight) triples; returns (user factors, item factors)."""
+    rng = np.random.default_rng(seed)
+    X = (rng.standard_normal((n_users, factors)) * 0.01).astype(np.float32)
+    Y = (rng.standard_normal((n_items, factors)) * 0.01).astype(np.float32)
+    conf = (1.0 + alpha * weights).astype(np.float32)
+    by_user = np.argsort(user_idx, kind="stable")
+    by_item = np.argsort(item_idx, kind="stable")
+    u_rows, u_cols, u_conf = user_idx[by_user], item_idx[by_user], conf[by_user]
+    i_rows, i_cols, i_conf = item_idx[by_item], user_idx[by_item], conf[by_item]
+    for _ in range(iterations):
+        X = _solve_side(u_rows, u_cols, u_conf, Y, X, reg, cg_steps)
+        Y = _solve_side(i_rows, i_cols, i_conf, X, Y, reg, cg_steps)
+    return X, Y
+
+
+def load_interactions(db: Session):
+    """Aggregated (user_id, listing_id, Σ weight) rows, raw and compacted activity."""
+    return interaction_totals(db)
+
+
+def _index(rows) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    user_ids, user_idx = np.unique(np.array([r[0] for r in rows], dtype=np.int64), return_inverse=True)
+    item_ids, item_idx = np.unique(np.array([r[1] for r in rows], dtype=np.int64), return_inverse=True)
+    weights = np.array([max(r[2] or 0.0, 0.0) for r in rows], dtype=np.float32)
+    return user_ids, item_ids, user_idx, item_idx, weights
+
+
+def train_from_db(db: Session, path: str = MODEL_PATH, factors: int = FACTORS,
+                  iterations: int = ITERATIONS, reg: float = REGULARIZATION, alpha: float = ALPHA) -> Dict:
+    started = time.perf_counter()
+    rows = load_interactions(db)
+    if not rows:
+        print("ALS: No interactions to train on", flush=True)
+        return {"interactions": 0}
+    user_ids, item_ids, user_idx, item_idx, weights = _index(rows)
+    X, Y = train(user_idx, item_idx, weights, len(user_ids), len(item_ids), factors, iterations, reg, alpha)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, user_ids=user_ids, item_ids=item_ids, user_factors=X, item_factors=Y,
+             trained_at=np.array(datetime.utcnow().isoformat()))
+    os.replace(tmp, path)
+    stats = {"interactions": len(rows), "users": len(user_ids), "items": len(item_ids),
+             "factors": factors, "seconds": round(time.perf_counter() - started, 3)}
+    print(f"ALS: Trained {stats} -> {path}", flush=True)
+    return stats
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Serving
+# ─────────────────────────────────────────────────────────────────────────────
+class _Model:
+    def __init__(self, data):
+        self.user_index = {int(u): i for i, u in enumerate(data["user_ids"])}
+        self.item_index = {int(l): i for i, l in enumerate(data["item_ids"])}
+        self.user_factors = data["user_factors"]
+        self.item_factors = data["item_factors"]
+
+
+_model: Optional[_Model] = None
+_model_mtime: Optional[float] = None
+_model_lock = threading.Lock()
+
+
+def _get_model() -> Optional[_Model]:
+    """Factors from MODEL_PATH, reloaded when the file changes; None if untrained."""
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(MODEL_PATH)
+    except OSError:
+        return None
+    if mtime != _model_mtime:
+        with _model_lock:
+            if mtime != _model_mtime:
+                with np.load(MODEL_PATH) as data:
+                    _model = _Model(data)
+                _model_mtime = mtime
+    return _model
+
+
+def score_listings(user_id: int, listing_ids: np.ndarray) -> Optional[np.ndarray]:
+    """CF scores for ``listing_ids`` (0 for listings unknown to the model), or None for unknown users."""
+    model = _get_model()
+    if model is None or user_id not in model.user_index:
+        return None
+    rows = np.array([model.item_index.get(int(l), -1) for l in listing_ids], dtype=np.int64)
+    known = rows >= 0
+    scores = np.zeros(len(listing_ids), dtype=np.float32)
+    scores[known] = model.item_factors[rows[known]] @ model.user_factors[model.user_index[user_id]]
+    return scores
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Benchmark & evaluation
+# ─────────────────────────────────────────────────────────────────────────────
+def benchmark(interactions: int, users: int, items: int, factors: int = FACTORS,
+              iterations: int = ITERATIONS) -> Dict:
+    """Train on synthetic power-law data; wall time and peak traced memory per 1M interactions."""
+    rng = np.random.default_rng(42)
+    user_idx = rng.integers(0, users, interactions)
+    item_idx = np.minimum(rng.zipf(1.3, interactions) - 1, items - 1)
+    weights = rng.choice(np.array([1.0, 5.0, 15.0], dtype=np.float32), interactions, p=[0.85, 0.12, 0.03])
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    train(user_idx, item_idx, weights, users, items, factors, iterations)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_million = 1_000_000 / interactions
+    return {
+        "interactions": interactions, "users": users, "items": items,
+        "factors": factors, "iterations": iterations,
+        "seconds": round(elapsed, 3),
+        "seconds_per_1M": round(elapsed * per_million, 3),
+        "peak_mb": round(peak / 2**20, 1),
+        "peak_mb_per_1M": round(peak / 2**20 * per_million, 1),
+    }
+
+
+def evaluate(db: Session, k: int = 10, factors: int = FACTORS, iterations: int = ITERATIONS,
+             reg: float = REGULARIZATION, alpha: float = ALPHA) -> Dict:
+    """
+    Leave-one-out hit-rate@k: each user's most recent listing is held out, the
+    model is trained on the rest, and a hit is counted when the held-out
+    listing ranks in the user's top-k among listings they have not touched.
+    A popularity baseline is reported alongside.
+    """
+    acts = activity_events(db)
+    latest: Dict[int, int] = {}
+    for user_id, listing_id, _, _ in acts:
+        latest[user_id] = listing_id
+
+    totals: Dict[Tuple[int, int], float] = {}
+    for user_id, listing_id, weight, _ in acts:
+        totals[(user_id, listing_id)] = totals.get((user_id, listing_id), 0.0) + (weight or 0.0)
+    per_user: Dict[int, int] = {}
+    for user_id, _ in totals:
+        per_user[user_id] = per_user.get(user_id, 0) + 1
+
+    held_out = {u: l for u, l in latest.items() if per_user.get(u, 0) >= 2}
+    train_rows = [(u, l, w) for (u, l), w in totals.items() if held_out.get(u) != l]
+    if not held_out or not train_rows:
+        return {"users_evaluated": 0}
+
+    user_ids, item_ids, user_idx, item_idx, weights = _index(train_rows)
+    X, Y = train(user_idx, item_idx, weights, len(user_ids), len(item_ids), factors, iterations, reg, alpha)
+    u_pos = {int(u): i for i, u in enumerate(user_ids)}
+    i_pos = {int(l): i for i, l in enumerate(item_ids)}
+    popularity = np.bincount(item_idx, weights=weights, minlength=len(item_ids))
+
+    seen: Dict[int, set] = {}
+    for u, l, _ in train_rows:
+        seen.setdefault(u, set()).add(i_pos[l])
+
+    hits = pop_hits = evaluated = 0
+    for user_id, listing_id in held_out.items():
+        if user_id not in u_pos or listing_id not in i_pos:
+            evaluated += 1          # cold item: counts as a miss for both
+            continue
+        excluded = list(seen.get(user_id, ()))
+        for scores, counter in ((Y @ X[u_pos[user_id]], "cf"), (popularity.astype(np.float32), "pop")):
+            scores = scores.copy()
+            scores[excluded] = -np.inf
+            top = np.argsort(-scores)[:k]
+            if i_pos[listing_id] in top:
+                if counter == "cf":
+                    hits += 1
+                else:
+                    pop_hits += 1
+        evaluated += 1
+
+    return {
+        "users_evaluated": evaluated,
+        "k": k,
+        "hit_rate": round(hits / evaluated, 4),
+        "popularity_hit_rate": round(pop_hits / evaluated, 4),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Implicit ALS recommender.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def model_args(p):
+        p.add_argument("--factors", type=int, default=FACTORS)
+        p.add_argument("--iterations", type=int, default=ITERATIONS)
+
+    p_train = sub.add_parser("train", help="train on user_activities and save the factors")
+    model_args(p_train)
+    p_train.add_argument("--reg", type=float, default=REGULARIZATION)
+    p_train.add_argument("--alpha", type=float, default=ALPHA)
+    p_train.add_argument("--out", default=MODEL_PATH)
+
+    p_bench = sub.add_parser("bench", help="training benchmark on synthetic data")
+    model_args(p_bench)
+    p_bench.add_argument("--interactions", type=int, default=1_000_000)
+    p_bench.add_argument("--users", type=int, default=100_000)
+    p_bench.add_argument("--items", type=int, default=50_000)
+
+    p_eval = sub.add_parser("eval", help="leave-one-out hit-rate@k on user_activities")
+    model_args(p_eval)
+    p_eval.add_argument("--k", type=int, default=10)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        report = benchmark(args.interactions, args.users, args.items, args.factors, args.iterations)
+        print(json.dumps(report, indent=2))
+        return 0
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if args.command == "train":
+            report = train_from_db(db, args.out, args.factors, args.iterations, args.reg, args.alpha)
+        else:
+            report = evaluate(db, args.k, args.factors, args.iterations)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
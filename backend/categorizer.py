@@ -0,0 +1,238 @@
+"""
+Listing Categorizer
+===================
+Category browsing (``GET /listings?category=...``) used to OR the declared
+category with ``title ILIKE '%kw%'`` / ``description ILIKE '%kw%'`` for every
+keyword of the category — a scan of every description on every request.
+Membership is now decided when a listing is written and stored in
+``listing_categories`` (indexed by category), so browsing is an index lookup:
+
+    declared   the listing's own ``category`` value
+    keyword    a CATEGORY_KEYWORDS keyword occurs in the title or description
+               (same case-insensitive substring rule as the old ILIKE filter)
+    centroid   optional (CATEGORY_CENTROIDS=1): the listing's embedding is
+               nearest to a category's centroid — the mean embedding of the
+               listings declared in it — with cosine ≥ CATEGORY_CENTROID_MIN_SIM
+
+A listing can belong to several categories.  Existing listings are
+classified by the backfill command, which should be run once after upgrading
+and again whenever CATEGORY_KEYWORDS changes; ``/migrate`` classifies any
+listing that has no membership rows yet.  Until then such a listing is still
+browsable under its declared category (see ``in_category``).
+
+Usage
+-----
+python -m backend.categorizer
+python -m backend.categorizer --centroids --batch-size 200
+python -m backend.categorizer --missing-only
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, exists, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Category to Keyword mapping for smarter filtering
+CATEGORY_KEYWORDS = {
+    "Electronics & Technology": ["mobile", "phone", "computer", "laptop", "camera", "accessory", "tech", "electronic", "gadget", "tablet", "watch"],
+    "Fashion & Apparel": ["clothing", "shoes", "accessory", "shirt", "pant", "dress", "watch", "bag", "wear"],
+    "Health, Personal Care": ["fitness", "equipment", "health", "care", "supplement", "gym", "workout"],
+    "Home, Kitchen & Furniture": ["home", "decor", "appliance", "furniture", "kitchen", "table", "chair", "sofa", "bed"],
+    "Sports & Outdoors": ["sport", "outdoor", "equipment", "gear", "athletic", "ball", "cycle", "hiking"],
+    "Books & Media": ["book", "ebook", "media", "entertainment", "novel", "magazine"],
+    "Toys & Games": ["toy", "game", "educational", "board", "puzzle", "lego", "doll"]
+}
+
+USE_CENTROIDS = os.getenv("CATEGORY_CENTROIDS", "0") == "1"
+CENTROID_MIN_SIM = float(os.getenv("CATEGORY_CENTROID_MIN_SIM", "0.45"))
+CENTROID_MIN_MEMBERS = 5
+CENTROID_TTL_S = 3600.0
+
+Membership = Dict[str, Tuple[str, float]]   # category → (source, score)
+
+_centroid_lock = threading.Lock()
+_centroids: Optional[Tuple[List[str], np.ndarray, float]] = None   # (names, matrix, built_at)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Rules
+# ─────────────────────────────────────────────────────────────────────────────
+def keyword_categories(title: str, description: str) -> Dict[str, int]:
+    """Category → number of its keywords found in the title or description."""
+    title, description = (title or "").lower(), (description or "").lower()
+    hits = {}
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        n = sum(1 for kw in keywords if kw in title or kw in description)
+        if n:
+            hits[category] = n
+    return hits
+
+
+def build_centroids(db: Session) -> Tuple[List[str], np.ndarray]:
+    """Unit-norm mean embedding of the listings declared in each known category."""
+    from .search_engine import catalogue_matrix
+
+    ids, emb = catalogue_matrix(db)
+    if len(ids) == 0:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    declared = dict(
+        db.query(models.Listing.id, models.Listing.category)
+        .filter(models.Listing.category.in_(list(CATEGORY_KEYWORDS)))
+    )
+    names, rows = [], []
+    for category in CATEGORY_KEYWORDS:
+        mask = np.array([declared.get(int(i)) == category for i in ids], dtype=bool)
+        if mask.sum() < CENTROID_MIN_MEMBERS:
+            continue
+        centroid = emb[mask].mean(axis=0)
+        norm = float(np.linalg.norm(centroid))
+        if norm > 0:
+            names.append(category)
+            rows.append(centroid / norm)
+    matrix = np.stack(rows).astype(np.float32) if rows else np.zeros((0, emb.shape[1]), dtype=np.float32)
+    return names, matrix
+
+
+def _get_centroids(db: Session) -> Tuple[List[str], np.ndarray]:
+    global _centroids
+    with _centroid_lock:
+        if _centroids is not None and time.monotonic() - _centroids[2] < CENTROID_TTL_S:
+            return _centroids[0], _centroids[1]
+    names, matrix = build_centroids(db)
+    with _centroid_lock:
+        _centroids = (names, matrix, time.monotonic())
+    return names, matrix
+
+
+def nearest_centroid(embedding: np.ndarray, names: List[str], matrix: np.ndarray) -> Optional[Tuple[str, float]]:
+    if not names or embedding is None or not np.any(embedding) or matrix.shape[1] != embedding.shape[0]:
+        return None
+    sims = matrix @ embedding
+    best = int(np.argmax(sims))
+    return (names[best], float(sims[best])) if sims[best] >= CENTROID_MIN_SIM else None
+
+
+def classify(listing: models.Listing, centroid_match: Optional[Tuple[str, float]] = None) -> Membership:
+    """Categories ``listing`` belongs to; declared beats keyword beats centroid."""
+    membership: Membership = {}
+    if centroid_match is not None:
+        membership[centroid_match[0]] = ("centroid", round(centroid_match[1], 4))
+    for category, hits in keyword_categories(listing.title, listing.description).items():
+        membership[category] = ("keyword", float(hits))
+    if listing.category:
+        membership[listing.category] = ("declared", 1.0)
+    return membership
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Persistence
+# ─────────────────────────────────────────────────────────────────────────────
+def _set_membership(listing: models.Listing, membership: Membership) -> None:
+    listing.category_links = [
+        models.ListingCategory(listing_id=listing.id, category=category, source=source, score=score)
+        for category, (source, score) in membership.items()
+    ]
+
+
+def assign_categories(db: Session, listing: models.Listing, use_centroids: bool = USE_CENTROIDS) -> Membership:
+    """Recompute and store the categories of one listing (create/update hook)."""
+    match = None
+    if use_centroids:
+        from .search_engine import listing_embeddings
+        names, matrix = _get_centroids(db)
+        match = nearest_centroid(listing_embeddings(db, [listing.id]).get(listing.id), names, matrix)
+    membership = classify(listing, match)
+    _set_membership(listing, membership)
+    db.commit()
+    return membership
+
+
+def in_category(category: str):
+    """Browse filter: a membership row, or the declared category if not classified yet."""
+    unclassified = ~exists().where(models.ListingCategory.listing_id == models.Listing.id)
+    return or_(
+        models.Listing.id.in_(
+            select(models.ListingCategory.listing_id).where(models.ListingCategory.category == category)
+        ),
+        and_(models.Listing.category == category, unclassified),
+    )
+
+
+def backfill(db: Session, use_centroids: bool = False, batch_size: int = 500,
+             missing_only: bool = False) -> Dict[str, float]:
+    """Classify every listing (or only those without membership rows), ``batch_size`` per transaction."""
+    global _centroids
+    started = time.perf_counter()
+    names, matrix = [], None
+    if use_centroids:
+        names, matrix = build_centroids(db)
+        with _centroid_lock:
+            _centroids = (names, matrix, time.monotonic())
+
+    stats: Dict[str, float] = {"listings": 0, "memberships": 0, "declared": 0, "keyword": 0, "centroid": 0,
+                               "centroids": len(names)}
+    last_id = 0
+    while True:
+        query = db.query(models.Listing).filter(models.Listing.id > last_id)
+        if missing_only:
+            query = query.filter(~exists().where(models.ListingCategory.listing_id == models.Listing.id))
+        batch = (
+            query
+            .order_by(models.Listing.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        embs = {}
+        if names:
+            from .search_engine import listing_embeddings
+            embs = listing_embeddings(db, [l.id for l in batch])
+        for listing in batch:
+            membership = classify(listing, nearest_centroid(embs.get(listing.id), names, matrix) if names else None)
+            _set_membership(listing, membership)
+            stats["memberships"] += len(membership)
+            for source, _ in membership.values():
+                stats[source] += 1
+        last_id = batch[-1].id
+        stats["listings"] += len(batch)
+        db.commit()
+        db.expunge_all()
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Classify listings into browse categories.")
+    parser.add_argument("--centroids", action="store_true", default=USE_CENTROIDS,
+                        help="also assign the nearest category centroid (needs listing embeddings)")
+    parser.add_argument("--batch-size", type=int, default=500, help="listings per transaction")
+    parser.add_argument("--missing-only", action="store_true",
+                        help="only classify listings that have no membership rows")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal, engine, Base
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        stats = backfill(db, args.centroids, args.batch_size, args.missing_only)
+        print(f"CATEGORIES: Backfilled {stats}", flush=True)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
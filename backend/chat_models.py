@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy import event, text, update, Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy.orm import Session, attributes, relationship, backref
 from datetime import datetime, timezone
 
 from .database import Base
@@ -15,6 +15,9 @@ class Conversation(Base):
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
+    # Bumped whenever the conversation or one of its messages changes (see _bump_conversation_versions)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
     listing = relationship("Listing", backref=backref("conversations", cascade="all, delete-orphan"))
     buyer = relationship("User", foreign_keys=[buyer_id], backref="buyer_conversations")
     seller = relationship("User", foreign_keys=[seller_id], backref="seller_conversations")
@@ -22,11 +25,17 @@ class Conversation(Base):
 
     __table_args__ = (
         Index("ix_conversation_buyer_seller_listing", "buyer_id", "seller_id", "listing_id", unique=True),
+        Index("ix_conversations_seller_id", "seller_id"),
     )
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+        # Unread counts and mark-as-read only ever look at unread rows
+        Index("ix_messages_unread", "conversation_id", "sender_id", sqlite_where=text("is_read = 0")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False, index=True)
@@ -44,3 +53,32 @@ class Message(Base):
 
     conversation = relationship("Conversation", back_populates="messages")
     sender = relationship("User", foreign_keys=[sender_id])
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_conversation_versions(session, flush_context, instances):
+    bumped, conversation_ids = set(), set()
+    for obj in session.dirty:
+        if isinstance(obj, Conversation) and session.is_modified(obj):
+            if not attributes.get_history(obj, "version").has_changes():
+                obj.version = Conversation.version + 1   # in the UPDATE itself
+            bumped.add(obj.id)
+        elif isinstance(obj, Message) and session.is_modified(obj):
+            conversation_ids.add(obj.conversation_id)
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Message):
+            conversation_ids.add(obj.conversation_id)
+
+    conversation_ids = {i for i in conversation_ids if i is not None} - bumped
+    if conversation_ids:
+        bump_conversation_versions(session, conversation_ids)
+
+
+def bump_conversation_versions(session, conversation_ids) -> None:
+    """Core counterpart of the flush hook, for bulk message updates (e.g. mark-as-read)."""
+    conversations = Conversation.__table__
+    session.execute(
+        update(conversations)
+        .where(conversations.c.id.in_(list(conversation_ids)))
+        .values(version=conversations.c.version + 1)
+    )
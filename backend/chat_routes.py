@@ -3,14 +3,14 @@ import json
 from datetime import datetime, timezone
 from typing import Dict, Set
 
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, status, Query
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, status, Query, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, and_, func, desc
 
 from .database import get_db
 from .auth import get_current_user, SECRET_KEY, ALGORITHM
-from . import models
-from .chat_models import Conversation, Message
+from . import etags, models
+from .chat_models import Conversation, Message, bump_conversation_versions
 from .chat_schemas import (
     ConversationCreate,
     ConversationOut,
@@ -68,6 +68,14 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
+# ─── Helper: versions for bulk message updates ───
+
+def _bump_after_bulk_update(db: Session, conversation_ids) -> None:
+    """Query.update() skips the flush hooks; keep conversation versions and ETags in step."""
+    bump_conversation_versions(db, conversation_ids)
+    etags.bump_generations(db, ["messages", "conversations"])
+
+
 # ─── Helper: authenticate WebSocket via token query param ───
 
 def ws_authenticate(token: str, db: Session) -> models.User:
@@ -95,12 +103,18 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query("")):
     await manager.connect(websocket, user.id)
     
     # Upon connection, mark any messages sent to this user in any conversation as delivered
-    db.query(Message).filter(
+    delivered = db.query(Message).filter(
         Message.is_delivered == False,
         Message.sender_id != user.id
     ).join(Conversation).filter(
         (Conversation.buyer_id == user.id) | (Conversation.seller_id == user.id)
     ).update({"is_delivered": True})
+    if delivered:
+        _bump_after_bulk_update(db, [
+            cid for (cid,) in db.query(Conversation.id).filter(
+                (Conversation.buyer_id == user.id) | (Conversation.seller_id == user.id)
+            )
+        ])
     db.commit()
 
     # Notify partners that their messages were delivered
@@ -182,11 +196,13 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query("")):
                 conv_id = data.get("conversation_id")
                 conv = db.query(Conversation).filter(Conversation.id == conv_id).first()
                 if conv and (user.id == conv.buyer_id or user.id == conv.seller_id):
-                    db.query(Message).filter(
+                    marked = db.query(Message).filter(
                         Message.conversation_id == conv_id,
                         Message.sender_id != user.id,
                         Message.is_read == False,
                     ).update({"is_read": True, "is_delivered": True})
+                    if marked:
+                        _bump_after_bulk_update(db, [conv_id])
                     db.commit()
                     other_id = conv.seller_id if user.id == conv.buyer_id else conv.buyer_id
                     status_update = {"type": "messages_read", "conversation_id": conv_id, "reader_id": user.id}
@@ -267,6 +283,8 @@ def list_conversations(
 @router.get("/convo/{conversation_id}", response_model=list[MessageOut])
 def get_conversation_messages(
     conversation_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
@@ -277,16 +295,28 @@ def get_conversation_messages(
     if current_user.id not in (conv.buyer_id, conv.seller_id):
         raise HTTPException(status_code=403, detail="Access denied")
 
-    messages = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at).all()
-    
+    # Unchanged since the client's copy: nothing new to read or mark
+    etag = etags.strong("conversation", conv.id, conv.version)
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+
     # Mark as read
-    db.query(Message).filter(
+    marked = db.query(Message).filter(
         Message.conversation_id == conversation_id,
         Message.sender_id != current_user.id,
         Message.is_read == False,
     ).update({"is_read": True})
+    if marked:
+        _bump_after_bulk_update(db, [conversation_id])
     db.commit()
+    if marked:
+        # The body shows the messages as read: tag it with the version the marking produced
+        etag = etags.strong("conversation", conv.id, conv.version)
+
+    # Loaded after the commit, which would otherwise expire (and reload) every message
+    messages = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at).all()
     
+    response.headers.update(etags.headers(etag))
     return messages
 
 
@@ -0,0 +1,194 @@
+"""
+Item-Item Co-occurrence ("Frequently Bought Together")
+=====================================================
+Offline model behind ``get_frequently_brought_together()``.
+
+Every user is one basket.  A listing's weight in the basket is the sum of the
+user's activity weights on it (view 1, wishlist 5, purchase 15, ...), at least
+ORDER_WEIGHT when it appears in one of the user's orders, capped at
+WEIGHT_CAP so a single obsessive viewer cannot dominate:
+
+    C(i, j) = Σ_users min(w_ui, w_uj)        pair co-occurrence
+    C(i)    = Σ_users w_ui                   item mass
+    N       = Σ_i C(i)
+
+    lift(i, j)  = C(i, j) · N / (C(i) · C(j))
+    score(i, j) = log(lift) · C(i, j) / (C(i, j) + SHRINK)
+
+The log-lift is a PMI; the shrink factor damps pairs seen only once or twice.
+The top-N positive-score neighbours of each listing are stored in
+``listing_neighbors`` (kind="fbt"), so the endpoint is a single indexed lookup.
+
+The job runs from the CLI and is re-run in the background, debounced, after
+new orders:
+
+    python -m backend.cooccurrence            # rebuild now
+    python -m backend.cooccurrence --top-n 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .activity_rollup import interaction_totals
+
+KIND = "fbt"
+TOP_N = int(os.getenv("FBT_TOP_N", "20"))
+ORDER_WEIGHT = 15.0
+WEIGHT_CAP = 30.0
+SHRINK = 3.0
+MAX_BASKET = int(os.getenv("FBT_MAX_BASKET", "100"))   # heaviest items kept per user
+REBUILD_DELAY_S = float(os.getenv("FBT_REBUILD_DELAY_S", "300"))
+
+
+def _baskets(db: Session) -> List[Dict[int, float]]:
+    per_user: Dict[int, Dict[int, float]] = defaultdict(lambda: defaultdict(float))
+
+    for user_id, listing_id, weight in interaction_totals(db):
+        if user_id is not None and listing_id is not None:
+            per_user[user_id][listing_id] += weight or 0.0
+
+    order_rows = (
+        db.query(models.Order.user_id, models.OrderItem.listing_id)
+        .join(models.OrderItem, models.OrderItem.order_id == models.Order.id)
+        .filter(models.Order.status != "cancelled")
+        .distinct()
+        .all()
+    )
+    for user_id, listing_id in order_rows:
+        if user_id is not None and listing_id is not None:
+            basket = per_user[user_id]
+            basket[listing_id] = max(basket[listing_id], ORDER_WEIGHT)
+
+    baskets = []
+    for basket in per_user.values():
+        items = sorted(
+            ((lid, min(w, WEIGHT_CAP)) for lid, w in basket.items() if w > 0),
+            key=lambda x: x[1], reverse=True,
+        )[:MAX_BASKET]
+        if len(items) > 1:
+            baskets.append(dict(items))
+    return baskets
+
+
+def compute_neighbors(baskets: List[Dict[int, float]], top_n: int = TOP_N) -> Dict[int, List[Tuple[int, float]]]:
+    """Top-``top_n`` (neighbour_id, score) per listing, best first."""
+    item_mass: Dict[int, float] = defaultdict(float)
+    pair_mass: Dict[Tuple[int, int], float] = defaultdict(float)
+
+    for basket in baskets:
+        items = sorted(basket.items())
+        for a in range(len(items)):
+            i, wi = items[a]
+            item_mass[i] += wi
+            for b in range(a + 1, len(items)):
+                j, wj = items[b]
+                pair_mass[(i, j)] += min(wi, wj)
+
+    total = sum(item_mass.values())
+    neighbors: Dict[int, List[Tuple[int, float]]] = defaultdict(list)
+    for (i, j), cij in pair_mass.items():
+        lift = cij * total / (item_mass[i] * item_mass[j])
+        if lift <= 1.0:
+            continue
+        score = math.log(lift) * cij / (cij + SHRINK)
+        neighbors[i].append((j, score))
+        neighbors[j].append((i, score))
+
+    return {
+        lid: sorted(cands, key=lambda x: x[1], reverse=True)[:top_n]
+        for lid, cands in neighbors.items()
+    }
+
+
+def rebuild(db: Session, top_n: int = TOP_N) -> Dict[str, float]:
+    """Recompute the model and replace every kind="fbt" row in one transaction."""
+    started = time.perf_counter()
+    baskets = _baskets(db)
+    neighbors = compute_neighbors(baskets, top_n)
+    rows = [
+        {"listing_id": lid, "kind": KIND, "rank": rank, "neighbor_id": nid, "score": score}
+        for lid, cands in neighbors.items()
+        for rank, (nid, score) in enumerate(cands)
+    ]
+    try:
+        db.execute(delete(models.ListingNeighbor).where(models.ListingNeighbor.kind == KIND))
+        if rows:
+            db.execute(insert(models.ListingNeighbor), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    stats = {
+        "baskets": len(baskets),
+        "listings": len(neighbors),
+        "rows": len(rows),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    print(f"FBT: Rebuilt co-occurrence neighbours {stats}", flush=True)
+    return stats
+
+
+# ── Debounced background rebuild ─────────────────────────────────────────────
+_timer: Optional[threading.Timer] = None
+_timer_lock = threading.Lock()
+
+
+def _run_scheduled() -> None:
+    global _timer
+    from .database import SessionLocal
+
+    with _timer_lock:
+        _timer = None
+    db = SessionLocal()
+    try:
+        rebuild(db)
+    except Exception as e:
+        print(f"!!! FBT rebuild failed: {e}", flush=True)
+    finally:
+        db.close()
+
+
+def schedule_rebuild(delay: float = REBUILD_DELAY_S) -> None:
+    """
+    Ask for a rebuild ``delay`` seconds from now.  Calls made while one is
+    already pending are folded into it, so a burst of orders costs one job.
+    """
+    global _timer
+    with _timer_lock:
+        if _timer is not None:
+            return
+        _timer = threading.Timer(delay, _run_scheduled)
+        _timer.daemon = True
+        _timer.start()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild the frequently-bought-together model.")
+    parser.add_argument("--top-n", type=int, default=TOP_N, help="neighbours stored per listing")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal, engine, Base
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rebuild(db, args.top_n)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,10 @@
+import os
+
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./exox.db"
+# Overridable so tools (e.g. the search replay CLI) can point the app at a snapshot
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./exox.db")
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
@@ -0,0 +1,220 @@
+"""
+Near-Duplicate Listing Detection (MinHash + LSH)
+================================================
+Sellers repost the same item many times.  Comparing a new listing with the
+whole catalogue is far too slow for ``create_listing``, so every active
+listing is summarised by a MinHash signature over its shingles and indexed
+with LSH banding:
+
+    shingles   word 3-grams of title + description (plus image URL hashes)
+    signature  NUM_PERM minimum hashes, h_i(x) = (a_i * x + b_i) mod p with
+               p = 2^31 - 1 and a_i, b_i, x < p, so a_i * x + b_i < 2^62
+               never wraps in uint64 arithmetic
+    LSH        BANDS bands of ROWS rows; two listings collide when any band matches
+
+A lookup touches BANDS hash buckets (O(1) expected) and only the colliding
+listings are compared, by the fraction of agreeing signature slots (an
+estimate of their Jaccard similarity).  With 32 bands × 4 rows, pairs above
+~0.6 Jaccard collide with high probability and DEDUP_THRESHOLD (0.8 by
+default) decides what counts as a duplicate.
+
+Duplicates are flagged through ``Listing.duplicate_of``, which always points
+at the cluster root (the first listing seen), so clusters can be collapsed
+in search results.  The index is per process, loaded on first use and then
+maintained from the listing write hooks.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session, selectinload
+
+from . import models
+from .search_engine import _tokenize, invalidate_listing
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+USE_IMAGE_URLS = os.getenv("DEDUP_USE_IMAGE_URLS", "1") == "1"
+
+_MERSENNE = np.uint64((1 << 31) - 1)   # prime; with 31-bit a, b and x the products fit in uint64
+_rng = np.random.RandomState(20240601)
+_PERM_A = _rng.randint(1, int(_MERSENNE), size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, int(_MERSENNE), size=NUM_PERM, dtype=np.uint64)
+
+
+def _shingles(listing: models.Listing) -> Set[str]:
+    tokens = _tokenize(f"{listing.title or ''} {listing.description or ''}")
+    if len(tokens) < 3:
+        shingles = set(tokens)
+    else:
+        shingles = {" ".join(tokens[i:i + 3]) for i in range(len(tokens) - 2)}
+    if USE_IMAGE_URLS:
+        for img in listing.images or []:
+            if img.url:
+                shingles.add("img:" + img.url.rsplit("/", 1)[-1].lower())
+    return shingles
+
+
+def signature(listing: models.Listing) -> Optional[np.ndarray]:
+    """
+    MinHash signature (NUM_PERM uint32 values below 2^31 - 1), or None for an
+    empty listing.  Shingle hashes (crc32) are reduced mod p first, so every
+    a_i * x + b_i is exact in uint64.
+    """
+    shingles = _shingles(listing)
+    if not shingles:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    hashes %= _MERSENNE
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def _band_keys(sig: np.ndarray) -> List[Tuple[int, bytes]]:
+    return [(b, sig[b * ROWS:(b + 1) * ROWS].tobytes()) for b in range(BANDS)]
+
+
+class DuplicateIndex:
+    """LSH index of listing signatures with cluster-root tracking."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], Set[int]] = {}
+        self._root: Dict[int, int] = {}   # listing_id → cluster root id
+
+    def ensure_loaded(self, db: Session) -> None:
+        if self._loaded:
+            return
+        listings = (
+            db.query(models.Listing)
+            .options(selectinload(models.Listing.images))
+            .filter(models.Listing.is_active == True)  # noqa: E712
+            .all()
+        )
+        sigs = [(l.id, l.duplicate_of, signature(l)) for l in listings]
+        with self._lock:
+            if self._loaded:
+                return
+            for lid, dup_of, sig in sigs:
+                if sig is not None:
+                    self._insert_locked(lid, sig, dup_of or lid)
+            self._loaded = True
+            print(f"DEDUP: Indexed {len(self._signatures)} listings", flush=True)
+
+    def _insert_locked(self, listing_id: int, sig: np.ndarray, root: int) -> None:
+        self._signatures[listing_id] = sig
+        self._root[listing_id] = root
+        for key in _band_keys(sig):
+            self._buckets.setdefault(key, set()).add(listing_id)
+
+    def _remove_locked(self, listing_id: int) -> None:
+        sig = self._signatures.pop(listing_id, None)
+        self._root.pop(listing_id, None)
+        if sig is None:
+            return
+        for key in _band_keys(sig):
+            ids = self._buckets.get(key)
+            if ids is not None:
+                ids.discard(listing_id)
+                if not ids:
+                    del self._buckets[key]
+
+    def _similar_locked(self, listing_id: int, sig: np.ndarray) -> List[Tuple[int, float]]:
+        candidates: Set[int] = set()
+        for key in _band_keys(sig):
+            candidates |= self._buckets.get(key, set())
+        candidates.discard(listing_id)
+        scored = [(cid, float(np.mean(self._signatures[cid] == sig))) for cid in candidates]
+        return sorted([c for c in scored if c[1] >= THRESHOLD], key=lambda c: c[1], reverse=True)
+
+    def similar(self, db: Session, listing: models.Listing) -> List[Tuple[int, float]]:
+        """Indexed listings whose estimated Jaccard similarity ≥ THRESHOLD."""
+        self.ensure_loaded(db)
+        sig = signature(listing)
+        if sig is None:
+            return []
+        with self._lock:
+            return self._similar_locked(listing.id, sig)
+
+    def index_listing(self, db: Session, listing: models.Listing) -> Optional[int]:
+        """
+        (Re)index ``listing`` and return the root of the duplicate cluster it
+        joins, or None when it is not a near-duplicate of anything.
+        """
+        self.ensure_loaded(db)
+        sig = signature(listing)
+        with self._lock:
+            self._remove_locked(listing.id)
+            if sig is None or not listing.is_active:
+                return None
+            matches = self._similar_locked(listing.id, sig)
+            root = self._root[matches[0][0]] if matches else None
+            if root == listing.id:
+                root = None
+            self._insert_locked(listing.id, sig, root or listing.id)
+            return root
+
+    def remove(self, listing_id: int) -> None:
+        with self._lock:
+            self._remove_locked(listing_id)
+
+    def reassign_root(self, old_root: int, new_root: int) -> None:
+        with self._lock:
+            for lid, root in self._root.items():
+                if root == old_root:
+                    self._root[lid] = new_root
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "indexed_listings": len(self._signatures),
+                "lsh_buckets": len(self._buckets),
+                "duplicates": sum(1 for lid, root in self._root.items() if root != lid),
+            }
+
+
+duplicate_index = DuplicateIndex()
+
+
+def flag_duplicate(db: Session, listing: models.Listing) -> Optional[int]:
+    """Write-hook for create/update: index ``listing`` and set ``duplicate_of``."""
+    root = duplicate_index.index_listing(db, listing)
+    if listing.duplicate_of != root:
+        listing.duplicate_of = root
+        db.commit()
+        if root:
+            print(f"DEDUP: Listing {listing.id} flagged as near-duplicate of {root}", flush=True)
+    return root
+
+
+def release_cluster(db: Session, listing_id: int) -> None:
+    """
+    Write-hook for delete: drop ``listing_id`` from the index and, if it was a
+    cluster root, promote the oldest remaining member to be the new root.
+    """
+    duplicate_index.remove(listing_id)
+    members = (
+        db.query(models.Listing)
+        .filter(models.Listing.duplicate_of == listing_id)
+        .order_by(models.Listing.id)
+        .all()
+    )
+    if not members:
+        return
+    new_root = members[0]
+    new_root.duplicate_of = None
+    for m in members[1:]:
+        m.duplicate_of = new_root.id
+    db.commit()
+    duplicate_index.reassign_root(listing_id, new_root.id)
+    for m in members:
+        invalidate_listing(m.id, m)
@@ -0,0 +1,112 @@
+"""
+Hot Listing Detail Cache
+========================
+A few listings take most of the ``GET /listings/{id}`` traffic.  This worker
+keeps their detail state in a bounded LRU with a TTL, so a hit answers —
+ETag check included — without touching the database:
+
+    key        listing id
+    value      version, persisted views_count, owner_id and the rendered
+               listing fragment (filled on the first non-304 response)
+    views      served as persisted views_count + views still in the activity
+               buffer; the buffer's flush moves its counts into the cached
+               base, so the total keeps counting up in this worker
+    freshness  write-through: update/delete, image uploads, the AI image score
+               and owner profile edits call ``invalidate``; the TTL bounds how
+               long writes made by other workers can go unseen
+
+Usage
+-----
+GET /cache/stats
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+CACHE_SIZE = int(os.getenv("LISTING_DETAIL_CACHE_SIZE", "1000"))
+TTL_S = float(os.getenv("LISTING_DETAIL_CACHE_TTL_S", "30"))
+
+
+class ListingDetail:
+    __slots__ = ("listing_id", "version", "views_count", "owner_id", "fragment", "expires_at")
+
+    def __init__(self, listing_id: int, version: int, views_count: Optional[int], owner_id: Optional[int],
+                 expires_at: float):
+        self.listing_id = listing_id
+        self.version = version
+        self.views_count = views_count or 0     # persisted count; buffered views are added per request
+        self.owner_id = owner_id
+        self.fragment: Optional[bytes] = None   # listing_render fragment for this version
+        self.expires_at = expires_at
+
+
+class ListingDetailCache:
+    def __init__(self, capacity: int = CACHE_SIZE, ttl_s: float = TTL_S):
+        self._capacity = capacity
+        self._ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, ListingDetail]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, listing_id: int) -> Optional[ListingDetail]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(listing_id)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[listing_id]
+                self._counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(listing_id)
+            self._counters["hits"] += 1
+            return entry
+
+    def put(self, listing_id: int, version: int, views_count: Optional[int], owner_id: Optional[int]) -> ListingDetail:
+        entry = ListingDetail(listing_id, version, views_count, owner_id, time.monotonic() + self._ttl_s)
+        with self._lock:
+            self._entries[listing_id] = entry
+            self._entries.move_to_end(listing_id)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+        return entry
+
+    def invalidate(self, listing_ids: Iterable[int]) -> None:
+        with self._lock:
+            for listing_id in listing_ids:
+                if self._entries.pop(listing_id, None) is not None:
+                    self._counters["invalidations"] += 1
+
+    def add_persisted_views(self, views: Dict[int, int]) -> None:
+        """The activity buffer wrote ``views`` to views_count: move them into the cached base."""
+        with self._lock:
+            for listing_id, n in views.items():
+                entry = self._entries.get(listing_id)
+                if entry is not None:
+                    entry.views_count += n
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "capacity": self._capacity,
+                "ttl_s": self._ttl_s,
+            }
+
+
+listing_details = ListingDetailCache()
+
@@ -0,0 +1,104 @@
+"""
+Conditional GETs
+================
+ETags let clients revalidate instead of re-downloading unchanged responses.
+Each endpoint works out its tag from cheap version data *before* loading or
+serialising anything, and answers ``If-None-Match`` hits with an empty 304:
+
+    strong   single entities and small row sets, from version columns
+             (Listing.version, User.version, Conversation.version) plus
+             whatever else appears in the body (views_count, ...)
+    weak     collections that are too expensive to fingerprint row by row,
+             from the generation counters of the tables they read
+
+``table_generations`` holds one counter per table, incremented by the ORM
+flush hook in models.py for every table a flush writes.  Core statements
+that bypass the ORM (mark-as-read) call ``bump_generations`` themselves.
+The activity buffer's views_count updates bump VIEWS_GENERATION instead of
+``listings``: a weak collection tag ignores view counts unless the page is
+ordered by them, so steady view traffic does not defeat it.
+
+Usage
+-----
+etag = etags.strong("listing", listing_id, version, views)
+if etags.matches(request, etag):
+    return etags.not_modified(etag)
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Dict, Iterable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import models
+
+# Tables whose rows appear in a serialised schemas.Listing (owner and images included)
+LISTING_TABLES = ("listings", "product_images", "users", "listing_categories")
+
+# Generation bumped by write-behind views_count updates (activity_buffer.py)
+VIEWS_GENERATION = "listing_views"
+
+CACHE_CONTROL = "no-cache"   # always revalidate; the 304 makes that cheap
+
+
+def bump_generations(session, tables: Iterable[str]) -> None:
+    """Increment the generation of each table in ``tables`` (inside the caller's transaction)."""
+    tables = sorted(set(tables))
+    if not tables:
+        return
+    stmt = sqlite_insert(models.TableGeneration).values([{"name": t, "generation": 1} for t in tables])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.TableGeneration.name],
+        set_={"generation": models.TableGeneration.generation + 1},
+    )
+    session.execute(stmt)
+
+
+def generations(db, tables: Iterable[str]) -> Dict[str, int]:
+    """Current generation of each table (0 if never written)."""
+    tables = list(tables)
+    rows = db.query(models.TableGeneration.name, models.TableGeneration.generation).filter(
+        models.TableGeneration.name.in_(tables)
+    )
+    found = dict(rows)
+    return {t: found.get(t, 0) for t in tables}
+
+
+def _digest(parts) -> str:
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+
+
+def strong(*parts) -> str:
+    return f'"{_digest(parts)}"'
+
+
+def weak(*parts) -> str:
+    return f'W/"{_digest(parts)}"'
+
+
+def matches(request: Request, etag: str) -> bool:
+    """Weak comparison of ``etag`` against If-None-Match, as RFC 9110 prescribes for GET."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def headers(etag: str, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL, **(extra or {})}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=headers(etag))
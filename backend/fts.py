@@ -0,0 +1,252 @@
+"""
+SQLite FTS5 Full-Text Index
+===========================
+Database-level text index over listings, usable as the sparse retriever of
+``search_engine`` (``SEARCH_SPARSE_BACKEND=fts5``) in place of the in-memory
+``rank_bm25`` index that every worker rebuilds per shard.
+
+    listings_fts   external-content FTS5 table over listings
+                   (title, description, category, city), rowid = listings.id
+    triggers       listings_fts_ai / _ad / _au keep it in step with every
+                   INSERT, UPDATE and DELETE on listings, whichever code path
+                   or process makes the write
+
+Ranking is FTS5's bm25() with column weights that mirror the in-memory index
+(title and category 3×, description and city 1×).  Queries OR the query
+tokens together and treat the last token as a prefix ("used mob" matches
+"mobile"); the ``prefix`` index option keeps short prefixes cheap.
+``snippet()`` supplies highlighted description excerpts for search results.
+
+Usage
+-----
+python -m backend.fts rebuild
+python -m backend.fts bench --queries 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+TABLE = "listings_fts"
+WEIGHTS = (3.0, 1.0, 3.0, 1.0)     # title, description, category, city
+MAX_CANDIDATES = 1000
+SNIPPET_TOKENS = 16
+_BM25 = f"bm25({TABLE}, {', '.join(str(w) for w in WEIGHTS)})"
+
+_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+        title, description, category, city,
+        content='listings', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_ai AFTER INSERT ON listings BEGIN
+        INSERT INTO {TABLE}(rowid, title, description, category, city)
+        VALUES (new.id, new.title, new.description, new.category, new.city);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_ad AFTER DELETE ON listings BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, title, description, category, city)
+        VALUES ('delete', old.id, old.title, old.description, old.category, old.city);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_au AFTER UPDATE OF title, description, category, city ON listings BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, title, description, category, city)
+        VALUES ('delete', old.id, old.title, old.description, old.category, old.city);
+        INSERT INTO {TABLE}(rowid, title, description, category, city)
+        VALUES (new.id, new.title, new.description, new.category, new.city);
+    END
+    """,
+]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Schema
+# ─────────────────────────────────────────────────────────────────────────────
+def fts5_available(conn: Connection) -> bool:
+    try:
+        return bool(conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar())
+    except Exception:
+        return False
+
+
+def ensure_index(engine: Engine) -> bool:
+    """Create the FTS table and triggers if missing (building the index once); False without FTS5."""
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.begin() as conn:
+        if not fts5_available(conn):
+            print("!!! SQLite was built without FTS5; the fts5 search backend is unavailable", flush=True)
+            return False
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": TABLE}
+        ).first()
+        for ddl in _DDL:
+            conn.execute(text(ddl))
+        if not exists:
+            conn.execute(text(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')"))
+            print("FTS: Built listings_fts", flush=True)
+    return True
+
+
+def rebuild(engine: Engine) -> float:
+    """Re-index every listing from the content table (after bulk loads that bypassed triggers)."""
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')"))
+        conn.execute(text(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')"))
+    return time.perf_counter() - started
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Queries
+# ─────────────────────────────────────────────────────────────────────────────
+def match_expression(tokens: Sequence[str], prefix_last: bool = True) -> Optional[str]:
+    """``"used" OR "mob"*`` — tokens quoted so FTS5 syntax in user input is inert."""
+    terms = ['"' + t.replace('"', '""') + '"' for t in tokens if t]
+    if not terms:
+        return None
+    if prefix_last:
+        terms[-1] += "*"
+    return " OR ".join(terms)
+
+
+def sparse_scores(db: Session, tokens: Sequence[str], limit: int = MAX_CANDIDATES) -> Dict[int, float]:
+    """listing id → bm25 score (higher is better) for the best ``limit`` active matches."""
+    expr = match_expression(tokens)
+    if expr is None:
+        return {}
+    rows = db.execute(
+        text(
+            f"SELECT {TABLE}.rowid, -{_BM25} AS score FROM {TABLE} "
+            f"JOIN listings ON listings.id = {TABLE}.rowid "
+            f"WHERE {TABLE} MATCH :q AND listings.is_active = 1 "
+            f"ORDER BY score DESC LIMIT :limit"
+        ),
+        {"q": expr, "limit": limit},
+    )
+    return {int(rowid): float(score) for rowid, score in rows}
+
+
+def snippets(db: Session, tokens: Sequence[str], listing_ids: Sequence[int]) -> Dict[int, str]:
+    """Highlighted description excerpts (``<mark>`` around matches) for ``listing_ids``."""
+    expr = match_expression(tokens)
+    if expr is None or not listing_ids:
+        return {}
+    ids = ", ".join(str(int(i)) for i in listing_ids)
+    rows = db.execute(
+        text(
+            f"SELECT rowid, snippet({TABLE}, 1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) "
+            f"FROM {TABLE} WHERE {TABLE} MATCH :q AND rowid IN ({ids})"
+        ),
+        {"q": expr},
+    )
+    return {int(rowid): snip for rowid, snip in rows}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Benchmark: FTS5 vs the in-memory rank_bm25 index
+# ─────────────────────────────────────────────────────────────────────────────
+def benchmark(db: Session, n_queries: int = 200, k: int = 10, seed: int = 0) -> Dict[str, float]:
+    """
+    Index build time, per-query latency and top-k overlap of FTS5 against
+    ``BM25Okapi`` over the active listings.  Queries are one to three words
+    drawn from listing titles, the last one cut to a prefix half the time.
+    """
+    from rank_bm25 import BM25Okapi
+    from . import models
+    from .search_engine import _full_text, _tokenize
+
+    listings = db.query(models.Listing).filter(models.Listing.is_active == True).all()  # noqa: E712
+    if not listings:
+        return {"listings": 0}
+    ids = [l.id for l in listings]
+
+    started = time.perf_counter()
+    bm25 = BM25Okapi([_tokenize(_full_text(l)) for l in listings])
+    bm25_build = time.perf_counter() - started
+    fts_build = rebuild(db.get_bind())
+
+    rng = random.Random(seed)
+    vocab = [_tokenize(l.title) for l in listings]
+    vocab = [words for words in vocab if words]
+    queries = []
+    for _ in range(n_queries):
+        words = rng.choice(vocab)
+        q = rng.sample(words, min(len(words), rng.randint(1, 3)))
+        if rng.random() < 0.5 and len(q[-1]) > 3:
+            q[-1] = q[-1][: max(2, len(q[-1]) // 2)]
+        queries.append(q)
+
+    bm25_ms, fts_ms, overlaps = [], [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        scores = bm25.get_scores(q)
+        bm25_top = {ids[i] for i in np.argsort(-scores)[:k] if scores[i] > 0}
+        bm25_ms.append((time.perf_counter() - t0) * 1000.0)
+
+        t0 = time.perf_counter()
+        fts_top = set(list(sparse_scores(db, q, limit=k))[:k])
+        fts_ms.append((time.perf_counter() - t0) * 1000.0)
+        if bm25_top or fts_top:
+            overlaps.append(len(bm25_top & fts_top) / max(len(bm25_top | fts_top), 1))
+
+    def pct(values: List[float], p: float) -> float:
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(p * len(values)))], 3)
+
+    return {
+        "listings": len(listings),
+        "queries": len(queries),
+        "bm25_build_s": round(bm25_build, 3),
+        "fts5_rebuild_s": round(fts_build, 3),
+        "bm25_p50_ms": pct(bm25_ms, 0.5),
+        "bm25_p95_ms": pct(bm25_ms, 0.95),
+        "fts5_p50_ms": pct(fts_ms, 0.5),
+        "fts5_p95_ms": pct(fts_ms, 0.95),
+        f"jaccard@{k}": round(sum(overlaps) / len(overlaps), 3) if overlaps else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the listings FTS5 index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="re-index every listing")
+    bench = sub.add_parser("bench", help="compare FTS5 with the in-memory rank_bm25 index")
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal, engine, Base
+
+    Base.metadata.create_all(bind=engine)
+    if not ensure_index(engine):
+        return 1
+    if args.command == "rebuild":
+        print(f"FTS: Rebuilt {TABLE} in {rebuild(engine):.3f}s", flush=True)
+        return 0
+
+    db = SessionLocal()
+    try:
+        print(f"FTS BENCHMARK: {benchmark(db, args.queries, args.k)}", flush=True)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Image Embedding Pipeline
+========================
+Batch job that turns ``ProductImage`` rows into vectors for "visually
+similar" recommendations.
+
+    fetch + decode + resize   worker processes (ProcessPoolExecutor), one
+                              batch at a time so memory stays bounded
+    encode                    pluggable ImageEncoder in the parent process
+    store                     ``image_embeddings`` (float16), keyed by image id
+                              and encoder, with the sha1 of the image bytes
+    neighbours                mean image vector per listing → top-N per listing
+                              in ``listing_neighbors`` (kind="visual")
+
+Images whose URL is unchanged since their vector was written are skipped
+without downloading them; images whose bytes hash to an already-encoded
+image reuse that vector.  ``get_visually_similar_listings()`` prefers the
+visual neighbours and falls back to the text-similarity ones.
+
+Encoders (IMAGE_ENCODER)
+------------------------
+clip        clip-ViT-B-32 via sentence-transformers (the default)
+histogram   colour histogram + difference hash; deterministic, no model
+            download, meant for tests and development
+
+Usage
+-----
+python -m backend.image_embeddings
+python -m backend.image_embeddings --encoder histogram --workers 2 --batch-size 16
+"""
+
+from __future__ import annotations
+
+import abc
+import argparse
+import hashlib
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import models
+
+ENCODER_NAME = os.getenv("IMAGE_ENCODER", "clip").strip().lower()
+BATCH_SIZE = int(os.getenv("IMAGE_EMBED_BATCH", "32"))
+WORKERS = int(os.getenv("IMAGE_EMBED_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+VISUAL_KIND = "visual"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Encoders
+# ─────────────────────────────────────────────────────────────────────────────
+class ImageEncoder(abc.ABC):
+    """Turns decoded RGB arrays (input_size × input_size × 3, uint8) into L2-normalised vectors."""
+
+    name: str = ""
+    input_size: int = 224
+
+    @abc.abstractmethod
+    def encode(self, images: List[np.ndarray]) -> np.ndarray:
+        ...
+
+
+class ClipEncoder(ImageEncoder):
+    name = "clip-ViT-B-32"
+    input_size = 224
+
+    def encode(self, images: List[np.ndarray]) -> np.ndarray:
+        from PIL import Image
+        from .recommendation import _get_clip_model
+
+        model = _get_clip_model()
+        if model is None:
+            raise RuntimeError("CLIP model is not available")
+        embs = model.encode([Image.fromarray(a) for a in images], normalize_embeddings=True,
+                            show_progress_bar=False)
+        return np.asarray(embs, dtype=np.float32)
+
+
+class ColorHistogramEncoder(ImageEncoder):
+    """8×8×8 RGB histogram (512 dims) + 64-bit difference hash (64 dims)."""
+
+    name = "color-hist-dhash"
+    input_size = 64
+    BINS = 8
+
+    def encode(self, images: List[np.ndarray]) -> np.ndarray:
+        from PIL import Image
+
+        out = np.zeros((len(images), self.BINS ** 3 + 64), dtype=np.float32)
+        for i, img in enumerate(images):
+            q = (img.astype(np.int32) * self.BINS) // 256
+            codes = (q[..., 0] * self.BINS + q[..., 1]) * self.BINS + q[..., 2]
+            hist = np.bincount(codes.ravel(), minlength=self.BINS ** 3).astype(np.float32)
+            hist = np.sqrt(hist / max(hist.sum(), 1.0))           # Hellinger, unit norm
+
+            gray = np.asarray(Image.fromarray(img).convert("L").resize((9, 8)), dtype=np.int16)
+            bits = (gray[:, 1:] > gray[:, :-1]).ravel().astype(np.float32) * 2.0 - 1.0
+
+            out[i, :hist.size] = hist
+            out[i, hist.size:] = bits / 8.0                       # unit norm too
+        return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+
+_ENCODERS = {"clip": ClipEncoder, "histogram": ColorHistogramEncoder}
+
+
+def get_encoder(name: Optional[str] = None) -> ImageEncoder:
+    name = (name or ENCODER_NAME).strip().lower()
+    if name not in _ENCODERS:
+        raise ValueError(f"Unknown image encoder {name!r} (choose from {', '.join(_ENCODERS)})")
+    return _ENCODERS[name]()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker side: fetch, hash, decode and resize
+# ─────────────────────────────────────────────────────────────────────────────
+def _load_image(job: Tuple[int, str, Optional[str], int]) -> Tuple[int, Optional[str], Optional[np.ndarray], Optional[str]]:
+    """
+    (image_id, url, known_hash, size) → (image_id, content_hash, pixels, error).
+    ``pixels`` is None when the bytes hash to ``known_hash`` (nothing to do).
+    """
+    from PIL import Image
+
+    image_id, url, known_hash, size = job
+    try:
+        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+        with urllib.request.urlopen(req, timeout=15) as resp:
+            data = resp.read(MAX_IMAGE_BYTES + 1)
+        if len(data) > MAX_IMAGE_BYTES:
+            return image_id, None, None, "image too large"
+        content_hash = hashlib.sha1(data).hexdigest()
+        if content_hash == known_hash:
+            return image_id, content_hash, None, None
+
+        import io
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("RGB", (size * 2, size * 2))   # JPEG: decode at reduced scale
+            img = img.convert("RGB").resize((size, size))
+            return image_id, content_hash, np.asarray(img, dtype=np.uint8), None
+    except Exception as e:
+        return image_id, None, None, str(e)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Pipeline
+# ─────────────────────────────────────────────────────────────────────────────
+def embed_images(db: Session, encoder: ImageEncoder, batch_size: int = BATCH_SIZE,
+                 workers: int = WORKERS, force: bool = False) -> Dict[str, int]:
+    """Encode every new or changed product image and persist the vectors."""
+    images = db.query(models.ProductImage.id, models.ProductImage.url, models.ProductImage.listing_id).all()
+    stored = {
+        e.image_id: e for e in
+        db.query(models.ImageEmbedding).filter(models.ImageEmbedding.encoder == encoder.name)
+    }
+
+    # Vectors of images that no longer exist
+    live_ids = {img.id for img in images}
+    orphans = [image_id for image_id in stored if image_id not in live_ids]
+    if orphans:
+        db.query(models.ImageEmbedding).filter(
+            models.ImageEmbedding.encoder == encoder.name,
+            models.ImageEmbedding.image_id.in_(orphans),
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    todo = [
+        img for img in images
+        if img.listing_id is not None
+        and (force or img.id not in stored or stored[img.id].source_url != img.url)
+    ]
+    by_hash = {e.content_hash: e.vector for e in stored.values()}
+    stats = {"images": len(images), "skipped": len(images) - len(todo), "encoded": 0,
+             "reused": 0, "unchanged": 0, "failed": 0, "removed": len(orphans)}
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 and len(todo) > 1 else None
+    try:
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            jobs = [
+                (img.id, img.url, stored[img.id].content_hash if img.id in stored and not force else None,
+                 encoder.input_size)
+                for img in batch
+            ]
+            loaded = list(pool.map(_load_image, jobs)) if pool else [_load_image(j) for j in jobs]
+            meta = {img.id: img for img in batch}
+
+            to_encode: List[Tuple[int, str, np.ndarray]] = []
+            for image_id, content_hash, pixels, error in loaded:
+                img = meta[image_id]
+                if error:
+                    stats["failed"] += 1
+                    print(f"!!! Image {image_id} skipped: {error}", flush=True)
+                elif pixels is None:
+                    stats["unchanged"] += 1
+                    stored[image_id].source_url = img.url
+                elif content_hash in by_hash and not force:
+                    stats["reused"] += 1
+                    _store(db, img, encoder, content_hash, by_hash[content_hash])
+                else:
+                    to_encode.append((image_id, content_hash, pixels))
+
+            if to_encode:
+                vectors = encoder.encode([p for _, _, p in to_encode])
+                for (image_id, content_hash, _), vec in zip(to_encode, vectors):
+                    blob = vec.astype(np.float16).tobytes()
+                    by_hash[content_hash] = blob
+                    _store(db, meta[image_id], encoder, content_hash, blob)
+                stats["encoded"] += len(to_encode)
+            db.commit()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return stats
+
+
+def _store(db: Session, img, encoder: ImageEncoder, content_hash: str, blob: bytes) -> None:
+    db.merge(models.ImageEmbedding(
+        image_id=img.id,
+        listing_id=img.listing_id,
+        encoder=encoder.name,
+        source_url=img.url,
+        content_hash=content_hash,
+        vector=blob,
+    ))
+
+
+def listing_vectors(db: Session, encoder_name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(listing ids, L2-normalised mean image vector) for active listings."""
+    rows = (
+        db.query(models.ImageEmbedding.listing_id, models.ImageEmbedding.vector)
+        .join(models.Listing, models.Listing.id == models.ImageEmbedding.listing_id)
+        .filter(models.ImageEmbedding.encoder == encoder_name, models.Listing.is_active == True)  # noqa: E712
+        .order_by(models.ImageEmbedding.listing_id)
+        .all()
+    )
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    vecs = np.stack([np.frombuffer(r[1], dtype=np.float16) for r in rows]).astype(np.float32)
+    unique_ids, starts = np.unique(ids, return_index=True)
+    sums = np.add.reduceat(vecs, starts, axis=0)
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    return unique_ids, sums / np.maximum(norms, 1e-12)
+
+
+def rebuild_visual_neighbors(db: Session, encoder_name: str) -> int:
+    from .neighbors import _replace_rows, _top_rows
+
+    ids, matrix = listing_vectors(db, encoder_name)
+    rows = _top_rows(ids, matrix, list(range(len(ids))), kind=VISUAL_KIND)
+    _replace_rows(db, None, rows, kind=VISUAL_KIND)
+    return len(rows)
+
+
+def run(db: Session, encoder: Optional[ImageEncoder] = None, batch_size: int = BATCH_SIZE,
+        workers: int = WORKERS, force: bool = False) -> Dict[str, float]:
+    started = time.perf_counter()
+    encoder = encoder or get_encoder()
+    stats: Dict[str, float] = dict(embed_images(db, encoder, batch_size, workers, force))
+    stats["neighbor_rows"] = rebuild_visual_neighbors(db, encoder.name)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    print(f"IMAGE EMBEDDINGS [{encoder.name}]: {stats}", flush=True)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Embed product images and rebuild visual neighbours.")
+    parser.add_argument("--encoder", default=None, help="clip | histogram (default: $IMAGE_ENCODER or clip)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="decode processes (0 = in-process)")
+    parser.add_argument("--force", action="store_true", help="re-encode every image")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal, engine, Base
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        run(db, get_encoder(args.encoder), args.batch_size, args.workers, args.force)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Pre-rendered Listing Payloads
+=============================
+Listing endpoints used to run pydantic ``from_attributes`` validation for
+every row of every response and then encode the result to JSON again.  A
+listing's public JSON only changes when the listing, its images or its
+owner's public profile change, so it is rendered once and kept in an
+in-process LRU:
+
+    key        (listing_id, Listing.version)      — the version is bumped by
+               the ORM flush hook in models.py, so edits made by any worker
+               or background job miss the cache automatically
+    value      schemas.Listing JSON without views_count
+    assembly   '{"views_count":N,' + fragment[1:], joined into the response
+               body as bytes; views_count is spliced in because it changes on
+               every view and would otherwise invalidate the entry constantly
+
+Endpoints that only need ids can ask for (id, version, views_count) columns
+and hydrate just the cache misses with ``load_listings``.
+
+Usage
+-----
+python -m backend.listing_render --listings 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+CACHE_SIZE = int(os.getenv("LISTING_RENDER_CACHE_SIZE", "20000"))
+
+Key = Tuple[int, int]
+
+
+class ListingRenderCache:
+    def __init__(self, capacity: int = CACHE_SIZE):
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Key, bytes]" = OrderedDict()
+        self._latest: Dict[int, int] = {}       # listing_id → newest version cached
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    # ── Fragments ───────────────────────────────────────────────────────────
+    def _get(self, key: Key) -> Optional[bytes]:
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return fragment
+
+    def _put(self, key: Key, fragment: bytes) -> None:
+        with self._lock:
+            stale = self._latest.get(key[0])
+            if stale is not None and stale != key[1]:
+                self._entries.pop((key[0], stale), None)
+            self._latest[key[0]] = key[1]
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._capacity:
+                (old_id, old_version), _ = self._entries.popitem(last=False)
+                if self._latest.get(old_id) == old_version:
+                    del self._latest[old_id]
+                self._counters["evictions"] += 1
+
+    @staticmethod
+    def _render(listing: models.Listing) -> bytes:
+        return schemas.Listing.model_validate(listing).model_dump_json(exclude={"views_count"}).encode("utf-8")
+
+    def fragment(self, listing: models.Listing) -> bytes:
+        """Cached JSON of ``listing`` without views_count (rendered on a miss)."""
+        key = (listing.id, listing.version or 0)
+        fragment = self._get(key)
+        if fragment is None:
+            fragment = self._render(listing)
+            self._put(key, fragment)
+        return fragment
+
+    @staticmethod
+    def assemble(fragment: bytes, views_count: Optional[int]) -> bytes:
+        return b'{"views_count":' + str(int(views_count or 0)).encode("ascii") + b"," + fragment[1:]
+
+    # ── Responses ───────────────────────────────────────────────────────────
+    def render_listing(self, listing: models.Listing) -> bytes:
+        return self.assemble(self.fragment(listing), listing.views_count)
+
+    def render_listings(self, listings: Iterable[models.Listing]) -> bytes:
+        """JSON array for ORM listings already loaded (owner and images eager-loaded)."""
+        return b"[" + b",".join(self.render_listing(l) for l in listings) + b"]"
+
+    def render_rows(self, db: Session, rows: Sequence[Tuple[int, int, Optional[int]]]) -> bytes:
+        """
+        JSON array for (id, version, views_count) rows, in order.  Only the
+        cache misses are loaded from the database.
+        """
+        from .queries import load_listings
+
+        fragments: Dict[int, bytes] = {}
+        missing = []
+        for listing_id, version, _ in rows:
+            fragment = self._get((listing_id, version or 0))
+            if fragment is None:
+                missing.append(listing_id)
+            else:
+                fragments[listing_id] = fragment
+        for listing in load_listings(db, missing):
+            fragment = self._render(listing)
+            self._put((listing.id, listing.version or 0), fragment)
+            fragments[listing.id] = fragment
+        return b"[" + b",".join(
+            self.assemble(fragments[listing_id], views) for listing_id, _, views in rows if listing_id in fragments
+        ) + b"]"
+
+    def fragment_for(self, db: Session, listing_id: int, version: int) -> Optional[bytes]:
+        """Cached fragment of one listing by id and version; None if the listing no longer exists."""
+        from .queries import load_listings
+
+        fragment = self._get((listing_id, version or 0))
+        if fragment is None:
+            loaded = load_listings(db, [listing_id])
+            if not loaded:
+                return None
+            fragment = self._render(loaded[0])
+            self._put((listing_id, loaded[0].version or 0), fragment)
+        return fragment
+
+    def invalidate(self, listing_id: int) -> None:
+        with self._lock:
+            version = self._latest.pop(listing_id, None)
+            if version is not None:
+                self._entries.pop((listing_id, version), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries), "capacity": self._capacity}
+
+
+listing_renderer = ListingRenderCache()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Benchmark
+# ─────────────────────────────────────────────────────────────────────────────
+def _synthetic_listings(n: int) -> List[models.Listing]:
+    owners = [models.User(id=i, email=f"seller{i}@example.com", name=f"Seller {i}", hashed_password="x")
+              for i in range(1, 51)]
+    listings = []
+    for i in range(1, n + 1):
+        listing = models.Listing(
+            id=i, title=f"Listing {i} – gently used", description="Lorem ipsum dolor sit amet. " * 8,
+            price=float(100 + i), category="Electronics & Technology", city="Pune", is_active=True,
+            views_count=i * 3, accept_exchange=True, exchange_preferences=None, version=1,
+            owner_id=owners[i % 50].id,
+        )
+        listing.owner = owners[i % 50]
+        listing.images = [models.ProductImage(id=i * 10 + k, url=f"https://images.example.com/{i}/{k}.jpg",
+                                              listing_id=i, quality_score=7.5) for k in range(3)]
+        listings.append(listing)
+    return listings
+
+
+def benchmark(n: int = 1000, rounds: int = 5) -> Dict[str, float]:
+    """Milliseconds to serialise ``n`` listings: FastAPI's default path vs cold and warm fragment cache."""
+    import json
+    from fastapi.encoders import jsonable_encoder
+
+    listings = _synthetic_listings(n)
+
+    def best(fn) -> float:
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000.0)
+        return round(min(timings), 2)
+
+    def fastapi_default():
+        validated = [schemas.Listing.model_validate(l) for l in listings]
+        return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+    def pydantic_only():
+        return b"[" + b",".join(schemas.Listing.model_validate(l).model_dump_json().encode("utf-8") for l in listings) + b"]"
+
+    def cold():
+        cache = ListingRenderCache(capacity=n)
+        return cache.render_listings(listings)
+
+    warm_cache = ListingRenderCache(capacity=n)
+    warm_cache.render_listings(listings)
+    assert json.loads(warm_cache.render_listings(listings)) == json.loads(fastapi_default())
+
+    return {
+        "listings": n,
+        "fastapi_default_ms": best(fastapi_default),
+        "pydantic_dump_json_ms": best(pydantic_only),
+        "fragment_cache_cold_ms": best(cold),
+        "fragment_cache_warm_ms": best(lambda: warm_cache.render_listings(listings)),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark listing JSON serialisation.")
+    parser.add_argument("--listings", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+    print(f"LISTING RENDER BENCHMARK: {benchmark(args.listings, args.rounds)}", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,7 @@ os.environ['KMP_DUPLICATE_LIB_OK']='True'
 os.environ['OMP_NUM_THREADS'] = '1'
 os.environ['MKL_NUM_THREADS'] = '1'
 
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, BackgroundTasks, Request, Response
 from starlette.concurrency import run_in_threadpool
 import cloudinary
 import cloudinary.uploader
@@ -11,20 +11,26 @@ from typing import List, Optional
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, selectinload
 import uvicorn
 from dotenv import load_dotenv
 import math
+import json
 from datetime import datetime
 
 load_dotenv()
 
-from . import models, schemas
+from . import etags, models, projections, schemas
 from .auth import authenticate_user, create_access_token, get_password_hash, get_current_user, get_current_user_optional
 from .database import engine, Base, get_db
 from . import chat_models  # import so tables get created
 from .chat_routes import router as chat_router
 from .search_engine import semantic_search, invalidate_listing, preload_models
+from .user_interest import record_interest
+from .pagination import keyset_page, DEFAULT_LIMIT, MAX_LIMIT
+from .queries import listing_load_options, order_load_options
+from .entity_cache import listing_details
+from .listing_render import listing_renderer
 
 
 import threading
@@ -38,6 +44,12 @@ from email.mime.multipart import MIMEMultipart
 models.Base.metadata.create_all(bind=engine)
 chat_models.Base.metadata.create_all(bind=engine)
 
+from . import search_engine as _search_engine
+if _search_engine.SPARSE_BACKEND == "fts5":
+    from .fts import ensure_index
+    if not ensure_index(engine):
+        _search_engine.SPARSE_BACKEND = "bm25"   # no FTS5 in this SQLite build
+
 app = FastAPI(title="Exo Exchange API")
 
 # --- SECURE CORS CONFIGURATION ---
@@ -54,6 +66,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # --- GLOBAL ERROR CATCHER ---
@@ -77,31 +90,34 @@ def startup_event():
     pass
 
 
+@app.on_event("shutdown")
+def shutdown_event():
+    from . import query_log
+    from .activity_buffer import activity_buffer
+    activity_buffer.shutdown()
+    query_log.shutdown()
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
 @app.get("/migrate")
 def run_migrations(db: Session = Depends(get_db)):
-    """Add missing columns to the database."""
-    from sqlalchemy import text
+    """Upgrade the schema to the latest Alembic revision (backend/migrations)."""
     try:
-        # Check if is_delivered exists
-        try:
-            db.execute(text("SELECT is_delivered FROM messages LIMIT 1"))
-        except:
-            db.execute(text("ALTER TABLE messages ADD COLUMN is_delivered BOOLEAN DEFAULT 0"))
-            db.commit()
-            print("Migration: Added is_delivered")
+        from alembic import command
+        from alembic.config import Config
+
+        config = Config(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini"))
+        config.attributes["configure_logging"] = False
+        command.upgrade(config, "head")
 
-        # Check for attachment columns in messages
-        for col in ["attachment_url", "attachment_type", "attachment_public_id"]:
-            try:
-                db.execute(text(f"SELECT {col} FROM messages LIMIT 1"))
-            except:
-                db.execute(text(f"ALTER TABLE messages ADD COLUMN {col} TEXT"))
-                db.commit()
-                print(f"Migration: Added {col}")
+        # Browse categories (categorizer.py): classify listings that have no membership rows
+        from .categorizer import backfill
+        stats = backfill(db, missing_only=True)
+        if stats["listings"]:
+            print(f"Migration: Categorized listings {stats}")
 
         return {"status": "success", "message": "Migrations completed."}
     except Exception as e:
@@ -365,14 +381,38 @@ def get_dashboard_stats(
         raise HTTPException(status_code=500, detail="Internal server error in dashboard calculations.")
 
 
+# Tables a profile response reads besides the user row itself
+PROFILE_TABLES = etags.LISTING_TABLES + (
+    "follows", "reviews", "orders", "order_items", "community_vouches", "disputes",
+)
+
+
 @app.get("/users/{user_id}/profile", response_model=schemas.User)
 def get_user_profile(
     user_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
+    version = db.query(models.User.version).filter(models.User.id == user_id).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Review weights decay by the day, so the date is part of the tag
+    etag = etags.strong(
+        "profile", user_id, version, etags.generations(db, PROFILE_TABLES), datetime.utcnow().date().isoformat()
+    )
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    response.headers.update(etags.headers(etag))
+
     user = db.query(models.User).options(
-        joinedload(models.User.listings),
-        joinedload(models.User.received_reviews).joinedload(models.Review.order).joinedload(models.Order.items).joinedload(models.OrderItem.listing)
+        *listing_load_options(selectinload(models.User.listings)),
+        *listing_load_options(
+            selectinload(models.User.received_reviews).joinedload(models.Review.order)
+            .selectinload(models.Order.items).joinedload(models.OrderItem.listing)
+        ),
+        selectinload(models.User.followers),
+        selectinload(models.User.following),
     ).filter(models.User.id == user_id).first()
     
     if not user:
@@ -511,13 +551,27 @@ def get_following(
     return user.following
 
 
+def _listing_rows_response(request: Request, db: Session, scope: tuple, rows) -> Response:
+    """Rendered (id, version, views_count) rows, with a strong ETag over exactly those rows."""
+    etag = etags.strong(*scope, tuple(tuple(r) for r in rows))
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    return Response(
+        content=listing_renderer.render_rows(db, rows), media_type="application/json", headers=etags.headers(etag)
+    )
+
+
 @app.get("/users/{user_id}/listings", response_model=List[schemas.Listing])
 def get_user_listings(
     user_id: int,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Fetch listings belonging to a specific user."""
-    return db.query(models.Listing).filter(models.Listing.owner_id == user_id).all()
+    rows = db.query(models.Listing.id, models.Listing.version, models.Listing.views_count).filter(
+        models.Listing.owner_id == user_id
+    ).order_by(models.Listing.id).all()
+    return _listing_rows_response(request, db, ("user-listings", user_id), rows)
 
 
 @app.put("/auth/profile", response_model=schemas.User)
@@ -547,6 +601,9 @@ def update_profile(
         
     db.commit()
     db.refresh(current_user)
+
+    # Listing details embed the owner
+    listing_details.invalidate([l.id for l in current_user.listings])
         
     # Populate counts
     current_user.followers_count = len(current_user.followers)
@@ -584,11 +641,35 @@ def create_listing(
         
         try:
             # Invalidate query cache so new listing is immediately searchable
-            invalidate_listing(listing.id)
+            invalidate_listing(listing.id, listing)
             print(f"--> [DEBUG] Cache invalidated for {listing.id}", flush=True)
         except Exception as cache_err:
             print(f"!!! WARNING: Cache invalidation failed: {cache_err}", flush=True)
+
+        # --- NEAR-DUPLICATE DETECTION ---
+        try:
+            from .dedupe import flag_duplicate
+            flag_duplicate(db, listing)
+        except Exception as dedup_err:
+            print(f"!!! WARNING: Duplicate check failed: {dedup_err}", flush=True)
+            db.rollback()
             
+        # --- SAVED SEARCH ALERTS ---
+        from .percolator import deliver_new_listing_alerts
+        background_tasks.add_task(deliver_new_listing_alerts, listing.id)
+
+        # --- SIMILAR-LISTING NEIGHBOURS ---
+        from .neighbors import update_listing_task
+        background_tasks.add_task(update_listing_task, listing.id)
+
+        # --- BROWSE CATEGORIES ---
+        try:
+            from .categorizer import assign_categories
+            assign_categories(db, listing)
+        except Exception as cat_err:
+            print(f"!!! WARNING: Category assignment failed: {cat_err}", flush=True)
+            db.rollback()
+
         # --- TRIGGER AI DETECTION (KIMI-K2.5) ---
         try:
             from .ai_inspector import AIInspector
@@ -663,6 +744,7 @@ async def upload_listing_images_bulk(
         img = models.ProductImage(url=url, listing_id=listing_id)
         db.add(img)
     db.commit()
+    listing_details.invalidate([listing_id])
     
     # --- TRIGGER AI DETECTION (KIMI-K2.5) ---
     try:
@@ -682,51 +764,66 @@ async def upload_listing_images_bulk(
 
 @app.get("/listings", response_model=list[schemas.Listing])
 def list_listings(
-    skip: int = 0,
-    limit: int = 1000,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_LIMIT,
+    sort: str = "newest",
     category: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
+    view: str = "full",
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
-    print(f"--> API REQUEST: Fetching listings (skip={skip}, limit={limit}, cat={category}, min={min_price}, max={max_price})", flush=True)
-    
-    # Category to Keyword mapping for smarter filtering
-    CATEGORY_KEYWORDS = {
-        "Electronics & Technology": ["mobile", "phone", "computer", "laptop", "camera", "accessory", "tech", "electronic", "gadget", "tablet", "watch"],
-        "Fashion & Apparel": ["clothing", "shoes", "accessory", "shirt", "pant", "dress", "watch", "bag", "wear"],
-        "Health, Personal Care": ["fitness", "equipment", "health", "care", "supplement", "gym", "workout"],
-        "Home, Kitchen & Furniture": ["home", "decor", "appliance", "furniture", "kitchen", "table", "chair", "sofa", "bed"],
-        "Sports & Outdoors": ["sport", "outdoor", "equipment", "gear", "athletic", "ball", "cycle", "hiking"],
-        "Books & Media": ["book", "ebook", "media", "entertainment", "novel", "magazine"],
-        "Toys & Games": ["toy", "game", "educational", "board", "puzzle", "lego", "doll"]
-    }
-
+    """
+    One page of active listings.  Pass the ``X-Next-Cursor`` response header
+    back as ``cursor`` (with the same sort and filters) for the next page; it
+    is absent on the last page.  Sorts: newest, price_asc, price_desc, most_viewed.
+    ``view=card`` or ``fields=a,b`` return a projection (see projections.py).
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    # Pages span many rows: tag them with the generations of the tables they read.
+    # View counts only count when they decide the order (etags.VIEWS_GENERATION)
+    tables = etags.LISTING_TABLES + ((etags.VIEWS_GENERATION,) if sort == "most_viewed" else ())
+    etag = etags.weak("listings", etags.generations(db, tables), str(request.query_params))
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+    print(f"--> API REQUEST: Fetching listings (sort={sort}, cursor={'yes' if cursor else 'no'}, limit={limit}, cat={category}, min={min_price}, max={max_price})", flush=True)
+    
     try:
-        query = db.query(models.Listing).options(joinedload(models.Listing.owner)).filter(models.Listing.is_active == True)  # noqa: E712
+        projection = projections.resolve_fields(view, fields)
+        if projection is None:
+            # Keys only; the payloads come pre-rendered from listing_render.py
+            query = db.query(
+                models.Listing.id, models.Listing.version, models.Listing.views_count, models.Listing.price
+            )
+        else:
+            query = db.query(models.Listing).options(*projections.load_options(projection))
+        query = query.filter(models.Listing.is_active == True)  # noqa: E712
         
         if category:
-            # Smart Filter: Match exact category OR check if title contains related keywords
-            keywords = CATEGORY_KEYWORDS.get(category, [])
-            from sqlalchemy import or_
-            
-            conditions = [models.Listing.category == category]
-            for kw in keywords:
-                # Case-insensitive title search for keywords
-                conditions.append(models.Listing.title.ilike(f"%{kw}%"))
-                conditions.append(models.Listing.description.ilike(f"%{kw}%"))
-            
-            query = query.filter(or_(*conditions))
-        
+            # Declared category or keyword/centroid match, precomputed by categorizer.py
+            from .categorizer import in_category
+            query = query.filter(in_category(category))
+
         if min_price is not None:
             query = query.filter(models.Listing.price >= min_price)
             
         if max_price is not None:
             query = query.filter(models.Listing.price <= max_price)
 
-        items = query.offset(skip).limit(limit).all()
-        print(f"--> SUCCESS: Found {len(items)} listings for category '{category}'", flush=True)
-        return items
+        rows, next_cursor = keyset_page(query, sort, cursor, limit)
+        if projection is None:
+            body = listing_renderer.render_rows(db, [(r.id, r.version, r.views_count) for r in rows])
+        else:
+            body = projections.render(rows, projection)
+        print(f"--> SUCCESS: Found {len(rows)} listings for category '{category}'", flush=True)
+        return Response(
+            content=body, media_type="application/json",
+            headers=etags.headers(etag, {"X-Next-Cursor": next_cursor} if next_cursor else None),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         print(f"!!! ERROR in list_listings:\n{traceback.format_exc()}", flush=True)
@@ -753,7 +850,7 @@ def get_price_estimate(
 
     # Use a high threshold (0.65+) to ensure we are actually looking at similar products
     # logic: if user types "iPhone 15", we want to match "iPhone 15 Pro", "iPhone 15 128GB"
-    results = semantic_search(query=title, db=db, top_k=10, min_score=0.65)
+    results = semantic_search(query=title, db=db, top_k=10, min_score=0.65, source="price_estimate")
     
     if not results:
         return {
@@ -778,56 +875,114 @@ def get_price_estimate(
 
 @app.get("/listings/me", response_model=list[schemas.Listing])
 def list_my_listings(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
     """Fetch listings belonging to the current user."""
-    return db.query(models.Listing).filter(models.Listing.owner_id == current_user.id).all()
+    rows = db.query(models.Listing.id, models.Listing.version, models.Listing.views_count).filter(
+        models.Listing.owner_id == current_user.id
+    ).order_by(models.Listing.id).all()
+    return _listing_rows_response(request, db, ("my-listings", current_user.id), rows)
+
+
+@app.get("/listings/batch", response_model=list[schemas.Listing])
+def get_listings_batch(
+    ids: str,
+    request: Request,
+    view: str = "full",
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Several listings by id (``ids=12,7,31``, at most MAX_BATCH_IDS) in the
+    order given; unknown ids are skipped.  For hydrating wishlists, chat cards
+    and recommendation strips — unlike GET /listings/{id} it records no views.
+    """
+    from .activity_buffer import activity_buffer
+    from .queries import parse_id_list
+
+    listing_ids = parse_id_list(ids)
+    projection = projections.resolve_fields(view, fields)
+    if not listing_ids:
+        return Response(content=b"[]", media_type="application/json")
+
+    if projection is not None:
+        etag = etags.weak("batch", etags.generations(db, etags.LISTING_TABLES), listing_ids, projection)
+        if etags.matches(request, etag):
+            return etags.not_modified(etag)
+        found = db.query(models.Listing).options(*projections.load_options(projection)).filter(
+            models.Listing.id.in_(listing_ids)
+        ).all()
+        by_id = {l.id: l for l in found}
+        body = projections.render([by_id[i] for i in listing_ids if i in by_id], projection)
+        return Response(content=body, media_type="application/json", headers=etags.headers(etag))
+
+    found = db.query(models.Listing.id, models.Listing.version, models.Listing.views_count).filter(
+        models.Listing.id.in_(listing_ids)
+    ).all()
+    by_id = {r.id: r for r in found}
+    rows = [
+        (i, by_id[i].version, (by_id[i].views_count or 0) + activity_buffer.pending_views(i))
+        for i in listing_ids if i in by_id
+    ]
+    return _listing_rows_response(request, db, ("batch",), rows)
 
 
 @app.get("/listings/{listing_id}", response_model=schemas.Listing)
 def get_listing(
     listing_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: Optional[models.User] = Depends(get_current_user_optional),
 ):
-    listing = db.query(models.Listing).options(joinedload(models.Listing.owner)).filter(models.Listing.id == listing_id).first()
-    if not listing:
-        raise HTTPException(status_code=404, detail="Listing not found")
+    # Hot listings are answered from this worker's detail cache (entity_cache.py);
+    # otherwise version columns first, so the ETag is settled before any full load
+    detail = listing_details.get(listing_id)
+    if detail is None:
+        head = db.query(models.Listing.version, models.Listing.views_count, models.Listing.owner_id).filter(
+            models.Listing.id == listing_id
+        ).first()
+        if not head:
+            raise HTTPException(status_code=404, detail="Listing not found")
+        detail = listing_details.put(listing_id, head.version, head.views_count, head.owner_id)
     
     # --- FEATURE: VIEW TRACKING (LinkedIn/Insta Style) ---
-    # We increment views for everyone EXCEPT the owner themselves to keep stats honest
-    if not current_user or current_user.id != listing.owner_id:
-        listing.views_count = (listing.views_count or 0) + 1
-        try:
-            db.commit() # Save the new count immediately
-            db.refresh(listing)
-        except:
-            db.rollback()
-
-    # --- STAGE 2: IMPLICIT SIGNAL (VIEW) ---
-    if current_user:
-        try:
-            # We don't want to fail the request if logging fails
-            view_act = models.UserActivity(
-                user_id=current_user.id,
-                listing_id=listing_id,
-                activity_type="view",
-                weight=1.0
-            )
-            db.add(view_act)
-            db.commit()
-        except Exception as e:
-            print(f"!!! Failed to log view activity: {e}")
-            db.rollback()
-
-    return listing
+    # We increment views for everyone EXCEPT the owner themselves to keep stats honest.
+    # --- STAGE 2: IMPLICIT SIGNAL (VIEW) for signed-in users ---
+    # Both are write-behind (activity_buffer.py) so reads don't turn into commits.
+    # Refreshes within VIEW_DEDUPE_WINDOW_S are not counted again (view_dedupe.py).
+    from .activity_buffer import activity_buffer
+    from .view_dedupe import client_ip, recent_views, viewer_key
+    viewer = viewer_key(
+        current_user.id if current_user else None,
+        client_ip(request.client.host if request.client else None, request.headers.get("x-forwarded-for")),
+        request.headers.get("user-agent"),
+    )
+    if not recent_views.seen_recently(viewer, listing_id):
+        count_view = not current_user or current_user.id != detail.owner_id
+        activity_buffer.record_view(listing_id, current_user.id if current_user else None, count_view)
+
+    # Show the count including views still waiting in the buffer (not persisted here)
+    views = detail.views_count + activity_buffer.pending_views(listing_id)
+    etag = etags.strong("listing", listing_id, detail.version, views)
+    if etags.matches(request, etag):
+        return etags.not_modified(etag)
+
+    if detail.fragment is None:
+        detail.fragment = listing_renderer.fragment_for(db, listing_id, detail.version)
+        if detail.fragment is None:
+            listing_details.invalidate([listing_id])
+            raise HTTPException(status_code=404, detail="Listing not found")
+    body = listing_renderer.assemble(detail.fragment, views)
+    return Response(content=body, media_type="application/json", headers=etags.headers(etag))
 
 
 @app.put("/listings/{listing_id}", response_model=schemas.Listing)
 def update_listing(
     listing_id: int,
     payload: schemas.ListingCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
@@ -846,7 +1001,9 @@ def update_listing(
             setattr(listing, key, value)
 
         # Update images: Simple approach - remove old and add new
-        db.query(models.ProductImage).filter(models.ProductImage.listing_id == listing_id).delete()
+        # (through the ORM, so the flush hooks see the removed images)
+        for old_image in list(listing.images):
+            db.delete(old_image)
         for url in image_urls:
             product_image = models.ProductImage(url=url, listing_id=listing.id)
             db.add(product_image)
@@ -855,10 +1012,28 @@ def update_listing(
         db.refresh(listing)
         
         try:
-            invalidate_listing(listing_id)
+            invalidate_listing(listing_id, listing)
         except:
             pass
-            
+
+        try:
+            from .dedupe import flag_duplicate
+            flag_duplicate(db, listing)
+        except Exception as dedup_err:
+            print(f"!!! WARNING: Duplicate check failed: {dedup_err}", flush=True)
+            db.rollback()
+
+        from .neighbors import update_listing_task
+        background_tasks.add_task(update_listing_task, listing.id)
+
+        try:
+            from .categorizer import assign_categories
+            assign_categories(db, listing)
+        except Exception as cat_err:
+            print(f"!!! WARNING: Category assignment failed: {cat_err}", flush=True)
+            db.rollback()
+
+        listing_details.invalidate([listing.id])
         return listing
     except Exception as e:
         import traceback
@@ -881,13 +1056,24 @@ def delete_listing(
             raise HTTPException(status_code=403, detail="Not authorized to delete this listing")
 
         lid = listing.id
+        from .neighbors import remove_listing
+        remove_listing(db, lid)
         db.delete(listing)
         db.commit()
+        listing_renderer.invalidate(lid)
+        listing_details.invalidate([lid])
         
         try:
             invalidate_listing(lid)
         except Exception as cache_err:
             print(f"!!! WARNING: Cache invalidation failed: {cache_err}", flush=True)
+
+        try:
+            from .dedupe import release_cluster
+            release_cluster(db, lid)
+        except Exception as dedup_err:
+            print(f"!!! WARNING: Duplicate cluster cleanup failed: {dedup_err}", flush=True)
+            db.rollback()
             
         return {"status": "ok", "message": "Listing deleted"}
     except Exception as e:
@@ -936,6 +1122,7 @@ def add_to_wishlist(
         weight=5.0
     )
     db.add(wish_act)
+    record_interest(db, current_user.id, listing_id, wish_act.weight)
 
     db.commit()
     db.refresh(wish_item)
@@ -947,7 +1134,9 @@ def get_wishlist(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    return db.query(models.WishlistItem).filter(models.WishlistItem.user_id == current_user.id).all()
+    return db.query(models.WishlistItem).options(
+        *listing_load_options(selectinload(models.WishlistItem.listing))
+    ).filter(models.WishlistItem.user_id == current_user.id).all()
 
 
 @app.delete("/wishlist/{listing_id}")
@@ -968,6 +1157,113 @@ def remove_from_wishlist(
     return {"status": "ok", "message": "Removed from wishlist"}
 
 
+# ──────────────────────────────────────────────────────────────────────
+# Saved Search Endpoints
+# ──────────────────────────────────────────────────────────────────────
+
+def _saved_search_out(saved: models.SavedSearch) -> schemas.SavedSearch:
+    import json
+    return schemas.SavedSearch(
+        id=saved.id,
+        user_id=saved.user_id,
+        query=saved.query,
+        category=saved.category,
+        city=saved.city,
+        min_price=saved.min_price,
+        max_price=saved.max_price,
+        terms=json.loads(saved.terms or "[]"),
+        created_at=saved.created_at,
+    )
+
+
+@app.post("/saved-searches", response_model=schemas.SavedSearch, status_code=status.HTTP_201_CREATED)
+def create_saved_search(
+    payload: schemas.SavedSearchCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    import json
+    from .percolator import parse_terms, percolator
+
+    terms = parse_terms(payload.query)
+    if not terms and not (payload.category or payload.city):
+        raise HTTPException(status_code=400, detail="A saved search needs a query, a category or a city")
+
+    saved = models.SavedSearch(
+        user_id=current_user.id,
+        query=payload.query.strip(),
+        terms=json.dumps(terms),
+        category=payload.category,
+        city=payload.city,
+        min_price=payload.min_price,
+        max_price=payload.max_price,
+    )
+    db.add(saved)
+    db.commit()
+    db.refresh(saved)
+
+    percolator.ensure_loaded(db)
+    percolator.add(saved)
+    return _saved_search_out(saved)
+
+
+@app.get("/saved-searches", response_model=List[schemas.SavedSearch])
+def list_saved_searches(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    saved = db.query(models.SavedSearch).filter(models.SavedSearch.user_id == current_user.id).all()
+    return [_saved_search_out(s) for s in saved]
+
+
+@app.delete("/saved-searches/{saved_search_id}")
+def delete_saved_search(
+    saved_search_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    from .percolator import percolator
+
+    saved = db.query(models.SavedSearch).filter(
+        models.SavedSearch.id == saved_search_id,
+        models.SavedSearch.user_id == current_user.id
+    ).first()
+    if not saved:
+        raise HTTPException(status_code=404, detail="Saved search not found")
+
+    db.delete(saved)
+    db.commit()
+    percolator.remove(saved_search_id)
+    return {"status": "ok", "message": "Saved search deleted"}
+
+
+@app.get("/saved-searches/matches", response_model=List[schemas.SavedSearchMatch])
+def get_saved_search_matches(
+    unseen_only: bool = False,
+    mark_seen: bool = True,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Poll for new-listing alerts (the WebSocket pushes the same events live)."""
+    query = db.query(models.SavedSearchMatch).options(
+        *listing_load_options(joinedload(models.SavedSearchMatch.listing))
+    ).filter(models.SavedSearchMatch.user_id == current_user.id)
+    if unseen_only:
+        query = query.filter(models.SavedSearchMatch.is_seen == False)  # noqa: E712
+    matches = query.order_by(models.SavedSearchMatch.id.desc()).limit(100).all()
+    # Serialise before marking, so this response still shows what was new
+    results = [schemas.SavedSearchMatch.model_validate(m) for m in matches]
+
+    if mark_seen:
+        unseen_ids = [m.id for m in matches if not m.is_seen]
+        if unseen_ids:
+            db.query(models.SavedSearchMatch).filter(
+                models.SavedSearchMatch.id.in_(unseen_ids)
+            ).update({"is_seen": True}, synchronize_session=False)
+            db.commit()
+    return results
+
+
 # ──────────────────────────────────────────────────────────────────────
 # Order Endpoints
 # ──────────────────────────────────────────────────────────────────────
@@ -977,7 +1273,9 @@ def checkout_wishlist(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    wish_items = db.query(models.WishlistItem).filter(models.WishlistItem.user_id == current_user.id).all()
+    wish_items = db.query(models.WishlistItem).options(joinedload(models.WishlistItem.listing)).filter(
+        models.WishlistItem.user_id == current_user.id
+    ).all()
     if not wish_items:
         raise HTTPException(status_code=400, detail="Wishlist is empty")
     
@@ -999,8 +1297,12 @@ def checkout_wishlist(
         db.delete(item)
     
     db.commit()
-    db.refresh(order)
-    return order
+
+    # New co-purchase signal: refresh "frequently bought together" (debounced)
+    from .cooccurrence import schedule_rebuild
+    schedule_rebuild()
+
+    return db.query(models.Order).options(*order_load_options()).filter(models.Order.id == order.id).one()
 
 
 @app.get("/orders", response_model=List[schemas.Order])
@@ -1008,10 +1310,7 @@ def get_orders(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    from sqlalchemy.orm import joinedload
-    return db.query(models.Order).options(
-        joinedload(models.Order.items).joinedload(models.OrderItem.listing).joinedload(models.Listing.images)
-    ).filter(models.Order.user_id == current_user.id).all()
+    return db.query(models.Order).options(*order_load_options()).filter(models.Order.user_id == current_user.id).all()
 
 
 @app.get("/sales", response_model=List[schemas.Order])
@@ -1020,9 +1319,8 @@ def get_sales(
     current_user: models.User = Depends(get_current_user),
 ):
     """Fetch orders where the current user is the seller of at least one item."""
-    from sqlalchemy.orm import joinedload
     return db.query(models.Order).join(models.OrderItem).join(models.Listing).options(
-        joinedload(models.Order.items).joinedload(models.OrderItem.listing).joinedload(models.Listing.images)
+        *order_load_options()
     ).filter(
         models.Listing.owner_id == current_user.id
     ).distinct().all()
@@ -1089,9 +1387,14 @@ def request_buy(
         weight=15.0
     )
     db.add(buy_act)
+    record_interest(db, current_user.id, listing_id, buy_act.weight)
 
     db.commit()
     db.refresh(order)
+
+    # New co-purchase signal: refresh "frequently bought together" (debounced)
+    from .cooccurrence import schedule_rebuild
+    schedule_rebuild()
     
     return order
 
@@ -1257,34 +1560,69 @@ def search_listings(
     q: str,
     top_k: int = 100,
     min_score: float = 0.35,
+    city: Optional[str] = None,
+    category: Optional[str] = None,
+    facets: bool = False,
+    collapse_duplicates: bool = False,
+    diversify: bool = False,
+    view: str = "full",
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
     from .search_engine import semantic_search
-    results_raw = semantic_search(query=q, db=db, top_k=top_k, min_score=min_score)
-    
-    # Map to schema
-    formatted_results = []
+    projection = projections.resolve_fields(view, fields)
+    search_out = semantic_search(
+        query=q, db=db, top_k=top_k, min_score=min_score, city=city, category=category,
+        source="api", facets=facets, collapse_duplicates=collapse_duplicates, diversify=diversify,
+    )
+    results_raw, facet_counts = search_out if facets else (search_out, None)
+
+    # Assemble the body from pre-rendered listing fragments (listing_render.py)
+    results_json = []
     for r in results_raw:
         try:
-            # We need to validate the listing model into a schema
-            lst_schema = schemas.Listing.model_validate(r["listing"])
-            formatted_results.append(schemas.SearchResult(
-                listing=lst_schema,
-                score=r["score"],
-                dense=r.get("dense"),
-                bm25=r.get("bm25"),
-                prefix=r.get("prefix"),
-                match_type=r.get("match_type")
-            ))
+            extras = {
+                "score": r["score"], "dense": r.get("dense"), "bm25": r.get("bm25"),
+                "prefix": r.get("prefix"), "match_type": r.get("match_type"), "snippet": r.get("snippet"),
+            }
+            if projection is None:
+                listing_json = listing_renderer.render_listing(r["listing"])
+            else:
+                listing_json = projections.render_one(r["listing"], projection)
+            results_json.append(b'{"listing":' + listing_json + b"," + json.dumps(extras)[1:].encode("utf-8"))
         except Exception as e:
             print(f"Validation error for search result: {e}")
             continue
 
-    return schemas.SearchResponse(
-        query=q,
-        total=len(formatted_results),
-        results=formatted_results
+    facets_json = schemas.SearchFacets.model_validate(facet_counts).model_dump_json() if facet_counts is not None else "null"
+    body = (
+        b'{"query":' + json.dumps(q).encode("utf-8")
+        + b',"total":' + str(len(results_json)).encode("ascii")
+        + b',"results":[' + b",".join(results_json) + b"]"
+        + b',"facets":' + facets_json.encode("utf-8") + b"}"
     )
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/activities/buffer/stats")
+def get_activity_buffer_stats():
+    """Write-behind view/activity buffer and view-dedupe counters for this worker."""
+    from .activity_buffer import activity_buffer
+    from .view_dedupe import recent_views
+    return {**activity_buffer.stats(), "dedupe": recent_views.stats()}
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Listing detail and rendered-fragment cache counters for this worker."""
+    return {"listing_details": listing_details.stats(), "listing_render": listing_renderer.stats()}
+
+
+@app.get("/search/stats")
+def get_search_stats():
+    """Index size and single-flight coalescing counters for this worker."""
+    from .search_engine import search_stats
+    return search_stats()
 
 
 # ──────────────────────────────────────────────────────────────────────
@@ -1297,7 +1635,7 @@ def get_exchange_matches(
     current_user: models.User = Depends(get_current_user),
 ):
     """Find exchange matches for the current user's exchangeable listings."""
-    my_listings = db.query(models.Listing).options(joinedload(models.Listing.owner)).filter(
+    my_listings = db.query(models.Listing).options(*listing_load_options()).filter(
         models.Listing.owner_id == current_user.id,
         models.Listing.is_active == True,
         models.Listing.accept_exchange == True
@@ -1311,7 +1649,9 @@ def get_exchange_matches(
             continue
             
         # Search all active listings using the exchange_preferences as the query
-        candidates_raw = semantic_search(query=ml.exchange_preferences, db=db, top_k=50, min_score=0.25)
+        candidates_raw = semantic_search(
+            query=ml.exchange_preferences, db=db, top_k=50, min_score=0.25, source="exchange_matches"
+        )
         
         valid_matches = []
         for c in candidates_raw:
@@ -1347,7 +1687,7 @@ def get_exchange_chains(
     Me (Listing A) -> User X (Listing B) -> User Y (Listing C)
     Where Listing C matches what Me (Listing A) wants.
     """
-    my_listings = db.query(models.Listing).options(joinedload(models.Listing.owner)).filter(
+    my_listings = db.query(models.Listing).options(*listing_load_options()).filter(
         models.Listing.owner_id == current_user.id,
         models.Listing.is_active == True,
         models.Listing.accept_exchange == True
@@ -1357,7 +1697,7 @@ def get_exchange_chains(
         return []
 
     # Get all active exchangeable listings NOT belonging to current user
-    all_other_listings = db.query(models.Listing).options(joinedload(models.Listing.owner)).filter(
+    all_other_listings = db.query(models.Listing).options(*listing_load_options()).filter(
         models.Listing.owner_id != current_user.id,
         models.Listing.is_active == True,
         models.Listing.accept_exchange == True
@@ -1423,20 +1763,33 @@ def get_exchange_chains(
 # Recommendation Endpoints
 # ──────────────────────────────────────────────────────────────────────
 
+def _render_listing_list(listings: List[models.Listing], projection) -> bytes:
+    if projection is None:
+        return listing_renderer.render_listings(listings)
+    return projections.render(listings, projection)
+
+
 @app.get("/recommendations/personalized", response_model=List[schemas.Listing])
 def get_personalized_recommendations(
+    view: str = "full",
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Optional[models.User] = Depends(get_current_user_optional),
 ):
     """Fetch personalized recommendations for the logged-in user."""
+    projection = projections.resolve_fields(view, fields)
     if not current_user:
         return []
     from .recommendation import get_user_profile_recommendations
-    return get_user_profile_recommendations(db, current_user.id)
+    listings = get_user_profile_recommendations(db, current_user.id)
+    return Response(content=_render_listing_list(listings, projection), media_type="application/json")
 
 @app.get("/listings/{listing_id}/recommendations", response_model=schemas.RecommendationResponse)
 def get_listing_recommendations(
     listing_id: int,
+    background_tasks: BackgroundTasks,
+    view: str = "full",
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Optional[models.User] = Depends(get_current_user_optional), # Corrected to optional
 ):
@@ -1451,19 +1804,27 @@ def get_listing_recommendations(
         get_frequently_brought_together,
         get_visually_similar_listings
     )
+    projection = projections.resolve_fields(view, fields)
     
     fbt = get_frequently_brought_together(db, listing_id)
-    visual = get_visually_similar_listings(db, listing_id)
+    visual = get_visually_similar_listings(db, listing_id, background_tasks=background_tasks)
     
     personalized = []
     if current_user:
         personalized = get_user_profile_recommendations(db, current_user.id, top_k=5)
     
-    return schemas.RecommendationResponse(
-        user_recommendations=personalized,
-        frequently_bought_together=fbt,
-        visually_similar=visual
+    if projection is None:
+        return schemas.RecommendationResponse(
+            user_recommendations=personalized,
+            frequently_bought_together=fbt,
+            visually_similar=visual
+        )
+    body = (
+        b'{"user_recommendations":' + _render_listing_list(personalized, projection)
+        + b',"frequently_bought_together":' + _render_listing_list(fbt, projection)
+        + b',"visually_similar":' + _render_listing_list(visual, projection) + b"}"
     )
+    return Response(content=body, media_type="application/json")
 
 
 # ──────────────────────────────────────────────────────────────────────
@@ -1483,6 +1844,7 @@ def log_activity(
         weight=payload.weight
     )
     db.add(activity)
+    record_interest(db, current_user.id, payload.listing_id, activity.weight)
     db.commit()
     db.refresh(activity)
     return activity
@@ -1516,7 +1878,11 @@ def get_user_reviews(
     user_id: int,
     db: Session = Depends(get_db)
 ):
-    reviews = db.query(models.Review).filter(models.Review.reviewee_id == user_id).order_by(models.Review.created_at.desc()).all()
+    reviews = db.query(models.Review).options(
+        *listing_load_options(
+            joinedload(models.Review.order).selectinload(models.Order.items).joinedload(models.OrderItem.listing)
+        )
+    ).filter(models.Review.reviewee_id == user_id).order_by(models.Review.created_at.desc()).all()
     # Manual date formatting since schema expects string
     for r in reviews:
         r.created_at = r.created_at.isoformat()
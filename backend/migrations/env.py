@@ -0,0 +1,50 @@
+"""
+Alembic environment for the backend database.
+
+The revisions own the schema: 0000_baseline creates every table, later
+ones add columns, indexes and keys, and ``alembic downgrade base`` drops it
+all again.  The app still calls ``create_all`` at import for development
+databases; every revision checks the live schema (or uses IF NOT EXISTS), so
+a database created that way upgrades through them without changes.
+
+    alembic upgrade head                   # from the project root
+    alembic upgrade head --sql             # DDL for an empty database
+    GET /migrate                           # same as the first, from the running app
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+
+from backend import chat_models, models  # noqa: F401  (register every table on Base.metadata)
+from backend.database import SQLALCHEMY_DATABASE_URL, Base, engine
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logging", True):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=SQLALCHEMY_DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,357 @@
+"""Baseline schema
+
+Revision ID: 0000_baseline
+Revises:
+Create Date: 2026-10-19
+
+Every table as it stood before the first migration: the later revisions
+add columns and indexes on top of this.  Tables and indexes are created
+with IF NOT EXISTS, so a database that already has them (created by the
+app's ``create_all`` or by an older deployment) is left as it is, and
+``alembic upgrade head --sql`` renders the complete schema for an empty one.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0000_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Creation order (referenced tables first); downgrade drops in reverse
+TABLES = [
+    "otps",
+    "table_generations",
+    "users",
+    "community_vouches",
+    "follows",
+    "listings",
+    "orders",
+    "saved_searches",
+    "user_interests",
+    "conversations",
+    "disputes",
+    "listing_categories",
+    "listing_neighbors",
+    "order_items",
+    "product_images",
+    "reviews",
+    "saved_search_matches",
+    "user_activities",
+    "user_listing_daily",
+    "wishlist_items",
+    "image_embeddings",
+    "messages",
+]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "otps",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("otp", sa.String(), nullable=False),
+        sa.Column("created_at", sa.Integer(), nullable=False),
+        sa.Column("expires_at", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_otps_email", "otps", ["email"], if_not_exists=True)
+    op.create_index("ix_otps_id", "otps", ["id"], if_not_exists=True)
+    op.create_table(
+        "table_generations",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("generation", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("phone", sa.String(), nullable=True),
+        sa.Column("profile_image_url", sa.String(), nullable=True),
+        sa.Column("is_verified", sa.Boolean(), nullable=True),
+        sa.Column("trust_score", sa.Float(), nullable=True),
+        sa.Column("successful_trades_count", sa.Integer(), nullable=True),
+        sa.Column("community_vouches_count", sa.Integer(), nullable=True),
+        sa.Column("has_active_disputes", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_users_email", "users", ["email"], unique=True, if_not_exists=True)
+    op.create_index("ix_users_id", "users", ["id"], if_not_exists=True)
+    op.create_table(
+        "community_vouches",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("vouter_id", sa.Integer(), nullable=True),
+        sa.Column("voutee_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["voutee_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["vouter_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_community_vouches_id", "community_vouches", ["id"], if_not_exists=True)
+    op.create_table(
+        "follows",
+        sa.Column("follower_id", sa.Integer(), nullable=False),
+        sa.Column("followed_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["followed_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["follower_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("follower_id", "followed_id"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "listings",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("description", sa.Text(), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+        sa.Column("category", sa.String(), nullable=True),
+        sa.Column("city", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("views_count", sa.Integer(), nullable=True),
+        sa.Column("accept_exchange", sa.Boolean(), nullable=True),
+        sa.Column("exchange_preferences", sa.Text(), nullable=True),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["owner_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_listings_category", "listings", ["category"], if_not_exists=True)
+    op.create_index("ix_listings_city", "listings", ["city"], if_not_exists=True)
+    op.create_index("ix_listings_id", "listings", ["id"], if_not_exists=True)
+    op.create_index("ix_listings_title", "listings", ["title"], if_not_exists=True)
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("total_amount", sa.Float(), nullable=False),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_orders_id", "orders", ["id"], if_not_exists=True)
+    op.create_table(
+        "saved_searches",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("query", sa.String(), nullable=False),
+        sa.Column("terms", sa.Text(), nullable=False),
+        sa.Column("category", sa.String(), nullable=True),
+        sa.Column("city", sa.String(), nullable=True),
+        sa.Column("min_price", sa.Float(), nullable=True),
+        sa.Column("max_price", sa.Float(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_saved_searches_id", "saved_searches", ["id"], if_not_exists=True)
+    op.create_index("ix_saved_searches_user_id", "saved_searches", ["user_id"], if_not_exists=True)
+    op.create_table(
+        "user_interests",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("vector", sa.LargeBinary(), nullable=False),
+        sa.Column("total_weight", sa.Float(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "conversations",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("listing_id", sa.Integer(), nullable=False),
+        sa.Column("buyer_id", sa.Integer(), nullable=False),
+        sa.Column("seller_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["buyer_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.ForeignKeyConstraint(["seller_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_conversation_buyer_seller_listing", "conversations", ["buyer_id", "seller_id", "listing_id"], unique=True, if_not_exists=True)
+    op.create_index("ix_conversations_id", "conversations", ["id"], if_not_exists=True)
+    op.create_table(
+        "disputes",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("order_id", sa.Integer(), nullable=True),
+        sa.Column("complainant_id", sa.Integer(), nullable=True),
+        sa.Column("accused_id", sa.Integer(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("reason", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["accused_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["complainant_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["order_id"], ["orders.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_disputes_id", "disputes", ["id"], if_not_exists=True)
+    op.create_table(
+        "listing_categories",
+        sa.Column("listing_id", sa.Integer(), nullable=False),
+        sa.Column("category", sa.String(), nullable=False),
+        sa.Column("source", sa.String(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.PrimaryKeyConstraint("listing_id", "category"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_listing_categories_category_listing", "listing_categories", ["category", "listing_id"], if_not_exists=True)
+    op.create_table(
+        "listing_neighbors",
+        sa.Column("listing_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("rank", sa.Integer(), nullable=False),
+        sa.Column("neighbor_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.ForeignKeyConstraint(["neighbor_id"], ["listings.id"]),
+        sa.PrimaryKeyConstraint("listing_id", "kind", "rank"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "order_items",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("order_id", sa.Integer(), nullable=True),
+        sa.Column("listing_id", sa.Integer(), nullable=True),
+        sa.Column("price_at_order", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.ForeignKeyConstraint(["order_id"], ["orders.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_order_items_id", "order_items", ["id"], if_not_exists=True)
+    op.create_table(
+        "product_images",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.Column("listing_id", sa.Integer(), nullable=True),
+        sa.Column("quality_score", sa.Float(), nullable=True),
+        sa.Column("ai_feedback", sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_product_images_id", "product_images", ["id"], if_not_exists=True)
+    op.create_table(
+        "reviews",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("order_id", sa.Integer(), nullable=True),
+        sa.Column("reviewer_id", sa.Integer(), nullable=True),
+        sa.Column("reviewee_id", sa.Integer(), nullable=True),
+        sa.Column("rating", sa.Integer(), nullable=False),
+        sa.Column("comment", sa.Text(), nullable=True),
+        sa.Column("media_url", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["order_id"], ["orders.id"]),
+        sa.ForeignKeyConstraint(["reviewee_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["reviewer_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_reviews_id", "reviews", ["id"], if_not_exists=True)
+    op.create_table(
+        "saved_search_matches",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("saved_search_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("listing_id", sa.Integer(), nullable=False),
+        sa.Column("is_seen", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.ForeignKeyConstraint(["saved_search_id"], ["saved_searches.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_saved_search_matches_id", "saved_search_matches", ["id"], if_not_exists=True)
+    op.create_index("ix_saved_search_matches_saved_search_id", "saved_search_matches", ["saved_search_id"], if_not_exists=True)
+    op.create_index("ix_saved_search_matches_user_id", "saved_search_matches", ["user_id"], if_not_exists=True)
+    op.create_table(
+        "user_activities",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("listing_id", sa.Integer(), nullable=True),
+        sa.Column("activity_type", sa.String(), nullable=True),
+        sa.Column("weight", sa.Float(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_user_activities_id", "user_activities", ["id"], if_not_exists=True)
+    op.create_table(
+        "user_listing_daily",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("listing_id", sa.Integer(), nullable=False),
+        sa.Column("activity_type", sa.String(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("events", sa.Integer(), nullable=False),
+        sa.Column("weight", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "listing_id", "activity_type", "day"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_user_listing_daily_listing_id", "user_listing_daily", ["listing_id"], if_not_exists=True)
+    op.create_table(
+        "wishlist_items",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("listing_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_wishlist_items_id", "wishlist_items", ["id"], if_not_exists=True)
+    op.create_table(
+        "image_embeddings",
+        sa.Column("image_id", sa.Integer(), nullable=False),
+        sa.Column("encoder", sa.String(), nullable=False),
+        sa.Column("listing_id", sa.Integer(), nullable=False),
+        sa.Column("source_url", sa.String(), nullable=False),
+        sa.Column("content_hash", sa.String(), nullable=False),
+        sa.Column("vector", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["image_id"], ["product_images.id"]),
+        sa.ForeignKeyConstraint(["listing_id"], ["listings.id"]),
+        sa.PrimaryKeyConstraint("image_id"),   # (image_id, encoder) from 0003 on
+        if_not_exists=True,
+    )
+    op.create_index("ix_image_embeddings_content_hash", "image_embeddings", ["content_hash"], if_not_exists=True)
+    op.create_index("ix_image_embeddings_listing_id", "image_embeddings", ["listing_id"], if_not_exists=True)
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("conversation_id", sa.Integer(), nullable=False),
+        sa.Column("sender_id", sa.Integer(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=True),
+        sa.Column("is_read", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["conversation_id"], ["conversations.id"]),
+        sa.ForeignKeyConstraint(["sender_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_messages_conversation_id", "messages", ["conversation_id"], if_not_exists=True)
+    op.create_index("ix_messages_created_at", "messages", ["created_at"], if_not_exists=True)
+    op.create_index("ix_messages_id", "messages", ["id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.drop_table(table, if_exists=True)
@@ -0,0 +1,83 @@
+"""Columns and indexes previously added by GET /migrate
+
+Revision ID: 0001_legacy_migrate
+Revises: 0000_baseline
+Create Date: 2026-10-19
+
+Columns are only added when the live table lacks them and indexes use IF
+NOT EXISTS, so databases that already ran the old endpoint (or were created
+from the current models) get no schema changes; the views_count backfill
+only touches NULL rows.  Offline (``--sql``) there is no live schema to
+check, and the shape left by 0000_baseline is assumed.
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0001_legacy_migrate"
+down_revision = "0000_baseline"
+branch_labels = None
+depends_on = None
+
+
+def _columns(table: str) -> set:
+    if context.is_offline_mode():
+        return set()   # rendering SQL on top of 0000_baseline: none of these columns exist yet
+    return {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _add_column(table: str, column: sa.Column, references: str = None) -> bool:
+    if column.name in _columns(table):
+        return False
+    if references:
+        # SQLite only takes a foreign key inline in ADD COLUMN; op.add_column would emit it as a separate ALTER
+        op.execute(f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type} REFERENCES {references}")
+    else:
+        op.add_column(table, column)
+    if not context.is_offline_mode():
+        print(f"Migration: Added {table}.{column.name}", flush=True)
+    return True
+
+
+def upgrade() -> None:
+    # Chat delivery state and attachments
+    _add_column("messages", sa.Column("is_delivered", sa.Boolean(), server_default=sa.text("0")))
+    for name in ("attachment_url", "attachment_type", "attachment_public_id"):
+        _add_column("messages", sa.Column(name, sa.String()))
+
+    # Near-duplicate cluster pointer (dedupe.py)
+    _add_column("listings", sa.Column("duplicate_of", sa.Integer()), references="listings (id)")
+    op.create_index("ix_listings_duplicate_of", "listings", ["duplicate_of"], if_not_exists=True)
+
+    # Payload versions: pre-rendered listings (listing_render.py) and ETags (etags.py)
+    for table in ("listings", "users", "conversations"):
+        _add_column(table, sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+
+    # First-image URL for card views (projections.py)
+    if _add_column("listings", sa.Column("primary_image_url", sa.String())):
+        op.execute(
+            "UPDATE listings SET primary_image_url = (SELECT url FROM product_images "
+            "WHERE product_images.listing_id = listings.id ORDER BY product_images.id LIMIT 1)"
+        )
+
+    # Keyset pagination for GET /listings (pagination.py)
+    op.execute("UPDATE listings SET views_count = 0 WHERE views_count IS NULL")
+    op.create_index("ix_listings_active_id", "listings", ["is_active", "id"], if_not_exists=True)
+    op.create_index("ix_listings_active_price_id", "listings", ["is_active", "price", "id"], if_not_exists=True)
+    op.create_index("ix_listings_active_views_id", "listings", ["is_active", "views_count", "id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name in ("ix_listings_active_views_id", "ix_listings_active_price_id", "ix_listings_active_id",
+                 "ix_listings_duplicate_of"):
+        op.drop_index(name, table_name="listings", if_exists=True)
+    # SQLite drops columns by rebuilding the table (batch mode)
+    with op.batch_alter_table("listings") as batch:
+        for name in ("primary_image_url", "version", "duplicate_of"):
+            batch.drop_column(name)
+    for table in ("users", "conversations"):
+        with op.batch_alter_table(table) as batch:
+            batch.drop_column("version")
+    with op.batch_alter_table("messages") as batch:
+        for name in ("attachment_public_id", "attachment_type", "attachment_url", "is_delivered"):
+            batch.drop_column(name)
@@ -0,0 +1,47 @@
+"""Composite and partial indexes for the hot query paths
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_legacy_migrate
+Create Date: 2026-10-19
+
+``python -m backend.query_audit`` explains every query of the audited
+endpoints and fails on full table scans; these indexes are what it needs.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_hot_path_indexes"
+down_revision = "0001_legacy_migrate"
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, partial-index WHERE or None)
+INDEXES = [
+    ("ix_listings_live_category_price", "listings", ["category", "price"], "is_active = 1"),
+    ("ix_listings_owner_active_exchange", "listings", ["owner_id", "is_active", "accept_exchange"], None),
+    ("ix_product_images_listing_id", "product_images", ["listing_id", "id"], None),
+    ("ix_follows_followed_follower", "follows", ["followed_id", "follower_id"], None),
+    ("ix_wishlist_items_user_listing", "wishlist_items", ["user_id", "listing_id"], None),
+    ("ix_orders_user_id", "orders", ["user_id"], None),
+    ("ix_order_items_order_id", "order_items", ["order_id"], None),
+    ("ix_order_items_listing_id", "order_items", ["listing_id"], None),
+    ("ix_listing_neighbors_kind_neighbor", "listing_neighbors", ["kind", "neighbor_id"], None),
+    ("ix_reviews_reviewee_created", "reviews", ["reviewee_id", "created_at"], None),
+    ("ix_community_vouches_voutee_id", "community_vouches", ["voutee_id"], None),
+    ("ix_disputes_accused_status", "disputes", ["accused_id", "status"], None),
+    ("ix_conversations_seller_id", "conversations", ["seller_id"], None),
+    ("ix_messages_conversation_created", "messages", ["conversation_id", "created_at"], None),
+    ("ix_messages_unread", "messages", ["conversation_id", "sender_id"], "is_read = 0"),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns, where in INDEXES:
+        kwargs = {"sqlite_where": sa.text(where)} if where else {}
+        op.create_index(name, table, columns, if_not_exists=True, **kwargs)
+
+
+def downgrade() -> None:
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,64 @@
+"""Key image_embeddings by (image_id, encoder)
+
+Revision ID: 0003_image_embeddings_encoder_key
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-19
+
+The table was keyed by image id alone, so vectors from a second encoder
+overwrote the first one's.  SQLite cannot alter a primary key in place; the
+table is rebuilt (rows kept) when its key is still the old one.
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0003_image_embeddings_encoder_key"
+down_revision = "0002_hot_path_indexes"
+branch_labels = None
+depends_on = None
+
+
+def _primary_key() -> list:
+    if context.is_offline_mode():
+        return ["image_id"]   # rendering SQL on top of 0000_baseline
+    return sa.inspect(op.get_bind()).get_pk_constraint("image_embeddings")["constrained_columns"]
+
+
+def _rekey(columns: list) -> None:
+    if _primary_key() == columns:
+        return
+    op.create_table(
+        "_image_embeddings_rekeyed",
+        sa.Column("image_id", sa.Integer(), sa.ForeignKey("product_images.id"), nullable=False),
+        sa.Column("encoder", sa.String(), nullable=False),
+        sa.Column("listing_id", sa.Integer(), sa.ForeignKey("listings.id"), nullable=False),
+        sa.Column("source_url", sa.String(), nullable=False),
+        sa.Column("content_hash", sa.String(), nullable=False),
+        sa.Column("vector", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.PrimaryKeyConstraint(*columns),
+    )
+    op.execute(
+        "INSERT INTO _image_embeddings_rekeyed (image_id, encoder, listing_id, source_url, content_hash, vector, "
+        "created_at) SELECT image_id, encoder, listing_id, source_url, content_hash, vector, created_at "
+        "FROM image_embeddings"
+    )
+    op.drop_table("image_embeddings")
+    op.rename_table("_image_embeddings_rekeyed", "image_embeddings")
+    op.create_index("ix_image_embeddings_listing_id", "image_embeddings", ["listing_id"])
+    op.create_index("ix_image_embeddings_content_hash", "image_embeddings", ["content_hash"])
+    if not context.is_offline_mode():
+        print(f"Migration: image_embeddings keyed by ({', '.join(columns)})", flush=True)
+
+
+def upgrade() -> None:
+    _rekey(["image_id", "encoder"])
+
+
+def downgrade() -> None:
+    # Keeps one vector per image (the lowest encoder name) before narrowing the key
+    op.execute(
+        "DELETE FROM image_embeddings WHERE EXISTS (SELECT 1 FROM image_embeddings AS e "
+        "WHERE e.image_id = image_embeddings.image_id AND e.encoder < image_embeddings.encoder)"
+    )
+    _rekey(["image_id"])
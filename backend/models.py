@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, Float, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import event, select, text, update, Index, Column, Integer, String, Text, Boolean, Float, ForeignKey, DateTime, Date, LargeBinary
+from sqlalchemy.orm import Session, attributes, relationship
 from datetime import datetime
 
 from .database import Base
@@ -7,6 +7,9 @@ from .database import Base
 
 class Follow(Base):
     __tablename__ = "follows"
+    __table_args__ = (
+        Index("ix_follows_followed_follower", "followed_id", "follower_id"),   # followers of a user
+    )
 
     follower_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     followed_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
@@ -30,6 +33,9 @@ class User(Base):
     community_vouches_count = Column(Integer, default=0)
     has_active_disputes = Column(Boolean, default=False)
 
+    # Bumped on every flush that modifies the user (see _bump_user_versions)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
     listings = relationship("Listing", back_populates="owner")
     received_reviews = relationship("Review", back_populates="reviewee", foreign_keys="Review.reviewee_id")
     received_vouches = relationship("CommunityVouch", back_populates="voutee", foreign_keys="CommunityVouch.voutee_id")
@@ -58,6 +64,16 @@ class OTP(Base):
 
 class Listing(Base):
     __tablename__ = "listings"
+    __table_args__ = (
+        # Keyset pagination orders for GET /listings (see pagination.py)
+        Index("ix_listings_active_id", "is_active", "id"),
+        Index("ix_listings_active_price_id", "is_active", "price", "id"),
+        Index("ix_listings_active_views_id", "is_active", "views_count", "id"),
+        # Category browsing and price estimates over live listings only
+        Index("ix_listings_live_category_price", "category", "price", sqlite_where=text("is_active = 1")),
+        # A seller's listings (profile, /listings/me) and their exchangeable ones
+        Index("ix_listings_owner_active_exchange", "owner_id", "is_active", "accept_exchange"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True, nullable=False)
@@ -72,15 +88,29 @@ class Listing(Base):
     accept_exchange = Column(Boolean, default=True)
     exchange_preferences = Column(Text, nullable=True) # Description of what they want in return
 
+    # Near-duplicate cluster root (see dedupe.py); NULL for originals
+    duplicate_of = Column(Integer, ForeignKey("listings.id"), nullable=True, index=True)
+
+    # URL of the first image, for card views (see _refresh_primary_images)
+    primary_image_url = Column(String, nullable=True)
+
+    # Bumped whenever the listing's public payload changes (see _bump_listing_versions)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="listings")
     images = relationship("ProductImage", back_populates="listing", cascade="all, delete-orphan")
     wishlisted_by = relationship("WishlistItem", back_populates="listing", cascade="all, delete-orphan")
     ordered_items = relationship("OrderItem", back_populates="listing", cascade="all, delete-orphan")
+    saved_search_matches = relationship("SavedSearchMatch", back_populates="listing", cascade="all, delete-orphan")
+    category_links = relationship("ListingCategory", cascade="all, delete-orphan")
 
 
 class ProductImage(Base):
     __tablename__ = "product_images"
+    __table_args__ = (
+        Index("ix_product_images_listing_id", "listing_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     url = Column(String, nullable=False)
@@ -95,6 +125,9 @@ class ProductImage(Base):
 
 class WishlistItem(Base):
     __tablename__ = "wishlist_items"
+    __table_args__ = (
+        Index("ix_wishlist_items_user_listing", "user_id", "listing_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -106,6 +139,9 @@ class WishlistItem(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_user_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -119,6 +155,10 @@ class Order(Base):
 
 class OrderItem(Base):
     __tablename__ = "order_items"
+    __table_args__ = (
+        Index("ix_order_items_order_id", "order_id"),
+        Index("ix_order_items_listing_id", "listing_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
@@ -129,8 +169,51 @@ class OrderItem(Base):
     listing = relationship("Listing", back_populates="ordered_items")
 
 
+class ImageEmbedding(Base):
+    """Persisted image vector (see image_embeddings.py), float16 to keep the table compact."""
+    __tablename__ = "image_embeddings"
+
+    image_id = Column(Integer, ForeignKey("product_images.id"), primary_key=True)
+    encoder = Column(String, primary_key=True)   # one vector per image and encoder
+    listing_id = Column(Integer, ForeignKey("listings.id"), index=True, nullable=False)
+    source_url = Column(String, nullable=False)
+    content_hash = Column(String, index=True, nullable=False)  # sha1 of the image bytes
+    vector = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ListingCategory(Base):
+    """Browse-category membership computed at write time (see categorizer.py)."""
+    __tablename__ = "listing_categories"
+    __table_args__ = (
+        Index("ix_listing_categories_category_listing", "category", "listing_id"),
+    )
+
+    listing_id = Column(Integer, ForeignKey("listings.id"), primary_key=True)
+    category = Column(String, primary_key=True)
+    source = Column(String, nullable=False)   # declared | keyword | centroid
+    score = Column(Float, nullable=False, default=1.0)
+
+
+class ListingNeighbor(Base):
+    """Precomputed top-N neighbours per listing (kind: "fbt", "similar" or "visual")."""
+    __tablename__ = "listing_neighbors"
+    __table_args__ = (
+        Index("ix_listing_neighbors_kind_neighbor", "kind", "neighbor_id"),   # reverse lookups on update
+    )
+
+    listing_id = Column(Integer, ForeignKey("listings.id"), primary_key=True)
+    kind = Column(String, primary_key=True)
+    rank = Column(Integer, primary_key=True)  # 0 = best neighbour
+    neighbor_id = Column(Integer, ForeignKey("listings.id"), nullable=False)
+    score = Column(Float, nullable=False)
+
+
 class Review(Base):
     __tablename__ = "reviews"
+    __table_args__ = (
+        Index("ix_reviews_reviewee_created", "reviewee_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
@@ -148,6 +231,9 @@ class Review(Base):
 
 class CommunityVouch(Base):
     __tablename__ = "community_vouches"
+    __table_args__ = (
+        Index("ix_community_vouches_voutee_id", "voutee_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     vouter_id = Column(Integer, ForeignKey("users.id"))
@@ -160,6 +246,9 @@ class CommunityVouch(Base):
 
 class Dispute(Base):
     __tablename__ = "disputes"
+    __table_args__ = (
+        Index("ix_disputes_accused_status", "accused_id", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
@@ -185,3 +274,168 @@ class UserActivity(Base):
 
     user = relationship("User")
     listing = relationship("Listing")
+
+
+class UserListingDaily(Base):
+    """Compacted ``user_activities``: one row per user/listing/type/day (see activity_rollup.py)."""
+    __tablename__ = "user_listing_daily"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    listing_id = Column(Integer, ForeignKey("listings.id"), primary_key=True, index=True)
+    activity_type = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    events = Column(Integer, nullable=False, default=0)   # raw rows folded in
+    weight = Column(Float, nullable=False, default=0.0)   # Σ weight of those rows
+
+
+class SavedSearch(Base):
+    __tablename__ = "saved_searches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    query = Column(String, nullable=False)
+    terms = Column(Text, nullable=False)  # JSON list of parsed query terms
+    category = Column(String, nullable=True)
+    city = Column(String, nullable=True)
+    min_price = Column(Float, nullable=True)
+    max_price = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    user = relationship("User")
+    matches = relationship("SavedSearchMatch", back_populates="saved_search", cascade="all, delete-orphan")
+
+
+class SavedSearchMatch(Base):
+    __tablename__ = "saved_search_matches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    saved_search_id = Column(Integer, ForeignKey("saved_searches.id"), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    listing_id = Column(Integer, ForeignKey("listings.id"), nullable=False)
+    is_seen = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    saved_search = relationship("SavedSearch", back_populates="matches")
+    listing = relationship("Listing", back_populates="saved_search_matches")
+
+
+class UserInterest(Base):
+    """Time-decayed weighted sum of the embeddings a user interacted with (see user_interest.py)."""
+    __tablename__ = "user_interests"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    vector = Column(LargeBinary, nullable=False)  # float32 bytes, decayed Σ weight·embedding
+    total_weight = Column(Float, default=0.0)     # decayed Σ weight
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TableGeneration(Base):
+    """Per-table write counter behind collection ETags (see etags.py)."""
+    __tablename__ = "table_generations"
+
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+
+# ── Listing payload versions ────────────────────────────────────────────────
+# Listing.version identifies the serialised form of a listing (schemas.Listing
+# minus views_count): listing_render.py caches rendered JSON by (id, version).
+# Every ORM flush that changes a public listing field, one of its images or
+# its owner's public profile bumps the affected versions.  views_count is
+# left out on purpose — it changes on every view and is spliced in per response.
+_LISTING_PUBLIC = ("title", "description", "price", "category", "city", "is_active",
+                   "accept_exchange", "exchange_preferences", "duplicate_of", "owner_id")
+_IMAGE_PUBLIC = ("url", "listing_id", "quality_score", "ai_feedback")
+_OWNER_PUBLIC = ("email", "name", "phone", "profile_image_url")
+
+
+def _changed(obj, keys) -> bool:
+    return any(attributes.get_history(obj, key).has_changes() for key in keys)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_listing_versions(session, flush_context, instances):
+    bumped, listing_ids, owner_ids = set(), set(), set()
+    for obj in session.dirty:
+        if isinstance(obj, Listing) and _changed(obj, _LISTING_PUBLIC):
+            if not attributes.get_history(obj, "version").has_changes():
+                obj.version = Listing.version + 1   # in the UPDATE itself: concurrent writers both count
+            bumped.add(obj.id)
+        elif isinstance(obj, ProductImage) and _changed(obj, _IMAGE_PUBLIC):
+            listing_ids.update(i for i in attributes.get_history(obj, "listing_id").sum() if i is not None)
+            listing_ids.add(obj.listing_id)
+        elif isinstance(obj, User) and _changed(obj, _OWNER_PUBLIC):
+            owner_ids.add(obj.id)
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, ProductImage):
+            listing_ids.add(obj.listing_id)
+
+    listing_ids = {i for i in listing_ids if i is not None} - bumped
+    listings = Listing.__table__
+    if listing_ids:
+        session.execute(
+            update(listings).where(listings.c.id.in_(listing_ids)).values(version=listings.c.version + 1)
+        )
+    if owner_ids:
+        session.execute(
+            update(listings).where(listings.c.owner_id.in_(owner_ids)).values(version=listings.c.version + 1)
+        )
+
+
+# ── Primary image ───────────────────────────────────────────────────────────
+# Listing.primary_image_url mirrors the listing's first image (lowest id) so
+# card views need no join.  Recomputed after every flush that inserts, deletes
+# or re-points a ProductImage; writes that bypass the ORM must do the same.
+def primary_image_subquery(listing_id):
+    return (
+        select(ProductImage.url)
+        .where(ProductImage.listing_id == listing_id)
+        .order_by(ProductImage.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_primary_images(session, flush_context):
+    listing_ids = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, ProductImage):
+            listing_ids.add(obj.listing_id)
+    for obj in session.dirty:
+        if isinstance(obj, ProductImage) and _changed(obj, ("url", "listing_id")):
+            listing_ids.update(attributes.get_history(obj, "listing_id").sum())
+            listing_ids.add(obj.listing_id)
+    listing_ids.discard(None)
+    if listing_ids:
+        listings = Listing.__table__
+        session.execute(
+            update(listings)
+            .where(listings.c.id.in_(listing_ids))
+            .values(primary_image_url=primary_image_subquery(listings.c.id))
+        )
+
+
+# ── User versions and table generations ────────────────────────────────────
+# User.version backs the profile ETag; table_generations counts flushes that
+# wrote each table, for ETags of responses that span many rows.  Core writes
+# bypass these hooks and call etags.bump_generations themselves.
+@event.listens_for(Session, "before_flush")
+def _bump_user_versions(session, flush_context, instances):
+    for obj in session.dirty:
+        if isinstance(obj, User) and session.is_modified(obj) and not attributes.get_history(obj, "version").has_changes():
+            obj.version = User.version + 1   # in the UPDATE itself, like Listing.version
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_table_generations(session, flush_context):
+    from .etags import bump_generations
+
+    tables = {
+        obj.__table__.name
+        for obj in list(session.new) + list(session.deleted) + list(session.dirty)
+        if hasattr(obj, "__table__") and (obj in session.new or obj in session.deleted or session.is_modified(obj))
+    }
+    tables.discard(TableGeneration.__tablename__)
+    if tables:
+        bump_generations(session, tables)
@@ -0,0 +1,187 @@
+"""
+Precomputed Similar-Listing Neighbours
+======================================
+Listing detail pages show "similar items".  Rather than scoring the whole
+embedding matrix for every page view, the top-N most similar listings per
+listing are stored in ``listing_neighbors`` (kind="similar") and read with
+one indexed lookup.
+
+    full rebuild   E[block] @ Eᵀ for blocks of BLOCK rows, argpartition top-N
+    incremental    after a create/edit, the listing's own row plus every
+                   list it already appears in is recomputed, and so is the
+                   list of each of its old and new top-N neighbours that it
+                   now enters (score above that list's current N-th score,
+                   or the list is short); lists further away catch up on
+                   the next full rebuild
+    delete         the listing's rows and its entries in other lists go in
+                   the same transaction as the listing
+
+Both run off the request path: the full rebuild from the CLI, incremental
+updates from ``BackgroundTasks`` in the listing write endpoints.
+
+    python -m backend.neighbors            # full rebuild
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import delete, func, insert, or_
+from sqlalchemy.orm import Session
+
+from . import models
+from .search_engine import catalogue_matrix
+
+KIND = "similar"
+ALL_KINDS = ("similar", "visual", "fbt")
+TOP_N = 20
+BLOCK = 512
+
+
+def _top_rows(ids: np.ndarray, emb_matrix: np.ndarray, indices: List[int],
+              top_n: int = TOP_N, kind: str = KIND) -> List[dict]:
+    """Neighbour rows for ``ids[indices]``, scored in blocks of BLOCK."""
+    rows: List[dict] = []
+    n = len(ids)
+    k = min(top_n, n - 1)
+    if k <= 0:
+        return rows
+    for start in range(0, len(indices), BLOCK):
+        block = np.asarray(indices[start:start + BLOCK])
+        scores = emb_matrix[block] @ emb_matrix.T
+        scores[np.arange(len(block)), block] = -np.inf   # never your own neighbour
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for r, i in enumerate(block):
+            cand = top[r][np.argsort(-scores[r, top[r]])]
+            lid = int(ids[i])
+            rows.extend(
+                {"listing_id": lid, "kind": kind, "rank": rank,
+                 "neighbor_id": int(ids[j]), "score": float(scores[r, j])}
+                for rank, j in enumerate(cand)
+            )
+    return rows
+
+
+def _replace_rows(db: Session, listing_ids: Optional[List[int]], rows: List[dict], kind: str = KIND) -> None:
+    try:
+        stmt = delete(models.ListingNeighbor).where(models.ListingNeighbor.kind == kind)
+        if listing_ids is not None:
+            stmt = stmt.where(models.ListingNeighbor.listing_id.in_(listing_ids))
+        db.execute(stmt)
+        if rows:
+            db.execute(insert(models.ListingNeighbor), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def rebuild(db: Session) -> Dict[str, float]:
+    """Recompute every listing's neighbour list."""
+    started = time.perf_counter()
+    ids, emb_matrix = catalogue_matrix(db)
+    rows = _top_rows(ids, emb_matrix, list(range(len(ids))))
+    _replace_rows(db, None, rows)
+    stats = {"listings": len(ids), "rows": len(rows), "seconds": round(time.perf_counter() - started, 3)}
+    print(f"NEIGHBORS: Rebuilt similar-listing table {stats}", flush=True)
+    return stats
+
+
+def update_listing(db: Session, listing_id: int) -> int:
+    """
+    Incremental update after ``listing_id`` was created or edited.  Returns
+    the number of neighbour lists rewritten.
+    """
+    ids, emb_matrix = catalogue_matrix(db)
+    id_to_idx = {int(lid): i for i, lid in enumerate(ids)}
+    affected = {listing_id}
+
+    # Lists that already contain the listing (its score may have changed)
+    affected.update(
+        r[0] for r in db.query(models.ListingNeighbor.listing_id).filter(
+            models.ListingNeighbor.kind == KIND, models.ListingNeighbor.neighbor_id == listing_id
+        )
+    )
+
+    if listing_id in id_to_idx:
+        # Lists the listing now enters, among those of its old and new
+        # neighbours (similarity is symmetric: the listings closest to it are
+        # the ones that can rank it).  Lists with no rows at all have never
+        # been computed and are left to the rebuild.
+        k = min(TOP_N, len(ids) - 1)
+        own = id_to_idx[listing_id]
+        scores = emb_matrix @ emb_matrix[own]
+        scores[own] = -np.inf   # never your own neighbour
+        candidates = {int(ids[i]) for i in np.argpartition(-scores, k - 1)[:k]} if k > 0 else set()
+        candidates.update(
+            r[0] for r in db.query(models.ListingNeighbor.neighbor_id).filter(
+                models.ListingNeighbor.listing_id == listing_id, models.ListingNeighbor.kind == KIND
+            )
+        )
+        if candidates:
+            for lid, count, lowest in db.query(
+                models.ListingNeighbor.listing_id,
+                func.count(),
+                func.min(models.ListingNeighbor.score),
+            ).filter(
+                models.ListingNeighbor.listing_id.in_(candidates), models.ListingNeighbor.kind == KIND
+            ).group_by(models.ListingNeighbor.listing_id):
+                if lid in id_to_idx and (count < k or scores[id_to_idx[lid]] > lowest):
+                    affected.add(int(lid))
+
+    indices = [id_to_idx[lid] for lid in affected if lid in id_to_idx]
+    rows = _top_rows(ids, emb_matrix, indices)
+    _replace_rows(db, list(affected), rows)
+    return len(affected)
+
+
+def remove_listing(db: Session, listing_id: int) -> None:
+    """
+    Drop ``listing_id``'s own lists and its entries in other lists (every
+    kind), inside the caller's transaction (the listing delete).  "similar"
+    lists it is removed from are one row short and refill on the next
+    incremental update.
+    """
+    db.execute(
+        delete(models.ListingNeighbor).where(
+            models.ListingNeighbor.kind.in_(ALL_KINDS),   # kind leads the reverse-lookup index
+            or_(models.ListingNeighbor.listing_id == listing_id, models.ListingNeighbor.neighbor_id == listing_id),
+        )
+    )
+
+
+def update_listing_task(listing_id: int) -> None:
+    """``BackgroundTasks`` entry point for the listing write endpoints."""
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        updated = update_listing(db, listing_id)
+        print(f"NEIGHBORS: Listing {listing_id} updated {updated} neighbour lists", flush=True)
+    except Exception as e:
+        print(f"!!! Neighbour update failed for listing {listing_id}: {e}", flush=True)
+    finally:
+        db.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild the similar-listing neighbour table.")
+    parser.parse_args(argv)
+
+    from .database import SessionLocal, engine, Base
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rebuild(db)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Keyset Pagination
+=================
+``GET /listings`` pages with an opaque cursor instead of ``OFFSET``.  Each
+sort order is a (sort key, id) pair with a matching composite index on
+``listings``, so a page is one index range scan whatever its depth:
+
+    newest        id DESC                       ix_listings_active_id
+    price_asc     price ASC,  id ASC            ix_listings_active_price_id
+    price_desc    price DESC, id DESC           ix_listings_active_price_id
+    most_viewed   views_count DESC, id DESC     ix_listings_active_views_id
+
+The cursor is the (sort, key, id) of the last row served, base64url-encoded
+JSON; the next page is the rows strictly after it in sort order.  Keys that
+change between pages (price edits, new views) can move a listing across the
+boundary, which is the usual keyset trade-off.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+from . import models
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+# sort name → (key column or None for id-only, descending)
+SORTS = {
+    "newest": (None, True),
+    "price_asc": (models.Listing.price, False),
+    "price_desc": (models.Listing.price, True),
+    "most_viewed": (models.Listing.views_count, True),
+}
+
+
+def encode_cursor(sort: str, key: Any, listing_id: int) -> str:
+    raw = json.dumps({"s": sort, "k": key, "i": listing_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        key, listing_id = data["k"], int(data["i"])
+        cursor_sort = data["s"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor was issued for a different sort order")
+    return key, listing_id
+
+
+def keyset_page(query: Query, sort: str, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """
+    One page of ``query`` (already filtered) in ``sort`` order, plus the next
+    cursor.  ``query`` may select Listing entities or columns, as long as the
+    rows expose ``id`` and the sort column.
+    """
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort {sort!r} (choose from {', '.join(SORTS)})")
+    column, descending = SORTS[sort]
+    id_col = models.Listing.id
+
+    if cursor:
+        key, last_id = decode_cursor(cursor, sort)
+        if column is None:
+            query = query.filter(id_col < last_id if descending else id_col > last_id)
+        elif descending:
+            query = query.filter(tuple_(column, id_col) < tuple_(key, last_id))
+        else:
+            query = query.filter(tuple_(column, id_col) > tuple_(key, last_id))
+
+    order = [id_col.desc() if descending else id_col.asc()]
+    if column is not None:
+        order.insert(0, column.desc() if descending else column.asc())
+
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    key = getattr(last, column.key) if column is not None else None
+    return rows, encode_cursor(sort, key, last.id)
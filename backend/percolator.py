@@ -0,0 +1,240 @@
+"""
+Saved Search Percolator
+=======================
+"Notify me when a cheap PS5 in Pune is posted."
+
+Instead of running every saved search against the catalogue, saved searches
+are indexed in reverse and each NEW listing is run against that index:
+
+    city bucket ("pune" / "*")  →  anchor term  →  {saved_search_id, ...}
+
+Every saved search is posted under ONE anchor term (its longest term, a cheap
+proxy for the rarest) in the bucket of its city filter, or "*" when it has
+none.  Percolating a listing therefore only looks up the listing's own tokens
+in two buckets, and the few candidates found are verified against the full
+term set and the category / price filters.
+
+The index lives in process memory (like the search index).  It is loaded
+from ``saved_searches`` on first use.  Afterwards, whenever the table's
+generation in ``table_generations`` (see etags.py) has moved, only the delta
+is applied: saved searches are never edited, so comparing the table's ids
+with the indexed ones gives the searches saved (loaded by id) and deleted
+through another worker.  ``add`` / ``remove`` apply this worker's own
+changes straight away.  Matches are stored in
+``saved_search_matches`` for polling and pushed over the chat WebSocket to
+users who are online.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import etags, models
+from .search_engine import _tokenize
+
+_ANY_CITY = "*"
+
+
+def parse_terms(query: str) -> List[str]:
+    """Query → sorted unique terms (same tokenizer as the search index)."""
+    return sorted(set(_tokenize(query or "")))
+
+
+def listing_terms(listing: models.Listing) -> Set[str]:
+    text = f"{listing.title or ''} {listing.category or ''} {listing.description or ''}"
+    return set(_tokenize(text))
+
+
+def _city_bucket(city: Optional[str]) -> str:
+    return city.strip().casefold() if city and city.strip() else _ANY_CITY
+
+
+class _Compiled:
+    __slots__ = ("id", "user_id", "terms", "anchor", "bucket", "category", "min_price", "max_price")
+
+    def __init__(self, saved: models.SavedSearch):
+        self.id = saved.id
+        self.user_id = saved.user_id
+        self.terms = frozenset(json.loads(saved.terms or "[]"))
+        self.anchor = max(self.terms, key=lambda t: (len(t), t)) if self.terms else None
+        self.bucket = _city_bucket(saved.city)
+        self.category = saved.category.strip().casefold() if saved.category else None
+        self.min_price = saved.min_price
+        self.max_price = saved.max_price
+
+    def accepts(self, listing: models.Listing, tokens: Set[str]) -> bool:
+        if listing.owner_id == self.user_id:
+            return False
+        if not self.terms <= tokens:
+            return False
+        if self.category and (listing.category or "").strip().casefold() != self.category:
+            return False
+        if self.min_price is not None and (listing.price or 0) < self.min_price:
+            return False
+        if self.max_price is not None and (listing.price or 0) > self.max_price:
+            return False
+        return True
+
+
+class Percolator:
+    """Reverse index of saved searches keyed by city bucket and anchor term."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation: Optional[int] = None                # saved_searches generation loaded
+        self._searches: Dict[int, _Compiled] = {}
+        self._postings: Dict[str, Dict[str, Set[int]]] = {}   # bucket → anchor term → ids
+        self._match_all: Dict[str, Set[int]] = {}             # bucket → ids of term-less searches
+
+    def ensure_loaded(self, db: Session) -> None:
+        """Build the index on first use; later, apply what changed since the last sync."""
+        table = models.SavedSearch.__tablename__
+        generation = etags.generations(db, [table])[table]
+        if generation == self._generation:
+            return
+        if self._generation is None:
+            saved = db.query(models.SavedSearch).all()
+            with self._lock:
+                if self._generation is not None:
+                    return
+                self._searches, self._postings, self._match_all = {}, {}, {}
+                for s in saved:
+                    self._add_locked(_Compiled(s))
+                self._generation = generation
+            print(f"PERCOLATOR: Indexed {len(saved)} saved searches (generation {generation})", flush=True)
+            return
+
+        # Read in the same transaction as the generation; a write racing this
+        # sync moves the generation again, so the next call repairs it
+        current = {r[0] for r in db.query(models.SavedSearch.id)}
+        with self._lock:
+            known = set(self._searches)
+        created = current - known
+        saved = db.query(models.SavedSearch).filter(models.SavedSearch.id.in_(created)).all() if created else []
+        for saved_search_id in known - current:
+            self.remove(saved_search_id)
+        with self._lock:
+            for s in saved:
+                self._add_locked(_Compiled(s))
+            self._generation = generation
+
+    def _add_locked(self, c: _Compiled) -> None:
+        self._searches[c.id] = c
+        if c.anchor is None:
+            self._match_all.setdefault(c.bucket, set()).add(c.id)
+        else:
+            self._postings.setdefault(c.bucket, {}).setdefault(c.anchor, set()).add(c.id)
+
+    def add(self, saved: models.SavedSearch) -> None:
+        if self._generation is None:
+            return  # picked up by the initial load
+        with self._lock:
+            self._add_locked(_Compiled(saved))
+
+    def remove(self, saved_search_id: int) -> None:
+        with self._lock:
+            c = self._searches.pop(saved_search_id, None)
+            if c is None:
+                return
+            if c.anchor is None:
+                self._match_all.get(c.bucket, set()).discard(c.id)
+            else:
+                ids = self._postings.get(c.bucket, {}).get(c.anchor)
+                if ids is not None:
+                    ids.discard(c.id)
+                    if not ids:
+                        del self._postings[c.bucket][c.anchor]
+
+    def percolate(self, db: Session, listing: models.Listing) -> List[_Compiled]:
+        """Saved searches that ``listing`` satisfies."""
+        self.ensure_loaded(db)
+        tokens = listing_terms(listing)
+        with self._lock:
+            candidate_ids: Set[int] = set()
+            for bucket in {_city_bucket(listing.city), _ANY_CITY}:
+                postings = self._postings.get(bucket, {})
+                for tok in tokens:
+                    ids = postings.get(tok)
+                    if ids:
+                        candidate_ids |= ids
+                candidate_ids |= self._match_all.get(bucket, set())
+            candidates = [self._searches[i] for i in candidate_ids if i in self._searches]
+        return [c for c in candidates if c.accepts(listing, tokens)]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "saved_searches": len(self._searches),
+                "posting_lists": sum(len(p) for p in self._postings.values()),
+            }
+
+
+percolator = Percolator()
+
+
+def store_matches(db: Session, listing: models.Listing) -> List[models.SavedSearchMatch]:
+    """Percolate ``listing`` and persist one match row per satisfied saved search."""
+    matched = percolator.percolate(db, listing)
+    rows = [
+        models.SavedSearchMatch(saved_search_id=c.id, user_id=c.user_id, listing_id=listing.id)
+        for c in matched
+    ]
+    if rows:
+        db.add_all(rows)
+        db.commit()
+    return rows
+
+
+def _store_alerts(listing_id: int) -> List[dict]:
+    """DB half of ``deliver_new_listing_alerts``: store matches, return the events to push."""
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+        if not listing or not listing.is_active:
+            return []
+        rows = store_matches(db, listing)
+        if rows:
+            print(f"PERCOLATOR: Listing {listing_id} matched {len(rows)} saved searches", flush=True)
+        return [
+            {
+                "user_id": row.user_id,
+                "type": "saved_search_match",
+                "saved_search_id": row.saved_search_id,
+                "match_id": row.id,
+                "listing": {
+                    "id": listing.id,
+                    "title": listing.title,
+                    "price": listing.price,
+                    "city": listing.city,
+                },
+            }
+            for row in rows
+        ]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def deliver_new_listing_alerts(listing_id: int) -> None:
+    """
+    Background task for ``create_listing``: store matches for the new listing
+    (in the threadpool, off the event loop) and push a ``saved_search_match``
+    event to each matched user who is online.
+    """
+    from .chat_routes import manager
+
+    try:
+        events = await run_in_threadpool(_store_alerts, listing_id)
+        for event in events:
+            await manager.send_to_user(event.pop("user_id"), event)
+    except Exception as e:
+        print(f"!!! Saved search percolation failed for listing {listing_id}: {e}", flush=True)
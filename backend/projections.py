@@ -0,0 +1,81 @@
+"""
+Listing Projections
+===================
+Collection endpoints (``/listings``, ``/search``, the recommendation strips)
+serve full ``schemas.Listing`` objects by default: description, exchange
+preferences, the owner and every image with its AI feedback.  Grid views need
+a fraction of that, so those endpoints also accept
+
+    view=card        schemas.ListingCard — id, title, price, city, category
+                     and primary_image_url (the first image, kept on the
+                     listing row by the flush hook in models.py)
+    fields=a,b,c     just the named listing columns (id is always included)
+
+``/listings`` loads a projection with ``load_only`` and no owner or image
+loaders, so only the projected columns are read.  Endpoints that already hold
+full listings (search snapshots, recommendations) just serialise less.
+
+Usage
+-----
+GET /listings?view=card
+GET /search?q=desk&fields=title,price,primary_image_url
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import load_only
+
+from . import models, schemas
+
+VIEWS = ("full", "card")
+CARD_FIELDS = tuple(schemas.ListingCard.model_fields)
+
+# Scalar listing columns a sparse fieldset may ask for
+FIELDS = {
+    name: getattr(models.Listing, name)
+    for name in (
+        "id", "title", "description", "price", "category", "city", "is_active", "views_count",
+        "accept_exchange", "exchange_preferences", "duplicate_of", "owner_id", "primary_image_url",
+    )
+}
+
+# Keyset sort keys (pagination.SORTS) must be loaded even when not projected
+_SORT_KEYS = ("price", "views_count")
+
+
+def resolve_fields(view: Optional[str], fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Projected field names for a request, or None for the full listing."""
+    if fields:
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in names if f not in FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown field(s) {', '.join(unknown)} (choose from {', '.join(FIELDS)})",
+            )
+        return ("id",) + tuple(dict.fromkeys(f for f in names if f != "id"))
+    view = view or "full"
+    if view not in VIEWS:
+        raise HTTPException(status_code=400, detail=f"Unknown view {view!r} (choose from {', '.join(VIEWS)})")
+    return CARD_FIELDS if view == "card" else None
+
+
+def load_options(names: Tuple[str, ...]) -> tuple:
+    """``load_only`` for a projection plus the keyset sort keys."""
+    columns = dict.fromkeys(names + _SORT_KEYS)
+    return (load_only(*(FIELDS[name] for name in columns)),)
+
+
+def render_one(listing: models.Listing, names: Tuple[str, ...]) -> bytes:
+    if names == CARD_FIELDS:
+        return schemas.ListingCard.model_validate(listing).model_dump_json().encode("utf-8")
+    return json.dumps({name: getattr(listing, name) for name in names}, separators=(",", ":")).encode("utf-8")
+
+
+def render(listings: Iterable[models.Listing], names: Tuple[str, ...]) -> bytes:
+    """JSON array of ``listings`` projected onto ``names``."""
+    return b"[" + b",".join(render_one(l, names) for l in listings) + b"]"
@@ -0,0 +1,74 @@
+"""
+Listing Loader Options
+======================
+``schemas.Listing`` serialises ``owner`` and ``images``.  Left to lazy
+loading, every listing in a response costs two more SELECTs, so a page of 100
+listings fires 200 extra statements.  Endpoints that return listings —
+directly or nested under wishlist items, orders, reviews or profiles — load
+them through these options instead:
+
+    owner    joinedload    many-to-one, rides along in the same SELECT
+    images   selectinload  one extra SELECT ... WHERE listing_id IN (...)
+                           for the whole result, whatever its size
+
+``python -m backend.query_audit`` checks that the statement count of each
+listing endpoint stays flat as the result grows.
+
+Usage
+-----
+db.query(models.Listing).options(*listing_load_options())
+db.query(models.WishlistItem).options(*listing_load_options(selectinload(models.WishlistItem.listing)))
+load_listings(db, [12, 7, 31])      # by id, in the order given
+parse_id_list("12,7,31")            # ?ids= of GET /listings/batch
+"""
+
+from __future__ import annotations
+
+from typing import List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Load, Session, joinedload, selectinload
+
+from . import models
+
+MAX_BATCH_IDS = 100
+
+
+def listing_load_options(via: Optional[Load] = None) -> tuple:
+    """
+    Eager-load options for everything ``schemas.Listing`` serialises.
+    ``via`` is the loader chain that reaches the listings (e.g.
+    ``selectinload(models.OrderItem.listing)``); omit it when querying
+    ``Listing`` itself.
+    """
+    if via is None:
+        return (joinedload(models.Listing.owner), selectinload(models.Listing.images))
+    return (via.joinedload(models.Listing.owner), via.selectinload(models.Listing.images))
+
+
+def order_load_options() -> tuple:
+    """Eager-load options for ``schemas.Order`` (items → listing → owner, images)."""
+    return listing_load_options(selectinload(models.Order.items).joinedload(models.OrderItem.listing))
+
+
+def load_listings(db: Session, listing_ids: Sequence[int], active_only: bool = False) -> List[models.Listing]:
+    """Listings for ``listing_ids`` with owner and images loaded, in the order given."""
+    if not listing_ids:
+        return []
+    query = db.query(models.Listing).options(*listing_load_options()).filter(models.Listing.id.in_(list(listing_ids)))
+    if active_only:
+        query = query.filter(models.Listing.is_active == True)  # noqa: E712
+    by_id = {l.id: l for l in query}
+    return [by_id[i] for i in listing_ids if i in by_id]
+
+
+def parse_id_list(raw: str, limit: int = MAX_BATCH_IDS) -> List[int]:
+    """Comma-separated listing ids, de-duplicated in first-seen order (400 if malformed or too many)."""
+    try:
+        ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > limit:
+        raise HTTPException(status_code=400, detail=f"At most {limit} ids per request")
+    return ids
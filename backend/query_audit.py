@@ -0,0 +1,232 @@
+"""
+Query Audit
+===========
+Guards against N+1 lazy loading and unindexed queries in the hot endpoints.
+Builds a throwaway SQLite database, seeds one seller/buyer pair per result
+size (listings with images, a wishlist, orders, reviews, a conversation),
+calls each endpoint through the ASGI test client and
+
+    counts     the SQL statements it executes — a count that grows with the
+               result size is an N+1 regression
+    explains   every SELECT it executed with EXPLAIN QUERY PLAN — a plan step
+               that scans a whole table (or a whole index) is a missing index
+
+Either finding makes the command exit non-zero, so it can run in CI.
+
+Usage
+-----
+python -m backend.query_audit
+python -m backend.query_audit --sizes 2 10 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# (label, path template, caller); {seller} is the seller's user id, {n} the result size,
+# {ids} the seller's listing ids, {listing} one of them, {conversation} the buyer's conversation
+ENDPOINTS: List[Tuple[str, str, Optional[str]]] = [
+    ("GET /listings", "/listings?limit={n}&sort=newest", None),
+    ("GET /listings?view=card", "/listings?limit={n}&sort=newest&view=card", None),
+    ("GET /listings?category", "/listings?limit={n}&sort=price_asc&category=Books%20%26%20Media&min_price=100", None),
+    ("GET /listings/{id}", "/listings/{listing}", None),
+    ("GET /listings/me", "/listings/me", "seller"),
+    ("GET /listings/batch", "/listings/batch?ids={ids}", None),
+    ("GET /users/{id}/listings", "/users/{seller}/listings", None),
+    ("GET /users/{id}/profile", "/users/{seller}/profile", None),
+    ("GET /wishlist", "/wishlist", "buyer"),
+    ("GET /orders", "/orders", "buyer"),
+    ("GET /sales", "/sales", "seller"),
+    ("GET /users/{id}/reviews", "/users/{seller}/reviews", None),
+    ("GET /users/me/exchange-matches", "/users/me/exchange-matches", "seller"),
+    ("GET /messages/convo/{id}", "/messages/convo/{conversation}", "seller"),
+]
+
+# Endpoints whose seeded result must not come back empty (an empty page audits nothing)
+NON_EMPTY = {"GET /listings", "GET /listings?category", "GET /listings/batch"}
+
+# Plan steps that read a whole table or index; SQLite reports e.g.
+# "SCAN listings", "SCAN reviews USING INDEX ix_..." (unlike "SEARCH ...")
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$")
+
+
+class StatementCounter:
+    """Counts (and keeps the SELECTs of) statements executed on an engine while ``active``."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        self.active = False
+        self.selects: List[Tuple[str, tuple]] = []
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active:
+            with self._lock:
+                self.count += 1
+                if not executemany and statement.lstrip().upper().startswith("SELECT"):
+                    self.selects.append((statement, tuple(parameters or ())))
+
+    def measure(self, fn):
+        self.count, self.active, self.selects = 0, True, []
+        try:
+            result = fn()
+        finally:
+            self.active = False
+        return result, self.count
+
+
+def full_scans(engine, selects: List[Tuple[str, tuple]]) -> List[Tuple[str, str]]:
+    """(plan step, statement) for every whole-table or whole-index scan in ``selects``."""
+    found = []
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for statement, parameters in dict(selects).items():     # one plan per distinct statement
+            for row in cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall():
+                detail = row[-1]
+                if _FULL_SCAN.match(detail):
+                    found.append((detail, " ".join(statement.split())))
+        cursor.close()
+    finally:
+        raw.close()
+    return found
+
+
+def _seed(db, n: int, tag: str) -> Dict[str, object]:
+    """
+    One seller with ``n`` listings (2 images each, categorized); one buyer who
+    wishlisted, ordered and reviewed them all and sent ``n`` messages about the first.
+    """
+    from . import models
+    from .auth import create_access_token, get_password_hash
+    from .categorizer import backfill as categorize
+    from .chat_models import Conversation, Message
+
+    password = get_password_hash("audit")
+    seller = models.User(email=f"seller-{tag}@example.com", name=f"Seller {tag}", hashed_password=password, is_verified=True)
+    buyer = models.User(email=f"buyer-{tag}@example.com", name=f"Buyer {tag}", hashed_password=password, is_verified=True)
+    db.add_all([seller, buyer])
+    db.flush()
+
+    for i in range(n):
+        listing = models.Listing(
+            title=f"Audit item {tag}-{i}", description="Seeded by query_audit", price=100.0 + i,
+            category="Books & Media", city="Pune", owner_id=seller.id,
+        )
+        db.add(listing)
+        db.flush()
+        db.add_all([models.ProductImage(url=f"https://images.example.com/{listing.id}/{k}.jpg", listing_id=listing.id)
+                    for k in range(2)])
+        db.add(models.WishlistItem(user_id=buyer.id, listing_id=listing.id))
+        order = models.Order(user_id=buyer.id, total_amount=listing.price, status="completed")
+        db.add(order)
+        db.flush()
+        db.add(models.OrderItem(order_id=order.id, listing_id=listing.id, price_at_order=listing.price))
+        db.add(models.Review(order_id=order.id, reviewer_id=buyer.id, reviewee_id=seller.id, rating=8))
+    first = seller.listings[0]
+    conversation = Conversation(listing_id=first.id, buyer_id=buyer.id, seller_id=seller.id)
+    db.add(conversation)
+    db.flush()
+    db.add_all([Message(conversation_id=conversation.id, sender_id=buyer.id, content=f"Still available? ({i})")
+                for i in range(n)])
+    db.commit()
+
+    ctx = {
+        "seller": seller.id,
+        "ids": ",".join(str(l.id) for l in seller.listings),
+        "listing": first.id,
+        "conversation": conversation.id,
+        "headers": {
+            "seller": {"Authorization": "Bearer " + create_access_token({"sub": str(seller.id)})},
+            "buyer": {"Authorization": "Bearer " + create_access_token({"sub": str(buyer.id)})},
+        },
+    }
+    # Browse categories are written by the create/update hooks; seeded rows bypass them
+    categorize(db, missing_only=True)
+    return ctx
+
+
+def audit(sizes: List[int]) -> Tuple[Dict[str, List[int]], Dict[str, List[Tuple[str, str]]]]:
+    """
+    Statement count per endpoint for each result size, and the full scans in
+    each endpoint's queries at the largest size (DATABASE_URL must already
+    point at a scratch DB).
+    """
+    from fastapi.testclient import TestClient
+
+    from .database import SessionLocal, engine
+    from .main import app
+
+    counter = StatementCounter(engine)
+    client = TestClient(app)
+    counts: Dict[str, List[int]] = {label: [] for label, _, _ in ENDPOINTS}
+    scans: Dict[str, List[Tuple[str, str]]] = {}
+
+    for n in sizes:
+        db = SessionLocal()
+        try:
+            ctx = _seed(db, n, f"n{n}")
+        finally:
+            db.close()
+        for label, template, caller in ENDPOINTS:
+            path = template.format(**ctx, n=n)
+            headers = ctx["headers"][caller] if caller else {}
+            response, statements = counter.measure(lambda: client.get(path, headers=headers))
+            if response.status_code != 200:
+                raise RuntimeError(f"{label} returned {response.status_code}: {response.text[:200]}")
+            if label in NON_EMPTY and not response.json():
+                raise RuntimeError(f"{label} returned no rows for the seeded data")
+            counts[label].append(statements)
+            if n == max(sizes):
+                scans[label] = full_scans(engine, counter.selects)
+    return counts, scans
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check that listing endpoints run a constant number of SQL statements.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 30], help="result sizes to compare")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="query-audit-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'audit.db')}"
+    counts, scans = audit(args.sizes)
+
+    width = max(len(label) for label in counts)
+    print("\nQUERY AUDIT: SQL statements per request", flush=True)
+    print(f"  {'endpoint'.ljust(width)}  " + "  ".join(f"n={n:<4}" for n in args.sizes))
+    regressions = []
+    for label, values in counts.items():
+        constant = len(set(values)) == 1
+        if not constant:
+            regressions.append(label)
+        print(f"  {label.ljust(width)}  " + "  ".join(f"{v:<6}" for v in values) + ("" if constant else "  <-- grows with n"))
+
+    print("\nQUERY AUDIT: full scans in query plans", flush=True)
+    scanning = [label for label, found in scans.items() if found]
+    for label in scanning:
+        for detail, statement in scans[label]:
+            print(f"  {label}: {detail}\n      {statement[:160]}")
+    if not scanning:
+        print("  none")
+
+    if regressions:
+        print(f"!!! {len(regressions)} endpoint(s) scale with result size: {', '.join(regressions)}", flush=True)
+    if scanning:
+        print(f"!!! {len(scanning)} endpoint(s) scan whole tables: {', '.join(scanning)}", flush=True)
+    if regressions or scanning:
+        return 1
+    print("OK: every endpoint is constant in the result size and fully indexed", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
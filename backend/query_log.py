@@ -0,0 +1,114 @@
+"""
+Search Query Log
+================
+Appends a sampled record of every ``semantic_search`` call to a rotating
+NDJSON file so production search load can be captured and replayed offline
+with ``python -m backend.replay``.
+
+One line per query::
+
+    {"ts": 1718000000.123, "source": "api", "query": "used ps5",
+     "params": {"top_k": 100, "min_score": 0.35, "city": "Pune", ...},
+     "results": 12, "latency_ms": 41.7, "cache_hit": true, "coalesced": false}
+
+Configuration (environment)
+---------------------------
+SEARCH_QUERY_LOG             path of the log file; logging is off when unset
+SEARCH_QUERY_LOG_SAMPLE      fraction of queries to keep (default 1.0)
+SEARCH_QUERY_LOG_MAX_BYTES   rotate after this many bytes (default 50 MB)
+SEARCH_QUERY_LOG_BACKUPS     rotated files to keep (default 5)
+
+The request thread only serialises the record and hands it to a queue; the
+file write and rotation happen on a background listener thread.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+_LOG_PATH    = os.getenv("SEARCH_QUERY_LOG")
+_SAMPLE_RATE = float(os.getenv("SEARCH_QUERY_LOG_SAMPLE", "1.0"))
+_MAX_BYTES   = int(os.getenv("SEARCH_QUERY_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+_BACKUPS     = int(os.getenv("SEARCH_QUERY_LOG_BACKUPS", "5"))
+
+_logger = logging.getLogger("exo.search.querylog")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_start_lock = threading.Lock()
+
+
+def _ensure_started() -> bool:
+    global _listener, _queue_handler
+    if _listener is not None:
+        return True
+    if not _LOG_PATH:
+        return False
+    with _start_lock:
+        if _listener is None:
+            file_handler = logging.handlers.RotatingFileHandler(
+                _LOG_PATH, maxBytes=_MAX_BYTES, backupCount=_BACKUPS, encoding="utf-8",
+            )
+            file_handler.setFormatter(logging.Formatter("%(message)s"))
+            records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            _queue_handler = logging.handlers.QueueHandler(records)
+            _logger.addHandler(_queue_handler)
+            _listener = logging.handlers.QueueListener(records, file_handler)
+            _listener.start()
+    return True
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case and collapse whitespace so equivalent queries group together."""
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+def record_query(
+    query: str,
+    params: Dict[str, Any],
+    result_count: int,
+    latency_ms: float,
+    cache_hit: bool,
+    source: str = "internal",
+    coalesced: bool = False,
+) -> None:
+    """Log one search call (subject to sampling).  Never raises."""
+    if not _LOG_PATH or (_SAMPLE_RATE < 1.0 and random.random() >= _SAMPLE_RATE):
+        return
+    try:
+        if not _ensure_started():
+            return
+        _logger.info(json.dumps({
+            "ts":         round(time.time(), 3),
+            "source":     source,
+            "query":      normalize_query(query),
+            "params":     params,
+            "results":    result_count,
+            "latency_ms": round(latency_ms, 2),
+            "cache_hit":  cache_hit,
+            "coalesced":  coalesced,
+        }, separators=(",", ":")))
+    except Exception as e:
+        print(f"!!! Query log write failed: {e}", flush=True)
+
+
+def shutdown() -> None:
+    """Flush pending records and stop the writer thread."""
+    global _listener, _queue_handler
+    with _start_lock:
+        if _listener is not None:
+            _logger.removeHandler(_queue_handler)
+            _listener.stop()
+            _listener = None
+            _queue_handler = None
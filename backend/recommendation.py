@@ -2,10 +2,12 @@ import logging
 import numpy as np
 import threading
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
 from typing import List, Dict, Any, Tuple
 from . import models, schemas
-from .search_engine import _refresh_cache, _cached_query_embedding
+from .search_engine import _merged, _cached_query_embedding, listing_embeddings
+from .activity_rollup import interacted_listing_ids
+from .queries import listing_load_options
+from .reranking import mmr_rerank, candidate_pool_size, MAX_PER_CATEGORY, MAX_PER_SELLER
 
 logger = logging.getLogger(__name__)
 
@@ -31,157 +33,152 @@ def _get_clip_model():
                     _clip_model = "FAILED"
     return _clip_model if _clip_model != "FAILED" else None
 
-# Cache for image embeddings listing_id -> ndarray
-_image_embedding_cache: Dict[int, np.ndarray] = {}
-
 def get_user_profile_recommendations(db: Session, user_id: int, top_k: int = 20) -> List[models.Listing]:
     """
     STAGES 2 & 3: Advanced Personalized Recommendations
     - Weights activities (Purchase > Message > Wishlist > View)
-    - Applies category diversity filters
+    - Blends content similarity with collaborative filtering (ALS) when trained
+    - Applies MMR diversity re-ranking with category / seller caps
     - Excludes items already interacted with
     """
-    # 1. Fetch activities with weights
-    activities = db.query(models.UserActivity).filter(models.UserActivity.user_id == user_id).all()
+    # 1. Persisted, time-decayed interest vector (see user_interest.py)
+    from .user_interest import get_interest_vector
+    interest = get_interest_vector(db, user_id)
     
-    if not activities:
+    if interest is None or interest[1] <= 0:
         # Fallback: recently added listings that are active
-        return db.query(models.Listing).filter(models.Listing.is_active == True).order_by(models.Listing.id.desc()).limit(top_k).all()
+        return db.query(models.Listing).options(*listing_load_options()).filter(models.Listing.is_active == True).order_by(models.Listing.id.desc()).limit(top_k).all()
 
-    # 2. Get embeddings for these listings
-    listings_data = _refresh_cache(db)
-    listings = listings_data[0]
-    emb_matrix = listings_data[1]
+    # 2. Catalogue embeddings
+    listings, listing_ids, emb_matrix = _merged(db)
     
     if len(listings) == 0:
         return []
 
-    # Map listing_id to its index in the matrix
-    id_to_idx = {l.id: i for i, l in enumerate(listings)}
-    
-    # 3. Compute weighted average interest vector
-    user_vector = np.zeros(emb_matrix.shape[1])
-    total_weight = 0.0
-    
-    interacted_ids = set()
-    for act in activities:
-        interacted_ids.add(act.listing_id)
-        if act.listing_id in id_to_idx:
-            idx = id_to_idx[act.listing_id]
-            user_vector += emb_matrix[idx] * act.weight
-            total_weight += act.weight
-            
-    if total_weight > 0:
-        user_vector /= total_weight
-    else:
-        # Fallback to simple mean if weights are zero or missing
-        interest_indices = [id_to_idx[aid] for aid in interacted_ids if aid in id_to_idx]
-        if interest_indices:
-            user_vector = np.mean(emb_matrix[interest_indices], axis=0)
-        else:
-            return db.query(models.Listing).filter(models.Listing.is_active == True).limit(top_k).all()
-
-    # 4. Find similar listings
-    scores = np.dot(emb_matrix, user_vector)
-    top_indices = np.argsort(scores)[::-1]
-    
-    # 5. --- STAGE 3: DIVERSITY FILTER (Category Maxing) ---
-    results = []
-    category_counts = {}
-    MAX_PER_CATEGORY = 3 # Industry standard for diversity
-    
-    for idx in top_indices:
-        listing = listings[idx]
-        
-        # Skip if already interacted or owned by user
-        if listing.id in interacted_ids or listing.owner_id == user_id:
-            continue
-            
-        # Diversity check
-        cat = listing.category or "Unknown"
-        count = category_counts.get(cat, 0)
-        if count < MAX_PER_CATEGORY:
-            results.append(listing)
-            category_counts[cat] = count + 1
-            
-        if len(results) >= top_k:
-            break
-            
-    return results
+    user_vector = interest[0] / interest[1]
+    if user_vector.shape[0] != emb_matrix.shape[1]:
+        return db.query(models.Listing).options(*listing_load_options()).filter(models.Listing.is_active == True).order_by(models.Listing.id.desc()).limit(top_k).all()
 
-def get_frequently_brought_together(db: Session, listing_id: int, top_k: int = 5) -> List[models.Listing]:
-    """
-    Finds products often ordered together with the given listing.
-    """
-    # 1. Find all orders containing this listing
-    order_ids_raw = db.query(models.OrderItem.order_id).filter(models.OrderItem.listing_id == listing_id).all()
-    order_ids = [r[0] for r in order_ids_raw]
-    
-    if not order_ids:
-        # Fallback: same category
-        target_listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
-        if target_listing:
-            return db.query(models.Listing).filter(
-                models.Listing.category == target_listing.category,
-                models.Listing.id != listing_id,
-                models.Listing.is_active == True
-            ).limit(top_k).all()
+    interacted_ids = interacted_listing_ids(db, user_id)
+
+    # 3. Single scoring pass over the catalogue
+    scores = emb_matrix @ user_vector
+
+    # Blend in collaborative filtering (als.py) when a trained model knows the user
+    from .als import score_listings, BLEND
+    cf_scores = score_listings(user_id, listing_ids)
+    if cf_scores is not None and BLEND > 0:
+        scale = float(np.abs(cf_scores).max())
+        if scale > 0:
+            scores = (1.0 - BLEND) * scores + BLEND * (cf_scores / scale)
+
+    # Skip listings already interacted with and the user's own
+    own_ids = [r[0] for r in db.query(models.Listing.id).filter(models.Listing.owner_id == user_id)]
+    excluded = list(interacted_ids) + own_ids
+    if excluded:
+        scores = np.where(np.isin(listing_ids, excluded), -np.inf, scores)
+
+    # 4. --- STAGE 3: DIVERSITY (MMR over a bounded candidate pool, see reranking.py) ---
+    # The pool is cut after the exclusions, so it holds pool_size eligible listings when there are that many
+    eligible = int(np.isfinite(scores).sum())
+    if eligible == 0:
         return []
-        
-    # 2. Find other listings in those same orders
-    frequent_items = (
-        db.query(models.OrderItem.listing_id, func.count(models.OrderItem.listing_id).label('count'))
-        .filter(models.OrderItem.order_id.in_(order_ids))
-        .filter(models.OrderItem.listing_id != listing_id)
-        .group_by(models.OrderItem.listing_id)
-        .order_by(func.count(models.OrderItem.listing_id).desc())
-        .limit(top_k)
+    pool_size = min(candidate_pool_size(top_k), eligible)
+    pool = np.argpartition(-scores, pool_size - 1)[:pool_size]
+    pool = [int(i) for i in pool[np.argsort(-scores[pool])]]
+
+    picked = mmr_rerank(
+        scores[pool],
+        emb_matrix[pool],
+        top_k,
+        categories=[listings[i].category or "Unknown" for i in pool],
+        sellers=[listings[i].owner_id for i in pool],
+        max_per_category=MAX_PER_CATEGORY,
+        max_per_seller=MAX_PER_SELLER,
+        backfill=True,   # caps relax rather than return fewer than top_k
+    )
+    return [listings[pool[i]] for i in picked]
+
+def _neighbor_rows(db: Session, listing_id: int, kind: str, limit: int) -> List[Tuple[models.Listing, float]]:
+    return (
+        db.query(models.Listing, models.ListingNeighbor.score)
+        .options(*listing_load_options())
+        .join(models.ListingNeighbor, models.ListingNeighbor.neighbor_id == models.Listing.id)
+        .filter(
+            models.ListingNeighbor.listing_id == listing_id,
+            models.ListingNeighbor.kind == kind,
+            models.Listing.is_active == True
+        )
+        .order_by(models.ListingNeighbor.rank)
+        .limit(limit)
         .all()
     )
-    
-    item_ids = [item[0] for item in frequent_items]
-    if not item_ids:
+
+def _neighbor_listings(db: Session, listing_id: int, kind: str, top_k: int) -> List[models.Listing]:
+    return [listing for listing, _ in _neighbor_rows(db, listing_id, kind, top_k)]
+
+def _diverse_neighbors(db: Session, listing_id: int, kind: str, top_k: int) -> List[models.Listing]:
+    """Stored neighbours re-ranked with MMR (text embeddings), a seller's extras moved last."""
+    rows = _neighbor_rows(db, listing_id, kind, candidate_pool_size(top_k))
+    if not rows:
         return []
-        
-    return db.query(models.Listing).filter(models.Listing.id.in_(item_ids)).all()
+    embs = listing_embeddings(db, [listing.id for listing, _ in rows])
+    if embs:
+        dim = len(next(iter(embs.values())))
+        matrix = np.stack([embs.get(listing.id, np.zeros(dim, dtype=np.float32)) for listing, _ in rows])
+    else:
+        matrix = np.zeros((len(rows), 0), dtype=np.float32)
+    picked = mmr_rerank(
+        np.array([score for _, score in rows]),
+        matrix,
+        top_k,
+        sellers=[listing.owner_id for listing, _ in rows],
+        max_per_seller=MAX_PER_SELLER,
+        backfill=True,
+    )
+    return [rows[i][0] for i in picked]
 
-def get_visually_similar_listings(db: Session, listing_id: int, top_k: int = 10) -> List[models.Listing]:
+def get_frequently_brought_together(db: Session, listing_id: int, top_k: int = 5) -> List[models.Listing]:
     """
-    Finds listings that are visually similar to the given listing.
-    Uses CLIP embeddings if available, falls back to semantic text similarity.
+    Finds products often bought (or browsed) together with the given listing.
+    Reads the neighbours precomputed by cooccurrence.py (kind="fbt").
     """
+    neighbors = _neighbor_listings(db, listing_id, "fbt", top_k)
+    if neighbors:
+        return neighbors
+
+    return _same_category_listings(db, listing_id, top_k)
+
+def _same_category_listings(db: Session, listing_id: int, top_k: int) -> List[models.Listing]:
+    """Fallback for empty neighbour lists: other active listings of the same category."""
     target_listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
-    if not target_listing:
-        return []
-        
-    # Fallback to semantic similarity for now as CLIP loading might be heavy
-    # However, if we wanted true visual similarity, we would:
-    # 1. Fetch images of target_listing
-    # 2. Encode with _get_clip_model()
-    # 3. Compare with other listing image embeddings
-    
-    listings_data = _refresh_cache(db)
-    listings = listings_data[0]
-    emb_matrix = listings_data[1]
-    
-    id_to_idx = {l.id: i for i, l in enumerate(listings)}
-    
-    if listing_id not in id_to_idx:
-        return []
-        
-    target_idx = id_to_idx[listing_id]
-    target_vector = emb_matrix[target_idx]
-    
-    # Using the semantic vector as a high-quality proxy
-    scores = np.dot(emb_matrix, target_vector)
-    top_indices = np.argsort(scores)[::-1]
-    
-    results = []
-    for idx in top_indices:
-        listing = listings[idx]
-        if listing.id != listing_id and listing.is_active:
-            results.append(listing)
-        if len(results) >= top_k:
-            break
-            
-    return results
+    if target_listing:
+        return db.query(models.Listing).options(*listing_load_options()).filter(
+            models.Listing.category == target_listing.category,
+            models.Listing.id != listing_id,
+            models.Listing.is_active == True
+        ).limit(top_k).all()
+    return []
+
+def get_visually_similar_listings(db: Session, listing_id: int, top_k: int = 10,
+                                  background_tasks=None) -> List[models.Listing]:
+    """
+    Finds listings that are visually similar to the given listing.
+    Served from the neighbour table: image-embedding neighbours written by
+    image_embeddings.py when available, otherwise the text-similarity ones
+    maintained by neighbors.py.  On a miss the same-category fallback is
+    served and the neighbour list is computed off the request path through
+    ``background_tasks``.
+    """
+    results = _diverse_neighbors(db, listing_id, "visual", top_k)
+    if results:
+        return results
+
+    results = _diverse_neighbors(db, listing_id, "similar", top_k)
+    if results:
+        return results
+
+    if background_tasks is not None:
+        from .neighbors import update_listing_task
+        background_tasks.add_task(update_listing_task, listing_id)
+    return _same_category_listings(db, listing_id, top_k)
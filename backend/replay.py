@@ -0,0 +1,164 @@
+"""
+Search Load Replay
+==================
+Replays a captured search query log (see ``query_log.py``) against a database
+snapshot through the ASGI app, in-process, and reports throughput and latency
+percentiles.
+
+Usage
+-----
+python -m backend.replay queries.ndjson --db snapshot.db --qps 50 --clients 8
+python -m backend.replay queries.ndjson --db snapshot.db --source api --limit 5000 --json
+
+Every record is sent as ``GET /search`` with its original parameters.  Requests
+are released on a fixed schedule (``--qps``) and served by ``--clients``
+concurrent clients; when all clients are busy the schedule slips and the
+report shows the achieved rate next to the target.  The snapshot is copied to
+a temporary file first so the replay never modifies it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+
+_REPLAYED_PARAMS = ("top_k", "min_score", "city", "category", "collapse_duplicates", "diversify")
+
+
+def _load_records(path: str, source: Optional[str], limit: Optional[int]) -> List[dict]:
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if source and rec.get("source") != source:
+                continue
+            if not rec.get("query"):
+                continue
+            records.append(rec)
+            if limit and len(records) >= limit:
+                break
+    return records
+
+
+def _search_params(rec: dict) -> dict:
+    params = {"q": rec["query"]}
+    for key, value in (rec.get("params") or {}).items():
+        if key in _REPLAYED_PARAMS and value is not None:
+            params[key] = value
+    return params
+
+
+async def _replay(app, records: List[dict], qps: float, clients: int) -> dict:
+    import httpx
+
+    latencies: List[float] = []
+    errors = 0
+    interval = 1.0 / qps if qps > 0 else 0.0
+    work: "asyncio.Queue[tuple]" = asyncio.Queue()
+
+    start = time.perf_counter()
+    for i, rec in enumerate(records):
+        work.put_nowait((start + i * interval, rec))
+
+    async def client_loop(client: "httpx.AsyncClient") -> None:
+        nonlocal errors
+        while True:
+            try:
+                due, rec = work.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent = time.perf_counter()
+            try:
+                resp = await client.get("/search", params=_search_params(rec))
+                if resp.status_code != 200:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - sent) * 1000.0)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=None) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(max(1, clients))))
+    elapsed = time.perf_counter() - start
+
+    import numpy as np
+
+    lat = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "requests":     len(latencies),
+        "errors":       errors,
+        "elapsed_s":    round(elapsed, 3),
+        "target_qps":   qps,
+        "achieved_qps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "clients":      clients,
+        "latency_ms": {
+            "mean": round(float(lat.mean()), 2),
+            "p50":  round(float(np.percentile(lat, 50)), 2),
+            "p90":  round(float(np.percentile(lat, 90)), 2),
+            "p99":  round(float(np.percentile(lat, 99)), 2),
+            "max":  round(float(lat.max()), 2),
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a search query log against a DB snapshot.")
+    parser.add_argument("log", help="NDJSON query log written by SEARCH_QUERY_LOG")
+    parser.add_argument("--db", required=True, help="SQLite database snapshot to search")
+    parser.add_argument("--qps", type=float, default=20.0, help="target request rate (0 = as fast as possible)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent in-process clients")
+    parser.add_argument("--source", default=None, help="only replay records from this source (e.g. api)")
+    parser.add_argument("--limit", type=int, default=None, help="replay at most this many records")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    records = _load_records(args.log, args.source, args.limit)
+    if not records:
+        print("No replayable records found.", file=sys.stderr)
+        return 1
+
+    workdir = tempfile.mkdtemp(prefix="exo-replay-")
+    snapshot = os.path.join(workdir, "snapshot.db")
+    shutil.copyfile(args.db, snapshot)
+
+    # Must be set before the app (and its engine) is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{snapshot}"
+    os.environ.pop("SEARCH_QUERY_LOG", None)
+
+    try:
+        from .main import app
+
+        report = asyncio.run(_replay(app, records, args.qps, args.clients))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        lat = report["latency_ms"]
+        print(f"requests     {report['requests']}  (errors: {report['errors']})")
+        print(f"elapsed      {report['elapsed_s']} s")
+        print(f"throughput   {report['achieved_qps']} req/s  (target {report['target_qps']}, {report['clients']} clients)")
+        print(f"latency ms   mean {lat['mean']}  p50 {lat['p50']}  p90 {lat['p90']}  p99 {lat['p99']}  max {lat['max']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Diversity Re-ranking (Maximal Marginal Relevance)
+=================================================
+Shared by personalised recommendations, similar-item lists and search.
+
+Given a bounded candidate set (already the top few dozen by relevance),
+MMR picks items one at a time:
+
+    mmr(i) = λ · relevance(i) − (1 − λ) · max_{j ∈ selected} sim(i, j)
+
+The candidate similarity matrix is computed once (K × K) and the running
+"max similarity to anything selected" is a vector updated per pick, so each
+step is a handful of NumPy ops.  Optional per-category and per-seller caps
+take candidates out of the running once their group is full.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+MAX_PER_CATEGORY = 3     # Industry standard for diversity
+MAX_PER_SELLER = int(os.getenv("MMR_MAX_PER_SELLER", "2"))
+
+
+def candidate_pool_size(top_k: int) -> int:
+    """How many top-relevance candidates to hand to the re-ranker."""
+    return max(top_k * 5, 50)
+
+
+def mmr_rerank(
+    relevance: np.ndarray,
+    embeddings: np.ndarray,
+    top_k: int,
+    lam: float = MMR_LAMBDA,
+    categories: Optional[Sequence] = None,
+    sellers: Optional[Sequence] = None,
+    max_per_category: Optional[int] = None,
+    max_per_seller: Optional[int] = None,
+    backfill: bool = False,
+) -> List[int]:
+    """
+    Re-rank candidates; returns up to ``top_k`` indices into the candidate
+    arrays in pick order.
+
+    ``relevance`` is min-max scaled to [0, 1] so it is comparable with the
+    cosine similarities of the (L2-normalised) ``embeddings``.  With λ = 1
+    this is plain relevance order under the caps.  Capped-out candidates are
+    dropped, or with ``backfill`` appended in relevance order to fill top_k.
+    """
+    n = len(relevance)
+    if n == 0 or top_k <= 0:
+        return []
+
+    rel = np.asarray(relevance, dtype=np.float64)
+    span = rel.max() - rel.min()
+    rel = (rel - rel.min()) / span if span > 0 else np.ones(n)
+
+    emb = np.asarray(embeddings, dtype=np.float32)
+    sim = emb @ emb.T if emb.size else np.zeros((n, n), dtype=np.float32)
+
+    available = np.ones(n, dtype=bool)
+    max_sim = np.zeros(n, dtype=np.float64)
+    cat_codes = _codes(categories) if categories is not None and max_per_category else None
+    seller_codes = _codes(sellers) if sellers is not None and max_per_seller else None
+    cat_counts = np.zeros(cat_codes.max() + 1, dtype=np.int32) if cat_codes is not None else None
+    seller_counts = np.zeros(seller_codes.max() + 1, dtype=np.int32) if seller_codes is not None else None
+
+    picked: List[int] = []
+    while len(picked) < top_k and available.any():
+        score = lam * rel - (1.0 - lam) * max_sim
+        score[~available] = -np.inf
+        best = int(np.argmax(score))
+        picked.append(best)
+        available[best] = False
+        np.maximum(max_sim, sim[best], out=max_sim)
+
+        if cat_codes is not None:
+            cat_counts[cat_codes[best]] += 1
+            if cat_counts[cat_codes[best]] >= max_per_category:
+                available &= cat_codes != cat_codes[best]
+        if seller_codes is not None:
+            seller_counts[seller_codes[best]] += 1
+            if seller_counts[seller_codes[best]] >= max_per_seller:
+                available &= seller_codes != seller_codes[best]
+
+    if backfill and len(picked) < top_k:
+        chosen = set(picked)
+        rest = [int(i) for i in np.argsort(-rel, kind="stable") if int(i) not in chosen]
+        picked.extend(rest[:top_k - len(picked)])
+    return picked
+
+
+def _codes(values: Sequence) -> np.ndarray:
+    codes = {}
+    return np.array([codes.setdefault(v, len(codes)) for v in values], dtype=np.int32)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict
 
 
 class UserBase(BaseModel):
@@ -94,6 +94,20 @@ class Listing(ListingBase):
     images: List[ProductImage] = []
     accept_exchange: bool = True
     exchange_preferences: Optional[str] = None
+    duplicate_of: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ListingCard(BaseModel):
+    """Grid-card projection of a listing (``view=card``)."""
+    id: int
+    title: str
+    price: float
+    city: Optional[str] = None
+    category: Optional[str] = None
+    primary_image_url: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -106,15 +120,60 @@ class SearchResult(BaseModel):
     bm25: Optional[float] = None
     prefix: Optional[float] = None
     match_type: Optional[str] = None
+    snippet: Optional[str] = None   # highlighted excerpt (FTS5 sparse backend only)
 
     class Config:
         from_attributes = True
 
 
+class PriceBucket(BaseModel):
+    min: float
+    max: Optional[float] = None  # None = open-ended top bucket
+    count: int
+
+
+class SearchFacets(BaseModel):
+    categories: Dict[str, int] = {}
+    cities: Dict[str, int] = {}
+    price_histogram: List[PriceBucket] = []
+    accept_exchange: int = 0
+
+
 class SearchResponse(BaseModel):
     query: str
     total: int
     results: List["SearchResult"]
+    facets: Optional[SearchFacets] = None
+
+
+class SavedSearchCreate(BaseModel):
+    query: str
+    category: Optional[str] = None
+    city: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+
+class SavedSearch(SavedSearchCreate):
+    id: int
+    user_id: int
+    terms: List[str] = []
+    created_at: Any
+
+    class Config:
+        from_attributes = True
+
+
+class SavedSearchMatch(BaseModel):
+    id: int
+    saved_search_id: int
+    listing_id: int
+    is_seen: bool
+    created_at: Any
+    listing: Listing
+
+    class Config:
+        from_attributes = True
 
 
 class Token(BaseModel):
@@ -13,27 +13,49 @@ Hybrid score formula (Reciprocal Rank Fusion):
     final_score = alpha * dense_score + (1 - alpha) * bm25_score + field_boost
     then re-ranked by cross-encoder for top-10 results
 
+Sharding
+--------
+The index is partitioned by city (``SEARCH_SHARD_BY=city``, the default) or by
+city + category (``SEARCH_SHARD_BY=city_category``).  Each shard owns its own
+embedding matrices, BM25 index and vocabulary and is rebuilt independently, so
+a write in Pune never invalidates the Mumbai shard.  Queries with a ``city``
+(and ``category``) filter only touch the matching shards; unfiltered queries
+fan out over all shards on a thread pool and the per-shard candidates are
+merged into one global top-k.
+
+Sparse backend
+--------------
+``SEARCH_SPARSE_BACKEND=bm25`` (the default) keeps a rank_bm25 index per
+shard in memory.  ``SEARCH_SPARSE_BACKEND=fts5`` asks the SQLite FTS5 table
+maintained by triggers instead (fts.py): nothing to rebuild per shard, one
+index shared by every worker, plus prefix matching and highlighted snippets.
+
 Usage
 -----
 from .search_engine import semantic_search, invalidate_listing
-results = semantic_search("used mob", db=db, top_k=20)
+results = semantic_search("used mob", db=db, top_k=20, city="Pune")
 # returns [{"listing": <Listing>, "score": 0.87, "match_type": "hybrid"}, ...]
 """
 
 from __future__ import annotations
 
 import logging
+import os
 import re
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 
 import numpy as np
 from rank_bm25 import BM25Okapi
 from rapidfuzz import process as rf_process, fuzz
-from sqlalchemy.orm import Session
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 from . import models
+from .query_log import normalize_query, record_query
 
 logger = logging.getLogger(__name__)
 
@@ -95,15 +117,184 @@ _cache_lock = threading.Lock()
 # Dense cache
 _embedding_cache: Dict[int, "np.ndarray"] = {}   # listing_id → L2-norm'd vector
 
-# BM25 state  (rebuilt whenever listings change)
-_bm25_listings:   List[models.Listing] = []
-_bm25_index:      "BM25Okapi" | None = None
-_bm25_dirty:      bool = True   # flag: needs rebuild
-
 # Vocabulary for typo correction
 _vocab_words: List[str] = []    # flat list of unique words across all titles
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Shards  (one per city, or per city + category)
+# ─────────────────────────────────────────────────────────────────────────────
+SHARD_BY = os.getenv("SEARCH_SHARD_BY", "city").strip().lower()   # "city" | "city_category"
+SPARSE_BACKEND = os.getenv("SEARCH_SPARSE_BACKEND", "bm25").strip().lower()   # "bm25" | "fts5"
+_SHARD_WORKERS = int(os.getenv("SEARCH_SHARD_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+ShardKey = Tuple[str, ...]
+
+
+def _shard_key(city: Optional[str], category: Optional[str]) -> ShardKey:
+    """Map a listing's (city, category) onto the shard that owns it."""
+    if SHARD_BY == "city_category":
+        return (city or "", category or "")
+    return (city or "",)
+
+
+class _ShardSnapshot:
+    """
+    Immutable, fully built index of one shard.  Rebuilds swap in a new
+    snapshot, so a query that grabbed the old one keeps consistent arrays.
+    """
+
+    __slots__ = ("listings", "ids", "emb_matrix", "title_matrix", "desc_matrix", "bm25", "titles",
+                 "category_codes", "city_codes", "prices", "accept_exchange", "cluster_ids", "vocab")
+
+    def __init__(self, listings, ids, emb_matrix, title_matrix, desc_matrix, bm25, titles,
+                 category_codes, city_codes, prices, accept_exchange, cluster_ids, vocab):
+        self.listings: List[models.Listing] = listings
+        self.ids = ids                           # int64 listing ids, row-aligned with the matrices
+        self.emb_matrix = emb_matrix
+        self.title_matrix = title_matrix
+        self.desc_matrix = desc_matrix
+        self.bm25: "BM25Okapi" | None = bm25
+        self.titles: List[str] = titles          # lower-cased title text for n-gram boost
+        # Columnar attributes for filtering and facet counts
+        self.category_codes = category_codes     # int32, see _category_dict
+        self.city_codes = city_codes             # int32, see _city_dict
+        self.prices = prices                     # float64
+        self.accept_exchange = accept_exchange   # bool
+        self.cluster_ids = cluster_ids           # int64 duplicate_of or own id (dedupe.py)
+        self.vocab: frozenset = vocab
+
+
+_EMPTY_SNAPSHOT = _ShardSnapshot(
+    [], np.zeros(0, dtype=np.int64), *(np.zeros((0, 384), dtype=np.float32),) * 3, None, [],
+    np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+    np.zeros(0, dtype=np.float64), np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64), frozenset(),
+)
+
+
+class _ValueDictionary:
+    """Append-only value ↔ int code mapping for dictionary-encoded columns."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, values: List[str]) -> np.ndarray:
+        with self._lock:
+            out = np.empty(len(values), dtype=np.int32)
+            for i, value in enumerate(values):
+                code = self.codes.get(value)
+                if code is None:
+                    code = self.codes[value] = len(self.values)
+                    self.values.append(value)
+                out[i] = code
+            return out
+
+    def matching(self, value: str) -> np.ndarray:
+        """Codes whose value equals ``value`` case-insensitively."""
+        wanted = value.strip().casefold()
+        with self._lock:
+            return np.array([c for v, c in self.codes.items() if v.casefold() == wanted], dtype=np.int32)
+
+
+_category_dict = _ValueDictionary()
+_city_dict = _ValueDictionary()
+
+
+class _Shard:
+    """One partition of the active-listing index."""
+
+    __slots__ = ("key", "snapshot", "dirty", "generation")
+
+    def __init__(self, key: ShardKey):
+        self.key = key
+        self.snapshot = _EMPTY_SNAPSHOT
+        self.dirty = True
+        self.generation = 0     # bumped on every invalidation, so a rebuild can tell it raced one
+
+
+_shards: Dict[ShardKey, _Shard] = {}
+_listing_shard: Dict[int, ShardKey] = {}   # listing_id → shard currently holding it
+_shard_keys_dirty: bool = True             # flag: shard set must be re-discovered from the DB
+
+# Concatenation of every shard, for callers that need the whole catalogue
+_merged_view: Tuple[List[models.Listing], np.ndarray, np.ndarray] | None = None
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _model_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, _SHARD_WORKERS),
+                    thread_name_prefix="search-shard",
+                )
+    return _executor
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Single-flight coalescing
+# ─────────────────────────────────────────────────────────────────────────────
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class _SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one execution: the first
+    caller runs ``fn``, everyone arriving while it is in flight waits for and
+    shares its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[tuple, _Call] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: tuple, fn) -> Tuple[object, bool]:
+        """Returns ``(result, shared)`` where ``shared`` is True for waiters."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+
+_search_flight  = _SingleFlight()   # identical concurrent semantic_search calls
+_rebuild_flight = _SingleFlight()   # shard discovery / shard rebuilds
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Text utilities
 # ─────────────────────────────────────────────────────────────────────────────
@@ -245,78 +436,315 @@ _desc_emb_cache:  Dict[int, "np.ndarray"] = {}
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Cache refresh (BM25 + Dense)
+# Cache refresh (BM25 + Dense), one shard at a time
 # ─────────────────────────────────────────────────────────────────────────────
-# --- PERFORMANCE UPGRADE: SMART REFRESH & CACHING ---
-_cached_emb_matrix: np.ndarray | None = None
+def _filter_by_shard(query, key: ShardKey):
+    """Restrict a Listing query to the rows owned by shard ``key``."""
+    columns = [models.Listing.city]
+    if SHARD_BY == "city_category":
+        columns.append(models.Listing.category)
+    for column, value in zip(columns, key):
+        if value:
+            query = query.filter(column == value)
+        else:
+            query = query.filter(or_(column.is_(None), column == ""))
+    return query
 
-def _refresh_cache(db: Session) -> Tuple[List[models.Listing], np.ndarray]:
-    global _bm25_listings, _bm25_index, _bm25_dirty, _vocab_words, _cached_emb_matrix
+
+def _discover_shards(db: Session) -> None:
+    """Create / drop shard entries to match the (city[, category]) values in the DB."""
+    global _shard_keys_dirty, _merged_view
+
+    columns = [models.Listing.city]
+    if SHARD_BY == "city_category":
+        columns.append(models.Listing.category)
+    rows = (
+        db.query(*columns)
+        .filter(models.Listing.is_active == True)  # noqa: E712
+        .distinct()
+        .all()
+    )
+    live_keys = {_shard_key(row[0], row[1] if len(row) > 1 else None) for row in rows}
 
     with _cache_lock:
-        # If not dirty and we have a cached matrix, return early
-        if not _bm25_dirty and _bm25_index is not None and _cached_emb_matrix is not None:
-            return _bm25_listings, _cached_emb_matrix
-
-        print("DEBUG: Cache is dirty, querying listings...", flush=True)
-        listings: List[models.Listing] = (
-            db.query(models.Listing)
-            .filter(models.Listing.is_active == True)  # noqa: E712
-            .all()
-        )
-        print(f"DEBUG: Query done. Found {len(listings)}.", flush=True)
-
-        live_ids = {l.id for l in listings}
-
-        # Evict stale
-        for cache in (_embedding_cache, _title_emb_cache, _desc_emb_cache):
-            for lid in list(cache):
-                if lid not in live_ids:
-                    del cache[lid]
-        
-        # Encode new listings
-        new_listings = [l for l in listings if l.id not in _embedding_cache]
-        if new_listings:
-            print(f"DEBUG: Encoding {len(new_listings)} new listings...", flush=True)
-            # Full-text embeddings (for backward-compat fallback)
-            full_texts   = [_full_text(l) for l in new_listings]
-            title_texts  = [_title_text(l) for l in new_listings]
-            desc_texts   = [_desc_text(l)  for l in new_listings]
-
-            full_embs  = _embed_texts(full_texts)
-            title_embs = _embed_texts(title_texts)
-            desc_embs  = _embed_texts(desc_texts)
-
-            for listing, fe, te, de in zip(new_listings, full_embs, title_embs, desc_embs):
-                _embedding_cache[listing.id] = fe
-                _title_emb_cache[listing.id] = te
-                _desc_emb_cache[listing.id]  = de
-
-        # Rebuild BM25 or Vocabulary if needed
+        for key in list(_shards):
+            if key not in live_keys:
+                _drop_shard(key)
+        for key in live_keys:
+            if key not in _shards:
+                _shards[key] = _Shard(key)
+
+        _shard_keys_dirty = False
+        _merged_view = None
+
+
+def _drop_shard(key: ShardKey) -> None:
+    shard = _shards.pop(key, None)
+    if shard is None:
+        return
+    # Cached listing objects may be expired and detached, so go by id
+    for lid in shard.snapshot.ids.tolist():
+        if _listing_shard.get(lid) == key:
+            del _listing_shard[lid]
+            for cache in (_embedding_cache, _title_emb_cache, _desc_emb_cache):
+                cache.pop(lid, None)
+
+
+def _build_shard(db: Session, shard: _Shard) -> None:
+    """Re-query and re-index the listings of a single shard, then swap in the new snapshot."""
+    generation = shard.generation
+    print(f"DEBUG: Shard {shard.key} is dirty, querying listings...", flush=True)
+    # Load through a private session with owner and images eager-loaded: the
+    # snapshot outlives the caller's session, and objects left in it would be
+    # expired by its next commit and fail to load once it is closed.
+    with Session(bind=db.get_bind()) as own:
+        listings: List[models.Listing] = _filter_by_shard(
+            own.query(models.Listing)
+            .options(joinedload(models.Listing.owner), selectinload(models.Listing.images))
+            .filter(models.Listing.is_active == True),  # noqa: E712
+            shard.key,
+        ).all()
+    print(f"DEBUG: Query done. Found {len(listings)}.", flush=True)
+
+    # Work from a private copy of the cached vectors: invalidate_listing() may
+    # pop entries from the shared caches while this rebuild is running.
+    vectors = {
+        l.id: (_embedding_cache.get(l.id), _title_emb_cache.get(l.id), _desc_emb_cache.get(l.id))
+        for l in listings
+    }
+
+    # Encode new listings
+    new_listings = [l for l in listings if any(v is None for v in vectors[l.id])]
+    if new_listings:
+        print(f"DEBUG: Encoding {len(new_listings)} new listings...", flush=True)
+        # Full-text embeddings (for backward-compat fallback)
+        full_texts   = [_full_text(l) for l in new_listings]
+        title_texts  = [_title_text(l) for l in new_listings]
+        desc_texts   = [_desc_text(l)  for l in new_listings]
+
+        full_embs  = _embed_texts(full_texts)
+        title_embs = _embed_texts(title_texts)
+        desc_embs  = _embed_texts(desc_texts)
+
+        for listing, fe, te, de in zip(new_listings, full_embs, title_embs, desc_embs):
+            vectors[listing.id] = (fe, te, de)
+
+    # Rebuild BM25 for this shard only (the FTS5 backend keeps its index in SQLite)
+    bm25 = None
+    if SPARSE_BACKEND != "fts5":
         tokenized = [_tokenize(_full_text(l)) for l in listings]
-        _bm25_index    = BM25Okapi(tokenized) if tokenized else None
-        _bm25_listings = listings
+        bm25 = BM25Okapi(tokenized) if tokenized else None
+
+    # Unique title words, merged into the global typo-correction vocabulary
+    title_words: set[str] = set()
+    for l in listings:
+        title_words.update(_tokenize(_title_text(l)))
+
+    if listings:
+        emb_matrix   = np.stack([vectors[l.id][0] for l in listings], axis=0)
+        title_matrix = np.stack([vectors[l.id][1] for l in listings], axis=0)
+        desc_matrix  = np.stack([vectors[l.id][2] for l in listings], axis=0)
+    else:
+        dim = 384
+        if _bi_encoder and _bi_encoder != "DISABLED":
+            dim = _bi_encoder.get_sentence_embedding_dimension()
+        emb_matrix = title_matrix = desc_matrix = np.zeros((0, dim), dtype=np.float32)
+
+    snapshot = _ShardSnapshot(
+        listings,
+        np.array([l.id for l in listings], dtype=np.int64),
+        emb_matrix,
+        title_matrix,
+        desc_matrix,
+        bm25,
+        [_title_text(l).lower() for l in listings],
+        _category_dict.encode([l.category or "" for l in listings]),
+        _city_dict.encode([l.city or "" for l in listings]),
+        np.array([l.price or 0.0 for l in listings], dtype=np.float64),
+        np.array([bool(l.accept_exchange) for l in listings], dtype=bool),
+        np.array([l.duplicate_of or l.id for l in listings], dtype=np.int64),
+        frozenset(title_words),
+    )
 
-        # Rebuild vocabulary for typo correction (unique words in all titles)
-        all_title_words: set[str] = set()
+    with _cache_lock:
+        live_ids = set(vectors)
+        # Evict listings that left this shard (deleted, deactivated or moved city)
+        for old_id in shard.snapshot.ids.tolist():
+            if old_id not in live_ids and _listing_shard.get(old_id) == shard.key:
+                del _listing_shard[old_id]
+                for cache in (_embedding_cache, _title_emb_cache, _desc_emb_cache):
+                    cache.pop(old_id, None)
         for l in listings:
-            all_title_words.update(_tokenize(_title_text(l)))
-        _vocab_words = sorted(all_title_words)
+            _listing_shard[l.id] = shard.key
+            fe, te, de = vectors[l.id]
+            _embedding_cache[l.id] = fe
+            _title_emb_cache[l.id] = te
+            _desc_emb_cache[l.id]  = de
+
+        shard.snapshot = snapshot
+        # An invalidation that landed mid-build keeps the shard dirty
+        shard.dirty = shard.generation != generation
+
+
+def _ensure_discovered(db: Session) -> None:
+    """Re-discover the shard set (single-flight) when it is stale or was never loaded."""
+    if _shard_keys_dirty:
+        _rebuild_flight.do(("discover",), lambda: _discover_shards(db) if _shard_keys_dirty else None)
+
+
+def _refresh_shards(db: Session, keys: Optional[List[ShardKey]] = None) -> List[_ShardSnapshot]:
+    """
+    Bring the requested shards (all shards when ``keys`` is None) up to date
+    and return their non-empty snapshots.
+
+    Only dirty shards are rebuilt, each through single-flight: when several
+    requests find the same shard dirty, one rebuilds it and the others wait
+    for that rebuild instead of queueing up to repeat it.
+    """
+    global _vocab_words, _merged_view
+
+    _ensure_discovered(db)
 
-        # Build / Rebuild the embedding matrix
+    with _cache_lock:
+        targets = list(_shards.values()) if keys is None else [_shards[k] for k in keys if k in _shards]
+        dirty = [shard for shard in targets if shard.dirty]
+
+    for shard in dirty:
+        _rebuild_flight.do(("shard",) + shard.key, lambda shard=shard: _build_shard(db, shard))
+
+    if dirty:
+        with _cache_lock:
+            for shard in dirty:
+                if not shard.snapshot.listings and not shard.dirty and _shards.get(shard.key) is shard:
+                    del _shards[shard.key]
+            all_words: set[str] = set()
+            for shard in _shards.values():
+                all_words |= shard.snapshot.vocab
+            _vocab_words = sorted(all_words)
+            _merged_view = None
+
+    return [shard.snapshot for shard in targets if shard.snapshot.listings]
+
+
+def _merged(db: Session) -> Tuple[List[models.Listing], np.ndarray, np.ndarray]:
+    """Whole catalogue (all shards concatenated): listings, ids, embeddings."""
+    global _merged_view
+
+    snapshots = _refresh_shards(db)
+    with _cache_lock:
+        if _merged_view is None:
+            listings = [l for snap in snapshots for l in snap.listings]
+            if snapshots:
+                ids = np.concatenate([snap.ids for snap in snapshots])
+                emb_matrix = np.concatenate([snap.emb_matrix for snap in snapshots], axis=0)
+            else:
+                ids = np.zeros(0, dtype=np.int64)
+                emb_matrix = np.zeros((0, 384), dtype=np.float32)
+            _merged_view = (listings, ids, emb_matrix)
+        return _merged_view
+
+
+def _refresh_cache(db: Session) -> Tuple[List[models.Listing], np.ndarray]:
+    """Whole-catalogue view (all shards concatenated) for recommendation callers."""
+    listings, _, emb_matrix = _merged(db)
+    return listings, emb_matrix
+
+
+def catalogue_matrix(db: Session) -> Tuple[np.ndarray, np.ndarray]:
+    """(listing ids, embedding matrix) for batch jobs that do not need ORM objects."""
+    _, ids, emb_matrix = _merged(db)
+    return ids, emb_matrix
+
+
+def listing_embeddings(db: Session, listing_ids: List[int]) -> Dict[int, np.ndarray]:
+    """
+    Full-text embeddings for ``listing_ids``: served from the index caches,
+    encoded on the fly for listings that are not indexed (yet).
+    """
+    with _cache_lock:
+        found = {lid: _embedding_cache[lid] for lid in listing_ids if lid in _embedding_cache}
+    missing = [lid for lid in set(listing_ids) if lid not in found]
+    if missing:
+        listings = db.query(models.Listing).filter(models.Listing.id.in_(missing)).all()
         if listings:
-            sample_emb = next(iter(_embedding_cache.values()))
-            emb_matrix = np.stack([_embedding_cache[l.id] for l in listings], axis=0)
-        else:
-            dim = 384
-            if _bi_encoder and _bi_encoder != "DISABLED":
-                dim = _bi_encoder.get_sentence_embedding_dimension()
-            emb_matrix = np.zeros((0, dim), dtype=np.float32)
+            embs = _embed_texts([_full_text(l) for l in listings])
+            found.update({l.id: e for l, e in zip(listings, embs)})
+    return found
+
+
+def _target_shard_keys(db: Session, city: Optional[str], category: Optional[str]) -> Optional[List[ShardKey]]:
+    """
+    Shard keys a filtered query has to visit (None → fan out over everything).
+    The shard set is discovered first, so a cold process or a city that
+    appeared since the last discovery is not filtered against stale keys.
+    """
+    if city is None and (category is None or SHARD_BY != "city_category"):
+        return None
+    _ensure_discovered(db)
+    with _cache_lock:
+        keys = list(_shards)
+    if city is not None:
+        keys = [k for k in keys if k[0].casefold() == city.strip().casefold()]
+    if category is not None and SHARD_BY == "city_category":
+        keys = [k for k in keys if k[1].casefold() == category.strip().casefold()]
+    return keys
+
+
+def _needs_rebuild(keys: Optional[List[ShardKey]]) -> bool:
+    """True when serving ``keys`` would trigger a shard (re)build."""
+    with _cache_lock:
+        if _shard_keys_dirty:
+            return True
+        targets = _shards.values() if keys is None else [_shards[k] for k in keys if k in _shards]
+        return any(s.dirty for s in targets)
 
-        _cached_emb_matrix = emb_matrix
-        _bm25_dirty  = False
 
-    return listings, _cached_emb_matrix
+def _score_shard(
+    shard: _ShardSnapshot,
+    query_emb: np.ndarray,
+    query_tokens: List[str],
+    fts_scores: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Dense, raw BM25 and n-gram scores for every listing of one shard.
+    ``fts_scores`` (sorted ids, scores) replaces the shard's own BM25 index
+    when the FTS5 backend is in use.
+    """
+    # Field-weighted dense score: title counts 3×
+    dense = (3.0 * (shard.title_matrix @ query_emb) + (shard.desc_matrix @ query_emb)) / 4.0
+    dense = dense.astype(np.float32)
+
+    bm25 = np.zeros(len(shard.listings), dtype=np.float32)
+    if fts_scores is not None:
+        hit_ids, hit_scores = fts_scores
+        if len(hit_ids):
+            pos = np.minimum(np.searchsorted(hit_ids, shard.ids), len(hit_ids) - 1)
+            found = hit_ids[pos] == shard.ids
+            bm25[found] = hit_scores[pos[found]]
+    elif shard.bm25 is not None and query_tokens:
+        bm25 = np.asarray(shard.bm25.get_scores(query_tokens), dtype=np.float32)
+
+    # Character n-gram boost, same rule as _ngram_score but batched per shard
+    ngram = np.zeros(len(shard.listings), dtype=np.float32)
+    if query_tokens and shard.titles:
+        sims = rf_process.cdist(query_tokens, shard.titles, scorer=fuzz.partial_ratio, dtype=np.float32) / 100.0
+        sims[sims <= 0.7] = 0.0
+        ngram = sims.max(axis=0) * 0.5
+
+    return dense, bm25, ngram
+
+
+def _fts_scores(db: Session, query_tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """FTS5 bm25 scores of the matching active listings as (sorted ids, scores)."""
+    from .fts import sparse_scores
+
+    hits = sparse_scores(db, query_tokens) if query_tokens else {}
+    if not hits:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    ids = np.fromiter(hits.keys(), dtype=np.int64, count=len(hits))
+    scores = np.fromiter(hits.values(), dtype=np.float32, count=len(hits))
+    order = np.argsort(ids)
+    return ids[order], scores[order]
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -392,6 +820,106 @@ def invalidate_query_cache() -> None:
         _cached_query_embedding.cache_clear()
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Facets
+# ─────────────────────────────────────────────────────────────────────────────
+PRICE_BUCKET_EDGES = [0, 5000, 10000, 25000, 50000, 100000]   # ₹, last bucket is open-ended
+
+
+def _facet_counts(snapshots: List[_ShardSnapshot], by_snapshot: Dict[int, np.ndarray]) -> dict:
+    """
+    Category / city counts, price histogram and accept_exchange count for
+    the listings at ``by_snapshot`` (snapshot index → row indices), computed
+    with np.bincount over the dictionary-encoded columns of the snapshots.
+    """
+    cat_parts, city_parts, price_parts, exch_parts = [], [], [], []
+    for si, rows in by_snapshot.items():
+        snap, idx = snapshots[si], np.asarray(rows, dtype=np.int64)
+        cat_parts.append(snap.category_codes[idx])
+        city_parts.append(snap.city_codes[idx])
+        price_parts.append(snap.prices[idx])
+        exch_parts.append(snap.accept_exchange[idx])
+
+    cats   = np.concatenate(cat_parts) if cat_parts else np.zeros(0, dtype=np.int32)
+    cities = np.concatenate(city_parts) if city_parts else np.zeros(0, dtype=np.int32)
+    prices = np.concatenate(price_parts) if price_parts else np.zeros(0, dtype=np.float64)
+    exch   = np.concatenate(exch_parts) if exch_parts else np.zeros(0, dtype=bool)
+
+    def _labelled(codes: np.ndarray, dictionary: _ValueDictionary) -> Dict[str, int]:
+        counts = np.bincount(codes) if len(codes) else np.zeros(0, dtype=np.int64)
+        out: Dict[str, int] = {}
+        for code in np.flatnonzero(counts):
+            label = dictionary.values[code] or "Unknown"
+            out[label] = out.get(label, 0) + int(counts[code])
+        return dict(sorted(out.items(), key=lambda kv: kv[1], reverse=True))
+
+    buckets = np.digitize(prices, PRICE_BUCKET_EDGES[1:])
+    bucket_counts = np.bincount(buckets, minlength=len(PRICE_BUCKET_EDGES))
+    histogram = [
+        {
+            "min":   PRICE_BUCKET_EDGES[i],
+            "max":   PRICE_BUCKET_EDGES[i + 1] if i + 1 < len(PRICE_BUCKET_EDGES) else None,
+            "count": int(bucket_counts[i]),
+        }
+        for i in range(len(PRICE_BUCKET_EDGES))
+    ]
+
+    return {
+        "categories":      _labelled(cats, _category_dict),
+        "cities":          _labelled(cities, _city_dict),
+        "price_histogram": histogram,
+        "accept_exchange": int(exch.sum()),
+    }
+
+
+def _facet_rows(
+    snapshots: List[_ShardSnapshot],
+    passing: List[np.ndarray],
+    scores: List[np.ndarray],
+    head: List[Tuple[int, int]],
+    kept: List[Tuple[int, int]],
+    collapse_duplicates: bool,
+) -> Dict[int, np.ndarray]:
+    """
+    Rows the facets count: every row that passed the threshold in each shard
+    (``passing``), where rows of the ranked candidate head (``head``) count
+    only if they made it into the results (``kept``).  With
+    ``collapse_duplicates`` the rows outside the head count once per
+    near-duplicate cluster not already among the results.
+    """
+    head_rows: Dict[int, List[int]] = {}
+    for si, row in head:
+        head_rows.setdefault(si, []).append(row)
+
+    si_parts, row_parts, cluster_parts, score_parts = [], [], [], []
+    for si, rows in enumerate(passing):
+        if si in head_rows and len(rows):
+            rows = rows[~np.isin(rows, head_rows[si])]
+        si_parts.append(np.full(len(rows), si, dtype=np.int64))
+        row_parts.append(rows)
+        cluster_parts.append(snapshots[si].cluster_ids[rows])
+        score_parts.append(scores[si][rows])
+    empty = np.zeros(0, dtype=np.int64)
+    tail_si = np.concatenate(si_parts) if si_parts else empty
+    tail_rows = np.concatenate(row_parts) if row_parts else empty
+
+    if collapse_duplicates and len(tail_rows):
+        clusters = np.concatenate(cluster_parts)
+        order = np.argsort(-np.concatenate(score_parts), kind="stable")
+        _, first = np.unique(clusters[order], return_index=True)   # best-scoring member per cluster
+        keep = order[first]
+        seen = [snapshots[si].cluster_ids[r] for si, r in kept]
+        keep = keep[~np.isin(clusters[keep], seen)]
+        tail_si, tail_rows = tail_si[keep], tail_rows[keep]
+
+    by_snapshot: Dict[int, List[np.ndarray]] = {}
+    for si, row in kept:
+        by_snapshot.setdefault(si, []).append(np.array([row], dtype=np.int64))
+    for si in np.unique(tail_si):
+        by_snapshot.setdefault(int(si), []).append(tail_rows[tail_si == si])
+    return {si: np.concatenate(parts) for si, parts in by_snapshot.items()}
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Public API
 # ─────────────────────────────────────────────────────────────────────────────
@@ -402,15 +930,106 @@ def semantic_search(
     min_score: float = 0.35,
     use_cross_encoder: bool = True,
     dense_weight: float = 0.50,
-) -> List[dict]:
+    city: Optional[str] = None,
+    category: Optional[str] = None,
+    source: str = "internal",
+    facets: bool = False,
+    collapse_duplicates: bool = False,
+    diversify: bool = False,
+):
     """
     Hybrid semantic search over active listings.
+
+    ``city`` / ``category`` restrict the search to the matching shards (and,
+    when the index is sharded by city only, to the matching category rows).
+    ``source`` tags the call in the query log (``api``, ``price_estimate``, ...).
+
+    With ``facets=True`` the return value is ``(results, facets)`` where
+    ``facets`` aggregates every listing that clears the threshold (not just
+    the ranked candidates, and before the ``top_k`` cut) from columns held in
+    the index, without another DB round trip.
+
+    ``collapse_duplicates`` keeps only the best-scoring listing of each
+    near-duplicate cluster (see dedupe.py); ``diversify`` re-ranks the head of
+    the list with MMR and a per-seller cap (see reranking.py).
     """
+    started = time.perf_counter()
+    cache_hit = not _shard_keys_dirty and not _needs_rebuild(_target_shard_keys(db, city, category))
+
+    # Identical concurrent searches share one computation
+    flight_key = (
+        normalize_query(query), top_k, min_score, use_cross_encoder, dense_weight,
+        (city or "").strip().casefold(), (category or "").strip().casefold(), facets,
+        collapse_duplicates, diversify,
+    )
+    (results, facet_counts), coalesced = _search_flight.do(
+        flight_key,
+        lambda: _run_search(
+            query, db, top_k, min_score, use_cross_encoder, dense_weight, city, category,
+            facets, collapse_duplicates, diversify,
+        ),
+    )
+    if coalesced:
+        results = [dict(r) for r in results]
+
+    record_query(
+        query,
+        {
+            "top_k": top_k,
+            "min_score": min_score,
+            "use_cross_encoder": use_cross_encoder,
+            "dense_weight": dense_weight,
+            "city": city,
+            "category": category,
+            "collapse_duplicates": collapse_duplicates,
+            "diversify": diversify,
+        },
+        result_count=len(results),
+        latency_ms=(time.perf_counter() - started) * 1000.0,
+        cache_hit=cache_hit,
+        source=source,
+        coalesced=coalesced,
+    )
+    if facets:
+        return results, facet_counts
+    return results
+
+
+def search_stats() -> Dict[str, int]:
+    """Counters for the index and the single-flight coalescing layer."""
+    with _cache_lock:
+        shard_count = len(_shards)
+        indexed = len(_listing_shard)
+    return {
+        "sparse_backend":     SPARSE_BACKEND,
+        "shards":             shard_count,
+        "indexed_listings":   indexed,
+        "searches_executed":  _search_flight.executed,
+        "searches_coalesced": _search_flight.coalesced,
+        "rebuilds_executed":  _rebuild_flight.executed,
+        "rebuilds_coalesced": _rebuild_flight.coalesced,
+    }
+
+
+def _run_search(
+    query: str,
+    db: Session,
+    top_k: int,
+    min_score: float,
+    use_cross_encoder: bool,
+    dense_weight: float,
+    city: Optional[str],
+    category: Optional[str],
+    want_facets: bool = False,
+    collapse_duplicates: bool = False,
+    diversify: bool = False,
+) -> Tuple[List[dict], Optional[dict]]:
     print(f"\n--- Search Engine Called with: '{query}' ---", flush=True)
+    no_results = ([], _facet_counts([], {}) if want_facets else None)
     try:
         raw_query = query.strip()
         if not raw_query:
-            return []
+            return no_results
 
         # ── 1. Normalize
         norm_query    = _normalize_query(raw_query)
@@ -420,61 +1039,81 @@ def semantic_search(
         threshold = max(min_score, _dynamic_threshold(norm_query))
         print(f"DEBUG: norm_query='{norm_query}', threshold={threshold:.2f}", flush=True)
 
-        # ── 3. Load/refresh embedding cache + BM25 index
+        # ── 3. Load/refresh the shards this query needs
         print("DEBUG: Refreshing cache...", flush=True)
-        listings, emb_matrix = _refresh_cache(db)
-        print(f"DEBUG: Cache refreshed. {len(listings)} listings.", flush=True)
-        if not listings:
+        shards = _refresh_shards(db, _target_shard_keys(db, city, category))   # snapshots
+        row_masks: List[Optional[np.ndarray]] = [None] * len(shards)
+        if category is not None and SHARD_BY != "city_category":
+            wanted = _category_dict.matching(category)
+            row_masks = [np.isin(s.category_codes, wanted) for s in shards]
+        total = sum(len(s.listings) for s in shards)
+        print(f"DEBUG: Cache refreshed. {total} listings in {len(shards)} shard(s).", flush=True)
+        if not total:
             print("DEBUG: No active listings.", flush=True)
-            return []
-        
-        # ── 4a. Dense scores
-        print("DEBUG: Calculating dense scores...", flush=True)
-        query_emb   = _cached_query_embedding(norm_query)
-        dense_scores = np.array(
-            [_field_weighted_dense(query_emb, l) for l in listings],
-            dtype=np.float32,
-        )
-        print("DEBUG: Dense scores calculated.", flush=True)
-
-
-
-
-        # ── 4b. BM25 scores
-        bm25_raw = np.zeros(len(listings), dtype=np.float32)
-        if _bm25_index is not None:
-            raw_bm25 = _bm25_index.get_scores(query_tokens)
-            bm25_max = raw_bm25.max()
-            if bm25_max > 0:
-                bm25_raw = (raw_bm25 / bm25_max).astype(np.float32)
-
-        # ── 4c. N-gram boost
-        ngram_boosts = np.array(
-            [_ngram_score(query_tokens, l) for l in listings],
-            dtype=np.float32,
-        )
-
-        # ── 5. Fusion
-        hybrid_scores = (dense_weight * dense_scores) + ((1 - dense_weight) * bm25_raw) + ngram_boosts
+            return no_results
+
+        # ── 4. Per-shard dense / BM25 / n-gram scores (fanned out on the pool)
+        print("DEBUG: Calculating shard scores...", flush=True)
+        query_emb = _cached_query_embedding(norm_query)
+        fts_scores = _fts_scores(db, query_tokens) if SPARSE_BACKEND == "fts5" else None
+        if len(shards) > 1 and _SHARD_WORKERS > 1:
+            shard_scores = list(_get_executor().map(
+                lambda s: _score_shard(s, query_emb, query_tokens, fts_scores), shards
+            ))
+        else:
+            shard_scores = [_score_shard(s, query_emb, query_tokens, fts_scores) for s in shards]
+        print("DEBUG: Shard scores calculated.", flush=True)
+
+        # BM25 is normalised against the best raw score across every shard
+        bm25_max = 0.0
+        for (_, bm25_scores, _), mask in zip(shard_scores, row_masks):
+            visible = bm25_scores if mask is None else bm25_scores[mask]
+            if len(visible):
+                bm25_max = max(bm25_max, float(visible.max()))
+
+        # ── 5. Fusion + per-shard top candidates
+        short_query = len(norm_query.replace(" ", "")) <= 4
+        candidate_count = min(100, total)
+        merged: List[Tuple[float, int, int]] = []   # (hybrid, shard index, row)
+        fused: List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+        passing: List[np.ndarray] = []              # per shard: rows that clear steps 6 and 8, for facets
+        for si, ((dense_scores, bm25_scores, ngram_boosts), mask) in enumerate(zip(shard_scores, row_masks)):
+            bm25_norm = bm25_scores / bm25_max if bm25_max > 0 else np.zeros_like(bm25_scores)
+            hybrid_scores = (dense_weight * dense_scores) + ((1 - dense_weight) * bm25_norm) + ngram_boosts
+            fused.append((hybrid_scores, dense_scores, bm25_norm, ngram_boosts))
+
+            if want_facets:
+                ok = (ngram_boosts >= 0.35) | (np.round(hybrid_scores, 4) >= threshold)
+                if short_query:
+                    ok &= (bm25_norm >= 0.05) | (ngram_boosts >= 0.10)
+                if mask is not None:
+                    ok &= mask
+                passing.append(np.flatnonzero(ok))
+
+            rows = np.flatnonzero(mask) if mask is not None else np.arange(len(hybrid_scores))
+            if len(rows) > candidate_count:
+                part = np.argpartition(hybrid_scores[rows], -candidate_count)[-candidate_count:]
+                rows = rows[part]
+            merged.extend((float(hybrid_scores[r]), si, int(r)) for r in rows)
 
         # ── 6. Filter & Rank candidates
-        candidate_count = min(100, len(listings))
-        top_indices = np.argsort(hybrid_scores)[::-1][:candidate_count]
+        merged.sort(key=lambda x: x[0], reverse=True)
 
         candidates = []
-        for idx in top_indices:
-            hs = float(hybrid_scores[idx])
+        positions: Dict[int, Tuple[int, int]] = {}   # id(candidate) → (snapshot, row), for facets
+        for hs, si, idx in merged[:candidate_count]:
+            _, dense_scores, bm25_norm, ngram_boosts = fused[si]
             ds = float(dense_scores[idx])
-            bs = float(bm25_raw[idx])
+            bs = float(bm25_norm[idx])
             nb = float(ngram_boosts[idx])
 
             # Filter junk results for short queries
-            if len(norm_query.replace(" ", "")) <= 4:
+            if short_query:
                 if bs < 0.05 and nb < 0.10:
                     continue
 
-            candidates.append({
-                "listing":    listings[idx],
+            candidate = {
+                "listing":    shards[si].listings[idx],
                 "score":      round(hs, 4),
                 "dense":      round(ds, 4),
                 "bm25":       round(bs, 4),
@@ -484,10 +1123,12 @@ def semantic_search(
                     "hybrid" if bs > 0.01   else
                     "semantic"
                 ),
-            })
+            }
+            positions[id(candidate)] = (si, idx)
+            candidates.append(candidate)
 
-        if not candidates:
-            return []
+        if not candidates and not want_facets:
+            return no_results
 
         # ── 7. Re-rank with Cross-Encoder (if applicable)
         if use_cross_encoder and candidates and len(norm_query.replace(" ", "")) >= 5:
@@ -508,10 +1149,55 @@ def semantic_search(
                 results.append(c)
 
         results.sort(key=lambda x: x["score"], reverse=True)
+
+        # ── 9. Collapse near-duplicate clusters (best-scoring member wins)
+        if collapse_duplicates:
+            seen_clusters = set()
+            collapsed = []
+            for r in results:
+                cluster = r["listing"].duplicate_of or r["listing"].id
+                if cluster not in seen_clusters:
+                    seen_clusters.add(cluster)
+                    collapsed.append(r)
+            results = collapsed
+
+        facet_counts = None
+        if want_facets:
+            facet_counts = _facet_counts(shards, _facet_rows(
+                shards, passing, [f[0] for f in fused],
+                [(si, idx) for _, si, idx in merged[:candidate_count]],
+                [positions[id(r)] for r in results],
+                collapse_duplicates,
+            ))
+            if not results:
+                return [], facet_counts
+
+        # ── 10. MMR diversity re-ranking over the head of the list
+        if diversify and len(results) > 1:
+            from .reranking import mmr_rerank, candidate_pool_size, MAX_PER_SELLER
+            pool = results[:candidate_pool_size(top_k)]
+            pool_pos = [positions[id(r)] for r in pool]
+            picked = mmr_rerank(
+                np.array([r["score"] for r in pool]),
+                np.stack([shards[si].emb_matrix[idx] for si, idx in pool_pos]),
+                top_k,
+                sellers=[r["listing"].owner_id for r in pool],
+                max_per_seller=MAX_PER_SELLER,
+                backfill=True,
+            )
+            results = [pool[i] for i in picked]
+
         results = results[:top_k]
 
+        # ── 11. Highlighted excerpts from the FTS5 index
+        if SPARSE_BACKEND == "fts5" and results and query_tokens:
+            from .fts import snippets
+            found = snippets(db, query_tokens, [r["listing"].id for r in results])
+            for r in results:
+                r["snippet"] = found.get(r["listing"].id)
+
         print(f"SUCCESS: Found {len(results)} results for '{raw_query}'", flush=True)
-        return results
+        return results, facet_counts
 
     except Exception as e:
         import traceback
@@ -519,15 +1205,35 @@ def semantic_search(
         print("CRITICAL ERROR IN SEARCH ENGINE:", flush=True)
         print(traceback.format_exc(), flush=True)
         print("!"*60 + "\n", flush=True)
-        return []
+        return no_results
 
 
-def invalidate_listing(listing_id: int) -> None:
-    """Call after create / update / delete so the stores are kept fresh."""
-    global _bm25_dirty
+def invalidate_listing(listing_id: int, listing: Optional[models.Listing] = None) -> None:
+    """
+    Call after create / update / delete so the stores are kept fresh.
+
+    Only the shard that held the listing and, when ``listing`` is given, the
+    shard it belongs to now are marked dirty.  Without either (an unknown id
+    and no listing) every shard is rebuilt on the next search.
+    """
+    global _shard_keys_dirty
     with _cache_lock:
         _embedding_cache.pop(listing_id, None)
         _title_emb_cache.pop(listing_id, None)
         _desc_emb_cache.pop(listing_id, None)
-        _bm25_dirty = True
+
+        keys = set()
+        if listing_id in _listing_shard:
+            keys.add(_listing_shard[listing_id])
+        if listing is not None:
+            keys.add(_shard_key(listing.city, listing.category))
+
+        if not keys:
+            _shard_keys_dirty = True
+            keys = set(_shards)
+        for key in keys:
+            if key not in _shards:
+                _shards[key] = _Shard(key)
+            _shards[key].dirty = True
+            _shards[key].generation += 1
     invalidate_query_cache()
@@ -0,0 +1,156 @@
+"""
+User Interest Vectors
+=====================
+Personalised recommendations score the catalogue against a per-user interest
+vector.  Instead of re-reading every ``UserActivity`` row on each home page
+load, the vector is persisted in ``user_interests`` and folded forward each
+time an activity is recorded:
+
+    decay  = 0.5 ** (Δt / half-life)
+    vector = vector · decay + weight · embedding(listing)
+    total  = total  · decay + weight
+
+``vector / total`` is the time-decayed weighted mean of the embeddings the
+user interacted with, so old interests fade out with INTEREST_HALF_LIFE_DAYS.
+Users without a row (activity recorded before this existed) are bootstrapped
+once from their activity history.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .activity_rollup import activity_events
+from .search_engine import listing_embeddings
+
+HALF_LIFE_DAYS = float(os.getenv("INTEREST_HALF_LIFE_DAYS", "30"))
+
+
+def _decay(since: Optional[datetime], now: datetime) -> float:
+    if since is None or HALF_LIFE_DAYS <= 0:
+        return 1.0
+    days = max((now - since).total_seconds(), 0.0) / 86400.0
+    return 0.5 ** (days / HALF_LIFE_DAYS)
+
+
+def _history_vector(db: Session, user_id: int, now: datetime) -> Optional[Tuple[np.ndarray, float]]:
+    """(vector, total weight) folded from the user's whole activity history."""
+    activities = [(l, w, at) for _, l, w, at in activity_events(db, user_id)]
+    if not activities:
+        return None
+    embs = listing_embeddings(db, [a[0] for a in activities])
+    if not embs:
+        return None
+    dim = len(next(iter(embs.values())))
+    vector = np.zeros(dim, dtype=np.float32)
+    total = 0.0
+    for listing_id, weight, created_at in activities:
+        emb = embs.get(listing_id)
+        if emb is None:
+            continue
+        w = (weight or 0.0) * _decay(created_at, now)
+        vector += emb * w
+        total += w
+    return vector, total
+
+
+def _bootstrap(db: Session, user_id: int, now: datetime) -> Optional[Tuple[np.ndarray, float]]:
+    """
+    Build the interest row from the user's activity history (first use only).
+    The insert is ON CONFLICT DO NOTHING: when a concurrent request
+    bootstrapped the same user first, its row stands and the session stays
+    usable.
+    """
+    built = _history_vector(db, user_id, now)
+    if built is None:
+        return None
+    vector, total = built
+    db.execute(
+        sqlite_insert(models.UserInterest)
+        .values(user_id=user_id, vector=vector.tobytes(), total_weight=total, updated_at=now)
+        .on_conflict_do_nothing(index_elements=[models.UserInterest.user_id])
+    )
+    return built
+
+
+def record_interest(db: Session, user_id: int, listing_id: int, weight: float) -> None:
+    """
+    Fold one activity into the user's interest vector.  Call it next to the
+    ``UserActivity`` insert, before the commit.  Must never fail the request:
+    errors are logged and the activity is still recorded.
+    """
+    record_interests(db, [(user_id, listing_id, weight, datetime.utcnow())])
+
+
+def record_interests(db: Session, activities: List[Tuple[int, int, float, datetime]]) -> None:
+    """
+    Batch form of ``record_interest`` for (user_id, listing_id, weight,
+    created_at) tuples whose ``UserActivity`` rows are already in the session.
+    """
+    by_user: Dict[int, List[Tuple[int, float, datetime]]] = {}
+    for user_id, listing_id, weight, created_at in activities:
+        by_user.setdefault(user_id, []).append((listing_id, weight or 0.0, created_at))
+
+    embs = None
+    for user_id, acts in by_user.items():
+        try:
+            row = db.get(models.UserInterest, user_id)
+            if row is None:
+                # Flush the pending activities so the bootstrap includes them
+                db.flush()
+                _bootstrap(db, user_id, datetime.utcnow())
+                continue
+            if embs is None:
+                embs = listing_embeddings(db, [a[1] for a in activities])
+            vector = np.frombuffer(row.vector, dtype=np.float32)
+            total = row.total_weight or 0.0
+            updated_at = row.updated_at
+            for listing_id, weight, created_at in sorted(acts, key=lambda a: a[2]):
+                emb = embs.get(listing_id)
+                if emb is None:
+                    continue
+                if vector.shape != emb.shape:
+                    # Encoder changed since the row was written: rebuild from history
+                    db.flush()
+                    now = datetime.utcnow()
+                    built = _history_vector(db, user_id, now)
+                    if built is None:
+                        db.delete(row)
+                    else:
+                        row.vector = built[0].tobytes()
+                        row.total_weight = built[1]
+                        row.updated_at = now
+                    break
+                decay = _decay(updated_at, created_at)
+                vector = vector * decay + emb * weight
+                total = total * decay + weight
+                updated_at = max(updated_at or created_at, created_at)
+            else:
+                row.vector = vector.astype(np.float32).tobytes()
+                row.total_weight = total
+                row.updated_at = updated_at
+        except Exception as e:
+            print(f"!!! Failed to update interest vector for user {user_id}: {e}", flush=True)
+
+
+def get_interest_vector(db: Session, user_id: int) -> Optional[Tuple[np.ndarray, float]]:
+    """(interest vector, decayed total weight) for ``user_id``, or None without history."""
+    row = db.query(models.UserInterest).filter(models.UserInterest.user_id == user_id).first()
+    if row is not None:
+        return np.frombuffer(row.vector, dtype=np.float32), float(row.total_weight or 0.0)
+
+    result = _bootstrap(db, user_id, datetime.utcnow())
+    if result is None:
+        return None
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()  # e.g. the database is locked; the next request bootstraps again
+    return result[0], float(result[1])
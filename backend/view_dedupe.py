@@ -0,0 +1,131 @@
+"""
+Recent-View Deduplication
+=========================
+Refreshing a listing page should not count as another view or add another
+"view" activity.  Before a view is recorded, the (viewer, listing) pair is
+checked against a time-windowed filter:
+
+    viewer   "u:<user_id>" for signed-in users, otherwise "a:<fingerprint>",
+             a hash of the client IP and User-Agent
+
+The client IP is the connection's peer address.  X-Forwarded-For is only
+honoured when the peer is one of TRUSTED_PROXIES (comma-separated IPs, e.g.
+the load balancer); otherwise any client could pick its own fingerprint.
+
+The filter is a rotating pair of Bloom filters.  Pairs are added to the
+current generation and looked up in both; when the current generation is
+older than half the window (or holds CAPACITY pairs) the previous one is
+discarded and the current one takes its place.  A repeat view is therefore
+suppressed for between WINDOW/2 and WINDOW seconds, with memory fixed at two
+bit arrays sized for CAPACITY pairs at FP_RATE false positives (~180 KB
+each with the defaults).  A false positive only means one view is not counted.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+WINDOW_S = float(os.getenv("VIEW_DEDUPE_WINDOW_S", "1800"))
+CAPACITY = int(os.getenv("VIEW_DEDUPE_CAPACITY", "100000"))
+FP_RATE = 0.001
+TRUSTED_PROXIES = frozenset(p.strip() for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip())
+
+
+class _BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float):
+        self.num_bits = max(64, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+        self.created = time.monotonic()
+
+    def _positions(self, key: str) -> np.ndarray:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return np.array([(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)], dtype=np.int64)
+
+    def contains(self, key: str) -> bool:
+        pos = self._positions(key)
+        return bool(np.all(self.bits[pos >> 3] & (1 << (pos & 7)).astype(np.uint8)))
+
+    def add(self, key: str) -> None:
+        pos = self._positions(key)
+        np.bitwise_or.at(self.bits, pos >> 3, (1 << (pos & 7)).astype(np.uint8))
+        self.count += 1
+
+
+class RecentViewFilter:
+    def __init__(self, window_s: float = WINDOW_S, capacity: int = CAPACITY, fp_rate: float = FP_RATE):
+        self._window = window_s
+        self._capacity = capacity
+        self._fp_rate = fp_rate
+        self._lock = threading.Lock()
+        self._current = _BloomFilter(capacity, fp_rate)
+        self._previous: Optional[_BloomFilter] = None
+        self._counters = {"checked": 0, "suppressed": 0, "rotations": 0}
+
+    def _rotate_locked(self) -> None:
+        if (time.monotonic() - self._current.created >= self._window / 2
+                or self._current.count >= self._capacity):
+            self._previous = self._current
+            self._current = _BloomFilter(self._capacity, self._fp_rate)
+            self._counters["rotations"] += 1
+            if self._previous and time.monotonic() - self._previous.created >= self._window:
+                self._previous = None    # idle for a whole window: nothing left to remember
+
+    def seen_recently(self, viewer: str, listing_id: int) -> bool:
+        """
+        True when ``viewer`` viewed ``listing_id`` within the window (the view
+        should not be recorded again); otherwise remembers the pair.
+        """
+        key = f"{viewer}|{listing_id}"
+        with self._lock:
+            self._rotate_locked()
+            self._counters["checked"] += 1
+            if self._current.contains(key) or (self._previous is not None and self._previous.contains(key)):
+                self._counters["suppressed"] += 1
+                return True
+            self._current.add(key)
+            return False
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                **self._counters,
+                "window_s": self._window,
+                "current_entries": self._current.count,
+                "memory_bytes": self._current.bits.nbytes + (self._previous.bits.nbytes if self._previous else 0),
+            }
+
+
+recent_views = RecentViewFilter()
+
+
+def viewer_key(user_id: Optional[int], client_ip: Optional[str], user_agent: Optional[str]) -> str:
+    """Dedupe identity: the user id when signed in, else an IP + User-Agent fingerprint."""
+    if user_id is not None:
+        return f"u:{user_id}"
+    raw = f"{client_ip or ''}|{user_agent or ''}"
+    return "a:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str]) -> Optional[str]:
+    """
+    The viewer's IP: ``peer`` unless it is a trusted proxy, in which case the
+    rightmost X-Forwarded-For hop that is not itself a trusted proxy.
+    """
+    if peer not in TRUSTED_PROXIES or not forwarded_for:
+        return peer
+    hops = [h.strip() for h in forwarded_for.split(",") if h.strip()]
+    for hop in reversed(hops):
+        if hop not in TRUSTED_PROXIES:
+            return hop
+    return hops[0] if hops else peer
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from backend import models, user_interest
+from backend.database import Base, SessionLocal, engine
+
+
+@pytest.fixture
+def db(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    # One-hot embedding per listing id, so a wrong lookup key is visible
+    monkeypatch.setattr(
+        user_interest, "listing_embeddings",
+        lambda db, ids: {i: np.eye(8, dtype=np.float32)[i] for i in set(ids) if 0 <= i < 8},
+    )
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_second_activity_moves_existing_interest_row(db):
+    user = models.User(id=7, email="u@example.com", hashed_password="x", name="U")
+    db.add(user)
+    db.add_all(models.Listing(id=i, title=f"L{i}", description="d", price=1.0, owner_id=7) for i in (1, 2))
+    db.commit()
+
+    now = datetime.utcnow()
+    db.add(models.UserInterest(user_id=7, vector=np.eye(8, dtype=np.float32)[1].tobytes(),
+                               total_weight=1.0, updated_at=now))
+    db.commit()
+
+    user_interest.record_interests(db, [(7, 2, 5.0, now + timedelta(seconds=1))])
+    db.commit()
+
+    row = db.get(models.UserInterest, 7)
+    vector = np.frombuffer(row.vector, dtype=np.float32)
+    assert row.total_weight == pytest.approx(6.0, rel=1e-3)
+    assert vector[2] == pytest.approx(5.0)   # listing 2's embedding was folded in
+    assert vector[7] == 0.0                  # not the user id's